@@ -1,4 +1,15 @@
+import eventlet
+
+# Parchear socket/threading/time ANTES de importar PyMySQL, Flask y Cloudinary:
+# así sus llamadas de red ceden el hub en lugar de congelar a todos los clientes
+eventlet.monkey_patch()
+
+import atexit
+import functools
+import hmac
 import os
+import threading
+import time
 from contextlib import contextmanager
 from datetime import datetime
 import uuid as uuid_pkg
@@ -10,7 +21,33 @@ from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_cors import CORS
 import pymysql
 from config import load_settings
-from services import upload_chat_image
+from services import (
+    BatchQueueFull,
+    BatchWriter,
+    BlockingExecutor,
+    CircuitBreaker,
+    CircuitOpenError,
+    ClusterNode,
+    ConnectionPool,
+    GroupMembershipIndex,
+    MetricsRegistry,
+    OfflineSpool,
+    PresenceRegistry,
+    RecentMessagesBuffer,
+    RoomRegistry,
+    TTLCache,
+    PoolTimeoutError,
+    TrafficRecorder,
+    create_bus,
+    create_client_manager,
+    emit_to_rooms,
+    is_connection_error,
+    event_log,
+    log,
+    parse_category_map,
+    parse_level,
+    upload_chat_image,
+)
 
 app = Flask(__name__)
 
@@ -34,9 +71,24 @@ DB_USER = settings.db_user
 DB_PASSWORD = settings.db_password
 DB_NAME = settings.db_name
 
+# Logs en cola con escritor en segundo plano: un stdout lento no frena el hub
+event_log.configure(
+    json_output=settings.log_format == "json",
+    level=settings.log_level,
+    levels=parse_category_map(settings.log_levels, parse_level),
+    sample=parse_category_map(settings.log_sample, float),
+)
+
 # CORS para REST endpoints
 CORS(app, origins=CORS_ORIGINS, supports_credentials=True)
 
+# Con SOCKETIO_MESSAGE_QUEUE varios workers comparten los emits a rooms
+client_manager = None
+cluster_bus = None
+if settings.socketio_message_queue:
+    client_manager = create_client_manager(settings.socketio_message_queue)
+    cluster_bus = create_bus(settings.socketio_message_queue)
+
 # SocketIO con CORS configurable
 socketio = SocketIO(
     app,
@@ -44,48 +96,289 @@ socketio = SocketIO(
     async_mode="eventlet",
     logger=FLASK_ENV == "development",
     engineio_logger=FLASK_ENV == "development",
+    client_manager=client_manager,
 )
 
-# Diccionario para rastrear usuarios conectados y sus rooms
-# Formato: {user_id: {"sid": session_id, "rooms": [room1, room2, ...]}}
-connected_users = {}
+# Presencia global y eventos entre workers (sin cola: solo este proceso)
+cluster = ClusterNode(cluster_bus, heartbeat=settings.cluster_heartbeat, expiry=settings.cluster_heartbeat * 3)
+
+# Límites de load_message_history (normal y en streaming) y tamaño de chunk por defecto
+MAX_HISTORY_LIMIT = 200
+MAX_HISTORY_STREAM_LIMIT = 10000
+HISTORY_CHUNK_SIZE = 100
+
+# Máximo de mensaje_ids aceptados por mark_delivered_bulk / mark_read_bulk
+MAX_BULK_RECEIPTS = 500
+
+# Máximo de salas que on_connect vuelve a unir automáticamente
+MAX_REJOIN_ROOMS = 1000
+
+# Máximo de other_user_ids + group_ids aceptados por join_rooms
+MAX_JOIN_ROOMS = 200
+
+# Conexiones de este worker indexadas por sid y por user_id (varios dispositivos por usuario)
+presence = PresenceRegistry()
+
+# =====================================================================
+# MÉTRICAS (GET /metrics en formato Prometheus)
+# =====================================================================
+
+metrics = MetricsRegistry()
+metrics.counter("socketio_events_total", "Eventos Socket.IO recibidos por handler", "event")
+metrics.counter("socketio_event_errors_total", "Excepciones no controladas por handler", "event")
+metrics.histogram("socketio_event_duration_seconds", "Duración de cada handler Socket.IO", "event")
+metrics.counter("db_queries_total", "Consultas a MySQL por handler", "handler")
+metrics.counter("db_query_seconds_total", "Segundos en consultas a MySQL por handler", "handler")
+metrics.histogram("emit_fanout_rooms", "Rooms destino por mensaje emitido", buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000))
+metrics.counter("offline_fallbacks_total", "Operaciones resueltas sin BD por error o sala inexistente", "kind")
+
+# Handler Socket.IO en curso en este greenlet (para atribuirle las consultas)
+_handler_context = threading.local()
+
+# Grabación opcional del tráfico entrante para reproducirlo con benchmarks.replay_traffic
+traffic_recorder = None
+if settings.traffic_record_path:
+    traffic_recorder = TrafficRecorder(settings.traffic_record_path.replace("{pid}", str(os.getpid())))
+
+
+def _traffic_payload(event, args):
+    """Payload que se graba: en connect, los query params que identifican al cliente"""
+    if event == "connect":
+        return {key: request.args.get(key) for key in ("user_id", "rejoin") if request.args.get(key) is not None}
+    return args[0] if args and event != "disconnect" else None
+
+
+def socket_event(event):
+    """socketio.on con métricas: eventos recibidos, duración y errores del handler"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def instrumented(*args):
+            if getattr(_handler_context, "name", None) is not None:
+                # Llamado desde otro handler (send_direct_message -> send_message): cuenta en el externo
+                return handler(*args)
+            _handler_context.name = event
+            metrics.inc("socketio_events_total", event)
+            started = time.perf_counter()
+            try:
+                return handler(*args)
+            except Exception:
+                metrics.inc("socketio_event_errors_total", event)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.observe("socketio_event_duration_seconds", elapsed, event)
+                _handler_context.name = None
+                if traffic_recorder is not None:
+                    traffic_recorder.record(event, request.sid, _traffic_payload(event, args), started, elapsed)
+        return socketio.on(event)(instrumented)
+    return decorator
+
+
+class _MeasuredExecute:
+    """Suma cada consulta y su duración al handler en curso"""
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            handler = getattr(_handler_context, "name", None) or "other"
+            metrics.inc("db_queries_total", handler)
+            metrics.inc("db_query_seconds_total", handler, time.perf_counter() - started)
+
+
+class MeasuredCursor(_MeasuredExecute, pymysql.cursors.DictCursor):
+    """DictCursor que suma cada consulta y su duración al handler en curso"""
+
+
+class MeasuredSSCursor(_MeasuredExecute, pymysql.cursors.SSDictCursor):
+    """
+    SSDictCursor medido igual que MeasuredCursor. Las filas llegan al leerlas,
+    así que el tiempo de fetchone/fetchmany también suma a db_query_seconds_total.
+    """
+
+    def _measured_fetch(self, fetch, *args):
+        started = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            handler = getattr(_handler_context, "name", None) or "other"
+            metrics.inc("db_query_seconds_total", handler, time.perf_counter() - started)
+
+    def fetchone(self):
+        return self._measured_fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._measured_fetch(super().fetchmany, size)
 
 # =====================================================================
 # CONEXIÓN A BASE DE DATOS MYSQL
 # =====================================================================
 
+# Pool compartido: evita el handshake TCP + auth de MySQL en cada consulta
+db_pool = ConnectionPool(
+    {
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "database": DB_NAME,
+        "charset": "utf8mb4",
+        "cursorclass": MeasuredCursor,
+        "connect_timeout": settings.db_connect_timeout,
+    },
+    max_size=settings.db_pool_size,
+    timeout=settings.db_pool_timeout,
+    recycle=settings.db_pool_recycle,
+    ping_interval=settings.db_pool_ping_interval,
+)
+
+
+def probe_database():
+    """Prueba de salud del circuit breaker: una consulta mínima con conexión nueva del pool"""
+    with db_pool.connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+
+
+# Con MySQL inaccesible, fallar de inmediato en lugar de esperar el connect_timeout
+# en cada consulta (DB_BREAKER_FAILURES=0 lo desactiva)
+db_breaker = None
+if settings.db_breaker_failures > 0:
+    db_breaker = CircuitBreaker(
+        failure_threshold=settings.db_breaker_failures,
+        cooldown=settings.db_breaker_cooldown,
+        half_open_calls=settings.db_breaker_half_open_calls,
+        probe=probe_database,
+        # Las conexiones ociosas probablemente quedaron muertas
+        on_open=db_pool.close_all,
+    )
+    db_breaker.start(socketio.start_background_task)
+
+# Acota las llamadas lentas a servicios externos (hilos nativos o greenthreads)
+blocking_executor = BlockingExecutor(settings.blocking_pool_size)
+
+# Metadata de salas en memoria (por sala_uuid, par de usuarios y grupo_id)
+room_registry = RoomRegistry(settings.room_cache_size, settings.room_cache_ttl)
+
+# Perfiles de usuario en memoria: {usuario_id: info de get_user_info}
+user_cache = TTLCache(settings.user_cache_size, settings.user_cache_ttl)
+
+# Miembros activos por grupo: {grupo_id: frozenset(usuario_id)}
+group_members_index = GroupMembershipIndex(settings.group_members_cache_size, settings.group_members_cache_ttl)
+
+# Últimos mensajes de las salas activas para servir historial sin consultar MySQL
+history_buffer = None
+if settings.history_buffer_size > 0:
+    history_buffer = RecentMessagesBuffer(
+        per_room=settings.history_buffer_size,
+        max_bytes=settings.history_buffer_max_bytes,
+        ttl=settings.history_buffer_ttl,
+    )
+    # Los mensajes enviados desde otros workers también entran al buffer
+    cluster.on("history_append", lambda p: history_buffer.append(p["sala_uuid"], p["entry"]))
+    cluster.on("history_invalidate", lambda p: history_buffer.invalidate_room(p["sala_uuid"]))
+
+cluster.start(socketio.start_background_task)
+atexit.register(cluster.stop)
+
+
 @contextmanager
 def get_db_connection():
-    """Context manager para conexiones a MySQL"""
-    conn = None
+    """
+    Context manager para conexiones a MySQL (tomadas del pool). Con el
+    circuit breaker abierto lanza CircuitOpenError sin intentar conectar.
+    """
+    if db_breaker is not None and not db_breaker.allow():
+        raise CircuitOpenError(2003, "MySQL inaccesible (circuit breaker abierto)")
     try:
-        conn = pymysql.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            database=DB_NAME,
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        yield conn
-        conn.commit()
+        with db_pool.connection() as conn:
+            try:
+                yield conn
+                conn.commit()
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                log("DB-ERROR", str(e))
+                raise
+    except PoolTimeoutError:
+        # Saturación del pool, no caída de MySQL: no cuenta para el breaker
+        raise
     except Exception as e:
-        if conn:
-            conn.rollback()
-        print(f"[DB-ERROR] {e}")
+        if db_breaker is not None:
+            if is_connection_error(e):
+                db_breaker.record_failure(e)
+            else:
+                db_breaker.record_success()
         raise
-    finally:
-        if conn:
-            conn.close()
+    if db_breaker is not None:
+        db_breaker.record_success()
+
+
+def is_row_error(error):
+    """
+    True si la BD respondió y rechazó la escritura (FK, CHECK, datos inválidos):
+    el problema está en alguna fila y vale la pena aislarla. Las caídas, el
+    breaker abierto y la saturación del pool fallarían igual fila por fila.
+    """
+    return not isinstance(error, (CircuitOpenError, PoolTimeoutError)) and not is_connection_error(error)
 
 
 # =====================================================================
 # FUNCIONES DE BASE DE DATOS
 # =====================================================================
 
+def get_sala_info(sala_uuid, cursor=None):
+    """Obtiene la metadata de una sala por UUID, consultando primero el registro en memoria"""
+    sala = room_registry.get_by_uuid(sala_uuid)
+    if sala:
+        return sala
+
+    if cursor is None:
+        with get_db_connection() as conn:
+            return get_sala_info(sala_uuid, conn.cursor())
+
+    cursor.execute("""
+        SELECT id, sala_uuid, tipo_sala, usuario_a_id, usuario_b_id, grupo_id
+        FROM salas_chat
+        WHERE sala_uuid = %s
+    """, (str(sala_uuid),))
+    sala = cursor.fetchone()
+    room_registry.add(sala)
+    return sala
+
+
+def fallback_room(user_a_id=None, user_b_id=None, group_id=None):
+    """
+    Sala temporal (id=0) para operar sin BD, con UUID determinístico basado en
+    los IDs de usuario o en el ID del grupo. Se registra para poder crear la
+    sala real al guardar los mensajes offline enviados a ella.
+    """
+    if group_id is not None:
+        sala = {
+            "id": 0, "sala_uuid": str(uuid_pkg.uuid5(uuid_pkg.NAMESPACE_DNS, f"group-{group_id}")),
+            "tipo_sala": "grupal", "usuario_a_id": None, "usuario_b_id": None, "grupo_id": int(group_id)
+        }
+    else:
+        menor_id = min(int(user_a_id), int(user_b_id))
+        mayor_id = max(int(user_a_id), int(user_b_id))
+        sala = {
+            "id": 0, "sala_uuid": str(uuid_pkg.uuid5(uuid_pkg.NAMESPACE_DNS, f"direct-{menor_id}-{mayor_id}")),
+            "tipo_sala": "directo", "usuario_a_id": menor_id, "usuario_b_id": mayor_id, "grupo_id": None
+        }
+    room_registry.add_fallback(sala)
+    return sala
+
+
 def get_or_create_direct_chat(user_a_id, user_b_id):
     """Obtiene o crea una sala de chat directa entre dos usuarios"""
+    sala = room_registry.get_direct(user_a_id, user_b_id)
+    if sala:
+        return sala
+
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -96,7 +389,7 @@ def get_or_create_direct_chat(user_a_id, user_b_id):
             
             # Intentar obtener sala existente
             cursor.execute("""
-                SELECT id, sala_uuid
+                SELECT id, sala_uuid, tipo_sala, usuario_a_id, usuario_b_id, grupo_id
                 FROM salas_chat
                 WHERE tipo_sala = 'directo'
                 AND LEAST(usuario_a_id, usuario_b_id) = %s
@@ -105,208 +398,849 @@ def get_or_create_direct_chat(user_a_id, user_b_id):
             
             sala = cursor.fetchone()
             
-            if sala:
-                return sala
-            
-            # Crear nueva sala con UUID
-            nuevo_uuid = str(uuid_pkg.uuid4())
-            cursor.execute("""
-                INSERT INTO salas_chat (sala_uuid, tipo_sala, usuario_a_id, usuario_b_id)
-                VALUES (%s, 'directo', %s, %s)
-            """, (nuevo_uuid, menor_id, mayor_id))
+            if not sala:
+                # Crear nueva sala con UUID
+                nuevo_uuid = str(uuid_pkg.uuid4())
+                cursor.execute("""
+                    INSERT INTO salas_chat (sala_uuid, tipo_sala, usuario_a_id, usuario_b_id)
+                    VALUES (%s, 'directo', %s, %s)
+                """, (nuevo_uuid, menor_id, mayor_id))
+                
+                sala = {
+                    "id": cursor.lastrowid,
+                    "sala_uuid": nuevo_uuid,
+                    "tipo_sala": "directo",
+                    "usuario_a_id": menor_id,
+                    "usuario_b_id": mayor_id,
+                    "grupo_id": None
+                }
             
-            # Obtener ID insertado
-            sala_id = cursor.lastrowid
-            return {"id": sala_id, "sala_uuid": nuevo_uuid}
+            room_registry.add(sala)
+            return sala
             
     except Exception as e:
-        print(f"[DB-ERROR] get_or_create_direct_chat: {e}")
+        log("DB-ERROR", f"get_or_create_direct_chat: {e}")
         # Fallback: generar UUID temporal para que funcione sin BD
-        print(f"[WARN] Creando sala directa sin BD: {user_a_id}<->{user_b_id}")
-        menor_id = min(int(user_a_id), int(user_b_id))
-        mayor_id = max(int(user_a_id), int(user_b_id))
-        # Generar UUID determinístico basado en los IDs de usuario
-        sala_uuid = str(uuid_pkg.uuid5(uuid_pkg.NAMESPACE_DNS, f"direct-{menor_id}-{mayor_id}"))
-        return {"id": 0, "sala_uuid": sala_uuid}
+        log("WARN", f"Creando sala directa sin BD: {user_a_id}<->{user_b_id}")
+        metrics.inc("offline_fallbacks_total", "direct_room")
+        return fallback_room(user_a_id, user_b_id)
 
 
 def get_or_create_group_chat(group_id):
     """Obtiene o crea una sala de chat grupal"""
+    sala = room_registry.get_group(group_id)
+    if sala:
+        return sala
+
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
             # Intentar obtener sala existente
             cursor.execute("""
-                SELECT id, sala_uuid
+                SELECT id, sala_uuid, tipo_sala, usuario_a_id, usuario_b_id, grupo_id
                 FROM salas_chat
                 WHERE tipo_sala = 'grupal' AND grupo_id = %s
             """, (int(group_id),))
             
             sala = cursor.fetchone()
             
-            if sala:
-                return sala
-            
-            # Crear nueva sala con UUID
-            nuevo_uuid = str(uuid_pkg.uuid4())
-            cursor.execute("""
-                INSERT INTO salas_chat (sala_uuid, tipo_sala, grupo_id)
-                VALUES (%s, 'grupal', %s)
-            """, (nuevo_uuid, int(group_id)))
+            if not sala:
+                # Crear nueva sala con UUID
+                nuevo_uuid = str(uuid_pkg.uuid4())
+                cursor.execute("""
+                    INSERT INTO salas_chat (sala_uuid, tipo_sala, grupo_id)
+                    VALUES (%s, 'grupal', %s)
+                """, (nuevo_uuid, int(group_id)))
+                
+                sala = {
+                    "id": cursor.lastrowid,
+                    "sala_uuid": nuevo_uuid,
+                    "tipo_sala": "grupal",
+                    "usuario_a_id": None,
+                    "usuario_b_id": None,
+                    "grupo_id": int(group_id)
+                }
             
-            # Obtener ID insertado
-            sala_id = cursor.lastrowid
-            return {"id": sala_id, "sala_uuid": nuevo_uuid}
+            room_registry.add(sala)
+            return sala
             
     except Exception as e:
-        print(f"[DB-ERROR] get_or_create_group_chat: {e}")
+        log("DB-ERROR", f"get_or_create_group_chat: {e}")
         # Fallback: generar UUID temporal para que funcione sin BD
-        print(f"[WARN] Creando sala grupal sin BD: group_id={group_id}")
-        # Generar UUID determinístico basado en el ID del grupo
-        sala_uuid = str(uuid_pkg.uuid5(uuid_pkg.NAMESPACE_DNS, f"group-{group_id}"))
-        return {"id": 0, "sala_uuid": sala_uuid}
+        log("WARN", f"Creando sala grupal sin BD: group_id={group_id}")
+        metrics.inc("offline_fallbacks_total", "group_room")
+        return fallback_room(group_id=group_id)
+
+
+def get_user_rooms(user_id, limit=MAX_REJOIN_ROOMS):
+    """
+    Salas activas de un usuario en una sola consulta: sus chats directos y las
+    salas de los grupos donde es miembro activo, las `limit` con actividad más
+    reciente (último mensaje, por idx_mensajes_sala_enviado). Retorna [] si
+    falla la BD.
+    """
+    actividad = "(SELECT MAX(m.enviado_en) FROM mensajes m WHERE m.sala_chat_id = s.id) AS ultima_actividad"
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT s.id, s.sala_uuid, s.tipo_sala, s.usuario_a_id, s.usuario_b_id, s.grupo_id, {actividad}
+                FROM salas_chat s
+                WHERE s.tipo_sala = 'directo'
+                AND (s.usuario_a_id = %s OR s.usuario_b_id = %s)
+                UNION ALL
+                SELECT s.id, s.sala_uuid, s.tipo_sala, s.usuario_a_id, s.usuario_b_id, s.grupo_id, {actividad}
+                FROM salas_chat s
+                JOIN miembros_grupo mg ON mg.grupo_id = s.grupo_id
+                WHERE s.tipo_sala = 'grupal'
+                AND mg.usuario_id = %s
+                AND mg.estado_membresia = 'activo'
+                ORDER BY ultima_actividad DESC, id DESC
+                LIMIT %s
+            """, (int(user_id), int(user_id), int(user_id), int(limit)))
+            salas = cursor.fetchall()
+    except Exception as e:
+        log("DB-ERROR", f"get_user_rooms: {e}")
+        return []
+
+    for sala in salas:
+        sala.pop("ultima_actividad", None)
+        room_registry.add(sala)
+    return salas
+
+
+def _select_direct_rooms(cursor, user_id, other_ids):
+    """Salas directas entre user_id y cada uno de other_ids: {other_id: sala}"""
+    marcadores = ", ".join(["%s"] * len(other_ids))
+    cursor.execute(f"""
+        SELECT id, sala_uuid, tipo_sala, usuario_a_id, usuario_b_id, grupo_id
+        FROM salas_chat
+        WHERE tipo_sala = 'directo'
+        AND (
+            (usuario_a_id = %s AND usuario_b_id IN ({marcadores}))
+            OR (usuario_b_id = %s AND usuario_a_id IN ({marcadores}))
+        )
+    """, (user_id, *other_ids, user_id, *other_ids))
+    salas = {}
+    for sala in cursor.fetchall():
+        other_id = sala["usuario_b_id"] if sala["usuario_a_id"] == user_id else sala["usuario_a_id"]
+        salas[int(other_id)] = sala
+    return salas
+
+
+def _select_group_rooms(cursor, group_ids):
+    """Salas grupales de group_ids: {grupo_id: sala}"""
+    marcadores = ", ".join(["%s"] * len(group_ids))
+    cursor.execute(f"""
+        SELECT id, sala_uuid, tipo_sala, usuario_a_id, usuario_b_id, grupo_id
+        FROM salas_chat
+        WHERE tipo_sala = 'grupal' AND grupo_id IN ({marcadores})
+    """, tuple(group_ids))
+    return {int(sala["grupo_id"]): sala for sala in cursor.fetchall()}
+
+
+def get_or_create_rooms(user_id, other_user_ids, group_ids):
+    """
+    Resuelve (y crea las que falten) las salas directas con other_user_ids y las
+    salas de group_ids en una sola conexión, con consultas por conjunto.
+
+    Retorna (directas {other_id: sala}, grupales {grupo_id: sala}, grupos sin
+    membresía activa). Si falla la BD usa salas de fallback (id=0) como
+    get_or_create_direct_chat / get_or_create_group_chat.
+    """
+    user_id = int(user_id)
+    directas = {}
+    grupales = {}
+
+    # Primero el registro en memoria; solo lo que falte va a la BD
+    faltan_directas = []
+    for other_id in other_user_ids:
+        sala = room_registry.get_direct(user_id, other_id)
+        if sala:
+            directas[other_id] = sala
+        else:
+            faltan_directas.append(other_id)
+
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+
+            # Membresía desde el índice; solo los grupos sin confirmar van a la BD
+            miembros = set()
+            por_consultar = []
+            for group_id in group_ids:
+                cached = group_members_index.cached_members(group_id)
+                if cached is not None and user_id in cached:
+                    miembros.add(group_id)
+                else:
+                    por_consultar.append(group_id)
+            if por_consultar:
+                marcadores = ", ".join(["%s"] * len(por_consultar))
+                cursor.execute(f"""
+                    SELECT grupo_id
+                    FROM miembros_grupo
+                    WHERE usuario_id = %s
+                    AND grupo_id IN ({marcadores})
+                    AND estado_membresia = 'activo'
+                """, (user_id, *por_consultar))
+                for row in cursor.fetchall():
+                    miembros.add(int(row["grupo_id"]))
+                    group_members_index.add_member(row["grupo_id"], user_id)
+
+            faltan_grupales = []
+            for group_id in group_ids:
+                if group_id not in miembros:
+                    continue
+                sala = room_registry.get_group(group_id)
+                if sala:
+                    grupales[group_id] = sala
+                else:
+                    faltan_grupales.append(group_id)
+
+            if faltan_directas:
+                encontradas = _select_direct_rooms(cursor, user_id, faltan_directas)
+                nuevas = [other_id for other_id in faltan_directas if other_id not in encontradas]
+                if nuevas:
+                    # INSERT IGNORE + relectura: si otro proceso creó la sala, gana la suya
+                    cursor.execute(f"""
+                        INSERT IGNORE INTO salas_chat (sala_uuid, tipo_sala, usuario_a_id, usuario_b_id)
+                        VALUES {", ".join(["(%s, 'directo', %s, %s)"] * len(nuevas))}
+                    """, tuple(
+                        valor
+                        for other_id in nuevas
+                        for valor in (str(uuid_pkg.uuid4()), min(user_id, other_id), max(user_id, other_id))
+                    ))
+                    encontradas.update(_select_direct_rooms(cursor, user_id, nuevas))
+                directas.update(encontradas)
+
+            if faltan_grupales:
+                encontradas = _select_group_rooms(cursor, faltan_grupales)
+                nuevas = [group_id for group_id in faltan_grupales if group_id not in encontradas]
+                if nuevas:
+                    cursor.execute(f"""
+                        INSERT IGNORE INTO salas_chat (sala_uuid, tipo_sala, grupo_id)
+                        VALUES {", ".join(["(%s, 'grupal', %s)"] * len(nuevas))}
+                    """, tuple(valor for group_id in nuevas for valor in (str(uuid_pkg.uuid4()), group_id)))
+                    encontradas.update(_select_group_rooms(cursor, nuevas))
+                grupales.update(encontradas)
+
+    except Exception as e:
+        log("DB-ERROR", f"get_or_create_rooms: {e}")
+        log("WARN", f"Resolviendo salas sin BD para user_id={user_id}")
+        metrics.inc("offline_fallbacks_total", "rooms")
+        for other_id in other_user_ids:
+            if other_id not in directas:
+                directas[other_id] = fallback_room(user_id, other_id)
+        for group_id in group_ids:
+            grupales[group_id] = fallback_room(group_id=group_id)
+        return directas, grupales, []
+
+    for sala in list(directas.values()) + list(grupales.values()):
+        room_registry.add(sala)
+    denegados = [group_id for group_id in group_ids if group_id not in miembros]
+    return directas, grupales, denegados
+
+
+def room_summary(sala, user_id):
+    """Descripción de una sala para el cliente (connected, rooms_joined)"""
+    sala_uuid = sala["sala_uuid"]
+    if sala["tipo_sala"] == "directo":
+        other_user_id = sala["usuario_b_id"] if str(sala["usuario_a_id"]) == str(user_id) else sala["usuario_a_id"]
+        return {
+            "type": "directo",
+            "room": f"chat_{sala_uuid}",
+            "sala_chat_id": sala["id"],
+            "sala_uuid": sala_uuid,
+            "other_user_id": str(other_user_id)
+        }
+    return {
+        "type": "grupal",
+        "room": f"group_{sala_uuid}",
+        "sala_chat_id": sala["id"],
+        "sala_uuid": sala_uuid,
+        "group_id": str(sala["grupo_id"])
+    }
+
+
+def _insert_message(cursor, sala_chat_id, sender_id, message_type, content, url_archivo=None, metadatos=None):
+    """
+    Inserta un mensaje con UUID y timestamp generados en el servidor,
+    así no hace falta releer la fila para conocer enviado_en
+    """
+    nuevo_uuid = str(uuid_pkg.uuid4())
+    enviado_en = datetime.now().replace(microsecond=0)
+    metadatos_json = json.dumps(metadatos) if metadatos else None
+    
+    cursor.execute("""
+        INSERT INTO mensajes (
+            mensaje_uuid, sala_chat_id, remitente_id, 
+            tipo_mensaje, contenido, url_archivo, metadatos, enviado_en
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """, (
+        nuevo_uuid,
+        int(sala_chat_id),
+        int(sender_id),
+        message_type,
+        content,
+        url_archivo,
+        metadatos_json,
+        enviado_en
+    ))
+    
+    return {
+        "id": cursor.lastrowid,
+        "mensaje_uuid": nuevo_uuid,
+        "enviado_en": enviado_en
+    }
 
 
 def save_message(sala_chat_id, sender_id, message_type, content, url_archivo=None, metadatos=None):
     """Guarda un mensaje en la base de datos"""
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Crear UUID para el mensaje
-            nuevo_uuid = str(uuid_pkg.uuid4())
-            metadatos_json = json.dumps(metadatos) if metadatos else None
-            
-            # Insertar mensaje
-            cursor.execute("""
-                INSERT INTO mensajes (
-                    mensaje_uuid, sala_chat_id, remitente_id, 
-                    tipo_mensaje, contenido, url_archivo, metadatos
-                )
-                VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, (
-                nuevo_uuid,
-                int(sala_chat_id),
-                int(sender_id),
+            return _insert_message(
+                conn.cursor(),
+                sala_chat_id,
+                sender_id,
                 message_type,
                 content,
                 url_archivo,
-                metadatos_json
-            ))
-            
-            # Obtener ID insertado
-            mensaje_id = cursor.lastrowid
-            
-            # Obtener el mensaje completo con timestamp
-            cursor.execute("""
-                SELECT id, mensaje_uuid, enviado_en
-                FROM mensajes
-                WHERE id = %s
-            """, (mensaje_id,))
-            
-            mensaje = cursor.fetchone()
-            return mensaje
+                metadatos
+            )
             
     except Exception as e:
-        print(f"[DB-ERROR] save_message: {e}")
+        log("DB-ERROR", f"save_message: {e}")
         return None
 
 
-def mark_message_delivered(mensaje_id, destinatario_id):
-    """Marca un mensaje como entregado a un destinatario"""
+def persist_message(sala_uuid, sender_id, message_type, content, url_archivo=None, metadatos=None):
+    """
+    Resuelve la sala, inserta el mensaje y carga el perfil del remitente usando
+    una sola conexión y una sola transacción (las partes en caché no consultan la BD).
+
+    Retorna (sala_info, mensaje). sala_info es None si la sala no existe en BD;
+    mensaje es None si falló el INSERT. Los errores de conexión se propagan.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        sala_info = get_sala_info(sala_uuid, cursor)
+        if not sala_info:
+            return None, None
+        
+        try:
+            mensaje = _insert_message(
+                cursor,
+                sala_info["id"],
+                sender_id,
+                message_type,
+                content,
+                url_archivo,
+                metadatos
+            )
+        except Exception as e:
+            log("DB-ERROR", f"persist_message: {e}")
+            return sala_info, None
+        
+        # Dejar el perfil del remitente en caché para armar message_data
+        get_user_info(sender_id, cursor)
+        
+        return sala_info, mensaje
+
+
+def save_messages_batch(pendientes):
+    """
+    Guarda un lote de mensajes del write-behind con un INSERT de varias filas
+    y un solo commit. Retorna los mensajes guardados en el mismo orden. Si una
+    fila viola una FK o un CHECK, el BatchWriter reintenta el lote en mitades
+    para que solo ese mensaje reciba el ack de error.
+    """
+    columnas = (
+        "mensaje_uuid", "sala_chat_id", "remitente_id", "tipo_mensaje",
+        "contenido", "url_archivo", "metadatos", "enviado_en"
+    )
+    fila = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+    
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            INSERT INTO mensajes ({", ".join(columnas)})
+            VALUES {", ".join([fila] * len(pendientes))}
+        """, [p[c] for p in pendientes for c in columnas])
+        
+        # Los IDs de un INSERT multi-fila no son confiables con auto_inc_lock_mode=2:
+        # se obtienen por mensaje_uuid
+        uuids = [p["mensaje_uuid"] for p in pendientes]
+        cursor.execute(f"""
+            SELECT id, mensaje_uuid
+            FROM mensajes
+            WHERE mensaje_uuid IN ({", ".join(["%s"] * len(uuids))})
+        """, uuids)
+        ids = {str(row["mensaje_uuid"]): row["id"] for row in cursor.fetchall()}
+    
+    return [
+        {
+            "id": ids[p["mensaje_uuid"]],
+            "mensaje_uuid": p["mensaje_uuid"],
+            "enviado_en": p["enviado_en"]
+        }
+        for p in pendientes
+    ]
+
+
+def invalidate_room_history(sala_uuid):
+    """Descarta el historial reciente de la sala en el buffer, en este y en los demás workers"""
+    if history_buffer is not None:
+        history_buffer.invalidate_room(sala_uuid)
+        cluster.publish("history_invalidate", {"sala_uuid": sala_uuid})
+
+
+def save_offline_messages(registros):
+    """
+    Inserta en orden los mensajes del spool offline. Es idempotente: cada
+    mensaje trae el mensaje_uuid (uuid4) que recibieron los clientes y los que
+    ya están en BD se omiten. Los enviados a una sala de fallback se guardan en
+    la sala real de su "destino", que se crea si hace falta. Después avisa a
+    cada sala los IDs asignados (messages_persisted).
+
+    Retorna (insertados, rechazados): cuántas filas se insertaron realmente y
+    los registros que la BD rechazó (sala inexistente, FK, CHECK, datos
+    inválidos), cada uno con su "motivo", para que el spool los ponga en
+    cuarentena. Los errores de conexión se propagan y el lote se reintenta.
+    """
+    columnas = (
+        "mensaje_uuid", "sala_chat_id", "remitente_id", "tipo_mensaje",
+        "contenido", "url_archivo", "metadatos", "enviado_en"
+    )
+    fila = "(" + ", ".join(["%s"] * len(columnas)) + ")"
+    rechazados = []
+    pendientes = {}
+    originales = {}
+
+    def insertar(cursor, filas):
+        # ON DUPLICATE KEY UPDATE y no INSERT IGNORE: solo se omite un uuid
+        # repetido; FK, CHECK y truncamientos siguen siendo errores
+        cursor.execute(f"""
+            INSERT INTO mensajes ({", ".join(columnas)})
+            VALUES {", ".join([fila] * len(filas))}
+            ON DUPLICATE KEY UPDATE id = id
+        """, [p[c] for p in filas for c in columnas])
+
+    salas = {}
+
+    def resolver_sala(registro):
+        # Un mensaje enviado a una sala de fallback (creada sin BD) va a la sala
+        # real de esos usuarios o de ese grupo, creándola si todavía no existe
+        sala_uuid = registro["sala_uuid"]
+        if sala_uuid not in salas:
+            sala = get_sala_info(sala_uuid)
+            destino = registro.get("destino")
+            if not sala and destino:
+                if destino.get("grupo_id") is not None:
+                    sala = get_or_create_group_chat(destino["grupo_id"])
+                else:
+                    sala = get_or_create_direct_chat(destino["usuario_a_id"], destino["usuario_b_id"])
+                if not sala["id"]:
+                    # La BD volvió a caerse: el lote se reintenta más tarde
+                    raise pymysql.err.OperationalError(2003, "No se pudo crear la sala del mensaje offline")
+            salas[sala_uuid] = sala
+        return salas[sala_uuid]
+
+    # Las salas se resuelven antes de tomar la conexión del INSERT: crearlas
+    # usa su propia conexión del pool
+    for registro in registros:
+        try:
+            sala_info = resolver_sala(registro)
+        except (KeyError, TypeError, ValueError) as e:
+            rechazados.append(dict(registro, motivo=f"registro inválido: {e}"))
+            continue
+        if not sala_info:
+            log("SPOOL-ERROR", "Sala inexistente, mensaje offline en cuarentena", sala_uuid=registro["sala_uuid"])
+            rechazados.append(dict(registro, motivo="sala inexistente"))
+            continue
+        try:
+            pendiente = dict(
+                registro,
+                sala_chat_id=int(sala_info["id"]),
+                sala_real_uuid=str(sala_info["sala_uuid"]),
+                remitente_id=int(registro["sender_id"]),
+                enviado_en=datetime.fromisoformat(registro["enviado_en"]),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            rechazados.append(dict(registro, motivo=f"registro inválido: {e}"))
+            continue
+        originales[registro["mensaje_uuid"]] = registro
+        pendientes[registro["mensaje_uuid"]] = pendiente
+    if not pendientes:
+        return 0, rechazados
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        # Los ya guardados (lote repetido tras una caída antes del checkpoint) no cuentan
+        uuids = list(pendientes)
+        cursor.execute(f"""
+            SELECT mensaje_uuid
+            FROM mensajes
+            WHERE mensaje_uuid IN ({", ".join(["%s"] * len(uuids))})
+        """, uuids)
+        existentes = {str(row["mensaje_uuid"]) for row in cursor.fetchall()}
+        nuevos = [p for u, p in pendientes.items() if u not in existentes]
+
+        insertados = len(nuevos)
+        if nuevos:
+            try:
+                insertar(cursor, nuevos)
+            except Exception as e:
+                if not is_row_error(e):
+                    raise
+                # El INSERT multi-fila se revierte completo: repetir fila por fila
+                for p in nuevos:
+                    try:
+                        insertar(cursor, [p])
+                    except Exception as fila_error:
+                        if not is_row_error(fila_error):
+                            raise
+                        log("SPOOL-ERROR", f"Mensaje offline rechazado por la BD: {fila_error}", mensaje_uuid=p["mensaje_uuid"])
+                        del pendientes[p["mensaje_uuid"]]
+                        rechazados.append(dict(originales[p["mensaje_uuid"]], motivo=str(fila_error)))
+                        insertados -= 1
+
+        if not pendientes:
+            return 0, rechazados
+        uuids = list(pendientes)
+        cursor.execute(f"""
+            SELECT id, mensaje_uuid
+            FROM mensajes
+            WHERE mensaje_uuid IN ({", ".join(["%s"] * len(uuids))})
+        """, uuids)
+        ids = {str(row["mensaje_uuid"]): row["id"] for row in cursor.fetchall()}
+
+    por_sala = {}
+    for p in pendientes.values():
+        por_sala.setdefault((p["sala_uuid"], p["chat_type"], p["sala_real_uuid"]), []).append(
+            {"mensaje_uuid": p["mensaje_uuid"], "mensaje_id": str(ids.get(p["mensaje_uuid"], 0))}
+        )
+    for (sala_uuid, chat_type, sala_real_uuid), mensajes in por_sala.items():
+        # El buffer no tiene los mensajes offline (no tenían id): se descarta la sala
+        invalidate_room_history(sala_real_uuid)
+        room_name = f"chat_{sala_uuid}" if chat_type == "directo" else f"group_{sala_uuid}"
+        evento = {"sala_uuid": sala_uuid, "mensajes": mensajes}
+        if sala_real_uuid != sala_uuid:
+            # Los clientes en la sala de fallback deben volver a unirse con este UUID
+            evento["persisted_sala_uuid"] = sala_real_uuid
+        socketio.emit("messages_persisted", evento, to=room_name)
+    return insertados, rechazados
+
+
+# Spool local de los mensajes enviados sin BD; se insertan cuando MySQL vuelve
+offline_spool = None
+if settings.offline_spool_dir:
+    offline_spool = OfflineSpool(
+        settings.offline_spool_dir,
+        save_offline_messages,
+        fsync_interval=settings.offline_spool_fsync_ms / 1000,
+        replay_interval=settings.offline_spool_replay_interval,
+        batch_size=settings.offline_spool_batch_size,
+    )
+    offline_spool.start()
+    atexit.register(offline_spool.stop)
+
+
+# Write-behind opcional: agrupa los INSERT de mensajes en lotes (WRITE_BEHIND_ENABLED)
+message_writer = None
+if settings.write_behind_enabled:
+    message_writer = BatchWriter(
+        save_messages_batch,
+        max_batch=settings.write_behind_batch_size,
+        linger=settings.write_behind_linger_ms / 1000,
+        max_queue=settings.write_behind_max_queue,
+        put_timeout=settings.write_behind_put_timeout,
+        name="mensajes",
+        isolate_errors=is_row_error,
+    )
+    message_writer.start()
+    # Escribir lo pendiente al apagar el servidor
+    atexit.register(message_writer.stop)
+
+
+def upsert_receipts(cursor, filas, leido=False):
+    """
+    Registra la entrega (o lectura) de varios pares (mensaje_id, destinatario_id)
+    con un solo INSERT ... ON DUPLICATE KEY UPDATE. Retorna cuántos pares se escribieron.
+    """
+    filas = list(dict.fromkeys((int(mensaje_id), int(destinatario_id)) for mensaje_id, destinatario_id in filas))
+    if not filas:
+        return 0
+    
+    params = [valor for fila in filas for valor in fila]
+    if leido:
+        # Insertar con leído (y entregado automáticamente)
+        cursor.execute(f"""
+            INSERT INTO destinatarios_mensaje (mensaje_id, destinatario_id, entregado_en, leido_en)
+            VALUES {", ".join(["(%s, %s, NOW(), NOW())"] * len(filas))}
+            ON DUPLICATE KEY UPDATE
+                entregado_en = COALESCE(entregado_en, VALUES(entregado_en)),
+                leido_en = VALUES(leido_en)
+        """, params)
+    else:
+        cursor.execute(f"""
+            INSERT INTO destinatarios_mensaje (mensaje_id, destinatario_id, entregado_en)
+            VALUES {", ".join(["(%s, %s, NOW())"] * len(filas))}
+            ON DUPLICATE KEY UPDATE
+                entregado_en = VALUES(entregado_en)
+        """, params)
+    
+    return len(filas)
+
+
+def mark_messages_delivered(mensaje_ids, destinatario_id):
+    """Marca varios mensajes como entregados a un destinatario en una sola escritura"""
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Verificar si ya existe el registro
-            cursor.execute("""
-                SELECT mensaje_id FROM destinatarios_mensaje
-                WHERE mensaje_id = %s AND destinatario_id = %s
-            """, (int(mensaje_id), int(destinatario_id)))
-            
-            if cursor.fetchone():
-                # Actualizar
-                cursor.execute("""
-                    UPDATE destinatarios_mensaje
-                    SET entregado_en = NOW()
-                    WHERE mensaje_id = %s AND destinatario_id = %s
-                """, (int(mensaje_id), int(destinatario_id)))
-            else:
-                # Insertar
-                cursor.execute("""
-                    INSERT INTO destinatarios_mensaje (mensaje_id, destinatario_id, entregado_en)
-                    VALUES (%s, %s, NOW())
-                """, (int(mensaje_id), int(destinatario_id)))
-            
+            upsert_receipts(conn.cursor(), [(mensaje_id, destinatario_id) for mensaje_id in mensaje_ids])
             return True
             
     except Exception as e:
-        print(f"[DB-ERROR] mark_message_delivered: {e}")
+        log("DB-ERROR", f"mark_messages_delivered: {e}")
         return False
 
 
-def mark_message_read(mensaje_id, destinatario_id):
-    """Marca un mensaje como leído por un destinatario"""
+def mark_messages_read(mensaje_ids, destinatario_id):
+    """Marca varios mensajes como leídos por un destinatario en una sola escritura"""
     try:
         with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # Verificar si ya existe el registro
-            cursor.execute("""
-                SELECT mensaje_id FROM destinatarios_mensaje
-                WHERE mensaje_id = %s AND destinatario_id = %s
-            """, (int(mensaje_id), int(destinatario_id)))
-            
-            if cursor.fetchone():
-                # Actualizar
-                cursor.execute("""
-                    UPDATE destinatarios_mensaje
-                    SET leido_en = NOW()
-                    WHERE mensaje_id = %s AND destinatario_id = %s
-                """, (int(mensaje_id), int(destinatario_id)))
-            else:
-                # Insertar con leído (y entregado automáticamente)
-                cursor.execute("""
-                    INSERT INTO destinatarios_mensaje (mensaje_id, destinatario_id, entregado_en, leido_en)
-                    VALUES (%s, %s, NOW(), NOW())
-                """, (int(mensaje_id), int(destinatario_id)))
-            
+            upsert_receipts(conn.cursor(), [(mensaje_id, destinatario_id) for mensaje_id in mensaje_ids], leido=True)
             return True
             
     except Exception as e:
-        print(f"[DB-ERROR] mark_message_read: {e}")
+        log("DB-ERROR", f"mark_messages_read: {e}")
         return False
 
 
+def mark_message_delivered(mensaje_id, destinatario_id):
+    """Marca un mensaje como entregado a un destinatario"""
+    return mark_messages_delivered([mensaje_id], destinatario_id)
+
+
+def mark_message_read(mensaje_id, destinatario_id):
+    """Marca un mensaje como leído por un destinatario"""
+    return mark_messages_read([mensaje_id], destinatario_id)
+
+
+def mark_room_read_until(sala_uuid, mensaje_id, destinatario_id):
+    """
+    Marca como entregados y leídos todos los mensajes de la sala enviados hasta
+    `mensaje_id` inclusive (orden enviado_en, id), excepto los propios, con un solo
+    INSERT ... SELECT que recorre idx_mensajes_sala_enviado.
+
+    Retorna cuántos mensajes pasaron a leídos (los que no tenían leido_en) o None
+    si la sala no existe. No se usa el rowcount del upsert: MySQL cuenta 1 por
+    inserción, 2 por actualización y 0 por fila sin cambios.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        sala = get_sala_info(sala_uuid, cursor)
+        if not sala:
+            return None
+        
+        rango = """
+            FROM mensajes m
+            JOIN mensajes w ON w.id = %s AND w.sala_chat_id = m.sala_chat_id
+            WHERE m.sala_chat_id = %s
+            AND m.enviado_en <= w.enviado_en
+            AND (m.enviado_en < w.enviado_en OR m.id <= w.id)
+            AND m.remitente_id <> %s
+        """
+        params = (int(mensaje_id), int(sala["id"]), int(destinatario_id))
+        
+        # Contar en la misma transacción los que aún no están leídos
+        cursor.execute(f"""
+            SELECT COUNT(*) AS pendientes
+            {rango}
+            AND NOT EXISTS (
+                SELECT 1 FROM destinatarios_mensaje d
+                WHERE d.mensaje_id = m.id AND d.destinatario_id = %s AND d.leido_en IS NOT NULL
+            )
+        """, params + (int(destinatario_id),))
+        pendientes = cursor.fetchone()["pendientes"]
+        if not pendientes:
+            return 0
+        
+        cursor.execute(f"""
+            INSERT INTO destinatarios_mensaje (mensaje_id, destinatario_id, entregado_en, leido_en)
+            SELECT m.id, %s, NOW(), NOW()
+            {rango}
+            ON DUPLICATE KEY UPDATE
+                entregado_en = COALESCE(entregado_en, VALUES(entregado_en)),
+                leido_en = COALESCE(leido_en, VALUES(leido_en))
+        """, (int(destinatario_id),) + params)
+        
+        return pendientes
+
+
+def save_receipts_batch(recibos):
+    """
+    Escribe un lote de confirmaciones individuales acumuladas por el coalescedor:
+    un upsert para las entregas y otro para las lecturas, en una sola transacción
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        upsert_receipts(cursor, [(r["mensaje_id"], r["destinatario_id"]) for r in recibos if not r["leido"]])
+        upsert_receipts(cursor, [(r["mensaje_id"], r["destinatario_id"]) for r in recibos if r["leido"]], leido=True)
+    return [True] * len(recibos)
+
+
+# Coalescedor de mark_delivered / mark_read individuales (RECEIPT_COALESCE_MS=0 lo desactiva)
+receipt_writer = None
+if settings.receipt_coalesce_ms > 0:
+    receipt_writer = BatchWriter(
+        save_receipts_batch,
+        max_batch=settings.receipt_batch_size,
+        linger=settings.receipt_coalesce_ms / 1000,
+        max_queue=settings.receipt_batch_size * 20,
+        put_timeout=0,
+        name="recibos",
+        isolate_errors=is_row_error,
+    )
+    receipt_writer.start()
+    atexit.register(receipt_writer.stop)
+
+
+def load_group_members(group_id):
+    """Consulta los usuario_id de los miembros activos de un grupo (lanza si falla la BD)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT usuario_id
+            FROM miembros_grupo
+            WHERE grupo_id = %s 
+            AND estado_membresia = 'activo'
+        """, (int(group_id),))
+        
+        return [m["usuario_id"] for m in cursor.fetchall()]
+
+
 def get_group_members(group_id):
-    """Obtiene los IDs de los miembros activos de un grupo"""
+    """Obtiene los IDs de los miembros activos de un grupo (desde el índice en memoria)"""
+    try:
+        return [str(usuario_id) for usuario_id in group_members_index.members(group_id, load_group_members)]
+    except Exception as e:
+        log("DB-ERROR", f"get_group_members: {e}")
+        return []
+
+
+def group_fanout_rooms(group_id):
+    """Rooms personales de los miembros del grupo conectados en cualquier worker"""
+    return [usuario_id for usuario_id in get_group_members(group_id) if cluster.is_online(usuario_id)]
+
+
+def invalidate_group_members(*group_ids):
+    """Descarta los miembros en memoria de los grupos, en este y en los demás workers"""
+    for group_id in group_ids:
+        group_members_index.invalidate(group_id)
+    cluster.publish("group_members_invalidate", [int(group_id) for group_id in group_ids])
+
+
+cluster.on("group_members_invalidate", lambda ids: [group_members_index.invalidate(g) for g in ids])
+
+
+def recheck_group_member(group_id, user_id):
+    """
+    Tras un leave_group: si el índice aún tiene al usuario como miembro pero en
+    la BD ya no está activo (salió o lo sacaron), se quita en todos los workers
+    para que deje de recibir el fan-out del grupo.
+    """
+    members = group_members_index.cached_members(group_id)
+    if members is None or int(user_id) not in members:
+        return
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            
             cursor.execute("""
                 SELECT usuario_id
                 FROM miembros_grupo
-                WHERE grupo_id = %s 
+                WHERE grupo_id = %s
+                AND usuario_id = %s
                 AND estado_membresia = 'activo'
-            """, (int(group_id),))
-            
-            miembros = cursor.fetchall()
-            return [str(m["usuario_id"]) for m in miembros]
-            
+            """, (int(group_id), int(user_id)))
+            if cursor.fetchone() is not None:
+                return
     except Exception as e:
-        print(f"[DB-ERROR] get_group_members: {e}")
-        return []
+        log("DB-ERROR", f"recheck_group_member: {e}")
+        return
+    group_members_index.remove_member(group_id, user_id)
+    cluster.publish("group_member_removed", {"group_id": int(group_id), "user_id": int(user_id)})
 
 
-def get_user_info(user_id):
-    """Obtiene nombre, apellido y correo de un usuario"""
+cluster.on("group_member_removed", lambda p: group_members_index.remove_member(p["group_id"], p["user_id"]))
+
+
+def _build_user_info(usuario):
+    """Construye el dict de perfil a partir de una fila de usuarios"""
+    nombre_completo = f"{usuario['nombre']} {usuario['apellido_paterno']}"
+    if usuario['apellido_materno']:
+        nombre_completo += f" {usuario['apellido_materno']}"
+    
+    return {
+        "id": usuario["id"],
+        "nombre_completo": nombre_completo,
+        "correo": usuario["correo_institucional"],
+        "nombre": usuario["nombre"],
+        "apellido_paterno": usuario["apellido_paterno"],
+        "apellido_materno": usuario["apellido_materno"]
+    }
+
+
+def cache_user_info(usuario):
+    """Guarda en caché el perfil de una fila de usuarios y lo retorna"""
+    info = _build_user_info(usuario)
+    user_cache.set(int(info["id"]), info)
+    return info
+
+
+def _drop_user_info(user_ids):
+    if not user_ids:
+        user_cache.clear()
+        return
+    for user_id in user_ids:
+        user_cache.pop(int(user_id))
+
+
+def invalidate_user_info(*user_ids):
+    """Descarta perfiles en caché (todos si no se indican IDs), en este y en los demás workers"""
+    _drop_user_info(user_ids)
+    cluster.publish("user_info_invalidate", [int(user_id) for user_id in user_ids])
+
+
+cluster.on("user_info_invalidate", _drop_user_info)
+
+
+def get_users_info(user_ids):
+    """Obtiene perfiles de varios usuarios con una sola consulta para los que no están en caché"""
+    resultado = {}
+    faltantes = []
+    for user_id in {int(uid) for uid in user_ids}:
+        info = user_cache.get(user_id)
+        if info:
+            resultado[user_id] = info
+        else:
+            faltantes.append(user_id)
+    
+    if not faltantes:
+        return resultado
+    
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
-            cursor.execute("""
+            placeholders = ", ".join(["%s"] * len(faltantes))
+            cursor.execute(f"""
                 SELECT 
                     id,
                     nombre,
@@ -314,34 +1248,65 @@ def get_user_info(user_id):
                     apellido_materno,
                     correo_institucional
                 FROM usuarios
-                WHERE id = %s
-            """, (int(user_id),))
+                WHERE id IN ({placeholders})
+            """, faltantes)
             
-            usuario = cursor.fetchone()
-            if usuario:
-                # Construir nombre completo
-                nombre_completo = f"{usuario['nombre']} {usuario['apellido_paterno']}"
-                if usuario['apellido_materno']:
-                    nombre_completo += f" {usuario['apellido_materno']}"
-                
-                return {
-                    "id": usuario["id"],
-                    "nombre_completo": nombre_completo,
-                    "correo": usuario["correo_institucional"],
-                    "nombre": usuario["nombre"],
-                    "apellido_paterno": usuario["apellido_paterno"],
-                    "apellido_materno": usuario["apellido_materno"]
-                }
-            return None
+            for usuario in cursor.fetchall():
+                resultado[int(usuario["id"])] = cache_user_info(usuario)
             
     except Exception as e:
-        print(f"[DB-ERROR] get_user_info: {e}")
+        log("DB-ERROR", f"get_users_info: {e}")
+    
+    return resultado
+
+
+def get_user_info(user_id, cursor=None):
+    """Obtiene nombre, apellido y correo de un usuario"""
+    info = user_cache.get(int(user_id))
+    if info:
+        return info
+    
+    try:
+        if cursor is None:
+            with get_db_connection() as conn:
+                return get_user_info(user_id, conn.cursor())
+        
+        cursor.execute("""
+            SELECT 
+                id,
+                nombre,
+                apellido_paterno,
+                apellido_materno,
+                correo_institucional
+            FROM usuarios
+            WHERE id = %s
+        """, (int(user_id),))
+        
+        usuario = cursor.fetchone()
+        if usuario:
+            return cache_user_info(usuario)
         return None
+            
+    except Exception as e:
+        log("DB-ERROR", f"get_user_info: {e}")
+        return None
+
+
+def warm_group_profiles(group_id):
+    """Precarga en caché los perfiles de todos los miembros de un grupo"""
+    miembros = get_group_members(group_id)
+    if miembros:
+        get_users_info(miembros)
 
 
 def verify_user_in_group(user_id, group_id):
     """Verifica si un usuario es miembro activo de un grupo"""
     try:
+        if int(user_id) in group_members_index.members(group_id, load_group_members):
+            return True
+        
+        # Un negativo puede venir de un índice cargado antes de que se uniera
+        group_members_index.negative_rechecks += 1
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
@@ -353,13 +1318,18 @@ def verify_user_in_group(user_id, group_id):
                 AND estado_membresia = 'activo'
             """, (int(group_id), int(user_id)))
             
-            return cursor.fetchone() is not None
+            if cursor.fetchone() is None:
+                return False
+        
+        group_members_index.add_member(group_id, user_id)
+        return True
             
     except Exception as e:
-        print(f"[DB-ERROR] verify_user_in_group: {e}")
+        log("DB-ERROR", f"verify_user_in_group: {e}")
         # Permitir la conexión incluso si falla la BD
         # El usuario ya fue autenticado en la API
-        print(f"[WARN] Permitiendo acceso al grupo por error de BD: user_id={user_id}, group_id={group_id}")
+        log("WARN", f"Permitiendo acceso al grupo por error de BD: user_id={user_id}, group_id={group_id}")
+        metrics.inc("offline_fallbacks_total", "group_membership")
         return True
 
 
@@ -373,10 +1343,119 @@ def health_check():
         "status": "ok",
         "service": "websocket_upred",
         "database": "MySQL",
-        "connected_users": len(connected_users)
+        "connected_users": presence.user_count(),
+        "connections": len(presence),
+        "cluster": cluster.stats(),
+        "db_pool": db_pool.stats(),
+        "db_breaker": db_breaker.stats() if db_breaker else None,
+        "room_cache": room_registry.stats(),
+        "user_cache": user_cache.stats(),
+        "group_members": group_members_index.stats(),
+        "event_log": event_log.stats(),
+        "write_behind": message_writer.stats() if message_writer else None,
+        "receipts": receipt_writer.stats() if receipt_writer else None,
+        "history_buffer": history_buffer.stats() if history_buffer else None,
+        "offline_spool": offline_spool.stats() if offline_spool else None,
+        "traffic_recorder": traffic_recorder.stats() if traffic_recorder else None
     }, 200
 
 
+def _socketio_rooms():
+    """Rooms con miembros en este worker, sin contar la room propia de cada sid"""
+    namespace = socketio.server.manager.rooms.get("/", {})
+    return max(0, len(namespace) - (1 if None in namespace else 0) - len(namespace.get(None, ())))
+
+
+def _cache_stats():
+    caches = {f"room_{index}": stats for index, stats in room_registry.stats().items()}
+    caches["user"] = user_cache.stats()
+    caches["group_members"] = group_members_index.stats()
+    if history_buffer is not None:
+        caches["history"] = history_buffer.stats()
+    return caches
+
+
+metrics.gauge("connections", "Conexiones Socket.IO en este worker", lambda: len(presence))
+metrics.gauge("users_online", "Usuarios con al menos una conexión en este worker", presence.user_count)
+metrics.gauge("cluster_users_online", "Usuarios conectados en todos los workers", lambda: len(cluster.online_users()))
+metrics.gauge("rooms", "Rooms Socket.IO con miembros en este worker", _socketio_rooms)
+metrics.gauge("db_pool_connections", "Conexiones del pool por estado", lambda: {
+    state: db_pool.stats()[state] for state in ("in_use", "idle", "waiting", "max_size")
+}, "state")
+metrics.gauge("db_pool_checkouts_total", "Conexiones entregadas por el pool", lambda: db_pool.stats()["checkouts"], kind="counter")
+metrics.gauge("db_pool_timeouts_total", "Esperas del pool que vencieron", lambda: db_pool.stats()["timeouts"], kind="counter")
+if db_breaker is not None:
+    metrics.gauge("db_circuit_state", "Estado del circuit breaker de MySQL (1 = estado actual)",
+                  lambda: {state: int(db_breaker.state == state) for state in ("closed", "half_open", "open")}, "state")
+    metrics.gauge("db_circuit_opened_total", "Veces que el circuit breaker se abrió", lambda: db_breaker.opened, kind="counter")
+    metrics.gauge("db_circuit_rejected_total", "Consultas rechazadas sin conectar con el circuito abierto", lambda: db_breaker.rejected, kind="counter")
+    metrics.gauge("db_circuit_probes_total", "Pruebas de salud hechas con el circuito abierto", lambda: db_breaker.probes, kind="counter")
+metrics.gauge("cache_hits_total", "Aciertos por caché", lambda: {name: c["hits"] for name, c in _cache_stats().items()}, "cache", kind="counter")
+metrics.gauge("cache_misses_total", "Fallos por caché", lambda: {name: c["misses"] for name, c in _cache_stats().items()}, "cache", kind="counter")
+metrics.gauge("cache_hit_ratio", "Proporción de aciertos por caché", lambda: {name: c["hit_ratio"] for name, c in _cache_stats().items()}, "cache")
+metrics.gauge("log_events_dropped_total", "Eventos de log descartados con la cola llena", lambda: event_log.dropped, kind="counter")
+if offline_spool is not None:
+    metrics.gauge("offline_spool_messages", "Mensajes offline en el spool sin guardar en BD", offline_spool.depth)
+    metrics.gauge("offline_spool_appended_total", "Mensajes offline agregados al spool", lambda: offline_spool.appended, kind="counter")
+    metrics.gauge("offline_spool_replayed_total", "Mensajes del spool guardados en BD", lambda: offline_spool.replayed, kind="counter")
+    metrics.gauge("offline_spool_rejected_total", "Mensajes del spool rechazados por la BD o con línea dañada (en cuarentena)", lambda: offline_spool.rejected, kind="counter")
+    metrics.gauge("offline_spool_duplicates_total", "Mensajes del spool que ya estaban en BD (lote repetido)", lambda: offline_spool.duplicates, kind="counter")
+    metrics.gauge("offline_spool_replay_errors_total", "Intentos de replay fallidos (BD aún caída)", lambda: offline_spool.replay_errors, kind="counter")
+    metrics.gauge("offline_spool_dropped_total", "Mensajes offline que no se pudieron escribir en el spool", lambda: offline_spool.dropped, kind="counter")
+if traffic_recorder is not None:
+    metrics.gauge("traffic_events_dropped_total", "Eventos no grabados con la cola del grabador llena", lambda: traffic_recorder.dropped, kind="counter")
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@app.route("/cache/invalidate", methods=["POST"])
+def cache_invalidate():
+    """
+    Descarta datos en caché que cambiaron fuera de este servidor, en todos los
+    workers vía cluster. Lo llama el backend al editar perfiles (user_ids), al
+    editar o borrar mensajes (sala_uuids: historial reciente de esas salas) y
+    al cambiar miembros de grupos (group_ids).
+
+    Body: {"user_ids": ["123", ...], "sala_uuids": ["uuid", ...], "group_ids": ["7", ...]}
+    """
+    token = settings.cache_invalidate_token
+    if not token or not hmac.compare_digest(request.headers.get("X-Invalidate-Token", ""), token):
+        return jsonify({"error": "No autorizado"}), 403
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body JSON requerido"}), 400
+    user_ids = data.get("user_ids") or []
+    sala_uuids = data.get("sala_uuids") or []
+    group_ids = data.get("group_ids") or []
+    if not all(isinstance(ids, list) for ids in (user_ids, sala_uuids, group_ids)):
+        return jsonify({"error": "user_ids, sala_uuids y group_ids deben ser listas"}), 400
+    if not user_ids and not sala_uuids and not group_ids:
+        return jsonify({"error": "user_ids, sala_uuids o group_ids es requerido"}), 400
+    try:
+        user_ids = [int(user_id) for user_id in user_ids]
+        group_ids = [int(group_id) for group_id in group_ids]
+    except (TypeError, ValueError):
+        return jsonify({"error": "user_ids y group_ids deben ser listas de IDs numéricos"}), 400
+
+    if user_ids:
+        invalidate_user_info(*user_ids)
+    for sala_uuid in sala_uuids:
+        invalidate_room_history(str(sala_uuid))
+    if group_ids:
+        invalidate_group_members(*group_ids)
+    log("CACHE_INVALIDATE", usuarios=len(user_ids), salas=len(sala_uuids), grupos=len(group_ids))
+    return jsonify({
+        "status": "ok",
+        "user_ids": len(user_ids),
+        "sala_uuids": len(sala_uuids),
+        "group_ids": len(group_ids)
+    }), 200
+
+
 @app.route("/upload/image", methods=["POST"])
 def upload_image():
     """Sube imagen a Cloudinary y retorna la URL. Usar antes de enviar mensaje de tipo imagen."""
@@ -392,7 +1471,8 @@ def upload_image():
         return jsonify({"error": "La imagen no debe superar 10MB"}), 400
 
     try:
-        url = upload_chat_image(file_bytes)
+        # urllib3 usa sockets verdes: se acota con el semáforo sin pasar por tpool
+        url = blocking_executor.run_green(upload_chat_image, file_bytes)
         return jsonify({"url": url}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 500
@@ -400,31 +1480,42 @@ def upload_image():
         return jsonify({"error": f"Error al subir imagen: {str(e)}"}), 500
 
 
-@socketio.on("connect")
+@socket_event("connect")
 def on_connect(auth=None):
     """Maneja nuevas conexiones de usuarios"""
     user_id = request.args.get("user_id")
 
     if not user_id:
-        print("[CONNECT-ERROR] Conexión rechazada: falta user_id en query params")
+        log("CONNECT-ERROR", "Conexión rechazada: falta user_id en query params")
         return False
     
     # Validación básica del user_id
     user_id = str(user_id).strip()
     if len(user_id) == 0 or len(user_id) > 100:
-        print(f"[CONNECT-ERROR] user_id inválido: longitud={len(user_id)}")
+        log("CONNECT-ERROR", f"user_id inválido: longitud={len(user_id)}")
         return False
 
     # Unir al usuario a su room personal
     join_room(user_id)
     
-    # Registrar usuario conectado
-    connected_users[user_id] = {
-        "sid": request.sid,
-        "rooms": [user_id]
-    }
+    # Registrar la conexión; la presencia global cambia solo con la primera
+    if presence.connect(request.sid, user_id):
+        cluster.user_connected(user_id)
+    presence.join(request.sid, user_id)
     
-    print(f"[CONNECT] user_id={user_id} | sid={request.sid} | unido a room='{user_id}'")
+    log("CONNECT", user_id=user_id, sid=request.sid, room=user_id)
+
+    # Restaurar las salas del usuario (se puede desactivar con ?rejoin=0)
+    rooms = []
+    if settings.auto_rejoin_rooms and user_id.isdigit() and request.args.get("rejoin") != "0":
+        for sala in get_user_rooms(user_id):
+            summary = room_summary(sala, user_id)
+            join_room(summary["room"])
+            presence.join(request.sid, summary["room"])
+            rooms.append(summary)
+        log("REJOIN", user_id=user_id, salas=len(rooms))
+        if traffic_recorder is not None and rooms:
+            traffic_recorder.note(request.sid, "connected", sala_uuid=[room["sala_uuid"] for room in rooms])
 
     emit(
         "connected",
@@ -432,25 +1523,23 @@ def on_connect(auth=None):
             "status": "connected",
             "user_id": user_id,
             "sid": request.sid,
+            "rooms": rooms,
         },
     )
 
 
-@socketio.on("disconnect")
-def on_disconnect():
+@socket_event("disconnect")
+def on_disconnect(reason=None):
     """Maneja desconexión de usuarios"""
-    # Buscar y eliminar usuario de connected_users
-    user_id = None
-    for uid, data in list(connected_users.items()):
-        if data["sid"] == request.sid:
-            user_id = uid
-            del connected_users[uid]
-            break
+    session, last = presence.disconnect(request.sid)
+    user_id = session.user_id if session else None
+    if last:
+        cluster.user_disconnected(user_id)
     
-    print(f"[DISCONNECT] user_id={user_id} | sid={request.sid}")
+    log("DISCONNECT", user_id=user_id, sid=request.sid)
 
 
-@socketio.on("join_direct_chat")
+@socket_event("join_direct_chat")
 def on_join_direct_chat(data):
     """
     Une al usuario a una sala de chat directo
@@ -484,12 +1573,16 @@ def on_join_direct_chat(data):
     room_name = f"chat_{sala_chat['sala_uuid']}"
     join_room(room_name)
     
-    # Actualizar rooms del usuario
-    if user_id in connected_users:
-        if room_name not in connected_users[user_id]["rooms"]:
-            connected_users[user_id]["rooms"].append(room_name)
+    # Actualizar rooms de la conexión
+    presence.join(request.sid, room_name)
 
-    print(f"[JOIN_DIRECT_CHAT] user_id={user_id} | other_user_id={other_user_id} | room={room_name}")
+    log("JOIN_DIRECT_CHAT", user_id=user_id, other_user_id=other_user_id, room=room_name)
+    if traffic_recorder is not None:
+        traffic_recorder.note(request.sid, "direct_chat_joined", sala_uuid=sala_chat["sala_uuid"])
+
+    # Precargar ambos perfiles en una sola consulta (omitida si ya están en caché)
+    if user_id.isdigit() and other_user_id.isdigit():
+        socketio.start_background_task(get_users_info, [user_id, other_user_id])
 
     emit(
         "direct_chat_joined",
@@ -503,7 +1596,7 @@ def on_join_direct_chat(data):
     )
 
 
-@socketio.on("join_group")
+@socket_event("join_group")
 def on_join_group(data):
     """
     Une al usuario a un chat grupal
@@ -542,12 +1635,15 @@ def on_join_group(data):
     room_name = f"group_{sala_chat['sala_uuid']}"
     join_room(room_name)
     
-    # Actualizar rooms del usuario
-    if user_id in connected_users:
-        if room_name not in connected_users[user_id]["rooms"]:
-            connected_users[user_id]["rooms"].append(room_name)
+    # Actualizar rooms de la conexión
+    presence.join(request.sid, room_name)
+
+    log("JOIN_GROUP", user_id=user_id, group_id=group_id, room=room_name)
+    if traffic_recorder is not None:
+        traffic_recorder.note(request.sid, "group_joined", sala_uuid=sala_chat["sala_uuid"])
 
-    print(f"[JOIN_GROUP] user_id={user_id} | group_id={group_id} | room={room_name}")
+    # Precargar perfiles de los miembros sin retrasar la respuesta
+    socketio.start_background_task(warm_group_profiles, group_id)
 
     # Notificar al grupo que un usuario se unió
     emit(
@@ -573,7 +1669,84 @@ def on_join_group(data):
     )
 
 
-@socketio.on("leave_group")
+@socket_event("join_rooms")
+def on_join_rooms(data):
+    """
+    Une al usuario a varias salas de una vez
+    
+    Formato esperado:
+    {
+        "other_user_ids": ["123", "124"],
+        "group_ids": ["456"]
+    }
+    """
+    if not isinstance(data, dict):
+        emit("error", {"message": "Payload inválido para join_rooms"})
+        return
+
+    user_id = request.args.get("user_id", "unknown")
+    other_user_ids = data.get("other_user_ids") or []
+    group_ids = data.get("group_ids") or []
+
+    if not isinstance(other_user_ids, list) or not isinstance(group_ids, list):
+        emit("error", {"message": "other_user_ids y group_ids deben ser listas"})
+        return
+    if not other_user_ids and not group_ids:
+        emit("error", {"message": "other_user_ids o group_ids es requerido"})
+        return
+    if len(other_user_ids) + len(group_ids) > MAX_JOIN_ROOMS:
+        emit("error", {"message": f"Máximo {MAX_JOIN_ROOMS} salas por join_rooms"})
+        return
+    try:
+        user_id_int = int(user_id)
+        other_user_ids = list(dict.fromkeys(int(other_id) for other_id in other_user_ids))
+        group_ids = list(dict.fromkeys(int(group_id) for group_id in group_ids))
+    except (TypeError, ValueError):
+        emit("error", {"message": "user_id, other_user_ids y group_ids deben ser numéricos"})
+        return
+    other_user_ids = [other_id for other_id in other_user_ids if other_id != user_id_int]
+
+    directas, grupales, denegados = get_or_create_rooms(user_id, other_user_ids, group_ids)
+
+    rooms = []
+    for sala in list(directas.values()) + list(grupales.values()):
+        summary = room_summary(sala, user_id)
+        join_room(summary["room"])
+        presence.join(request.sid, summary["room"])
+        rooms.append(summary)
+
+    # Mismo aviso que join_group en cada grupo
+    for group_id, sala in grupales.items():
+        emit(
+            "user_joined_group",
+            {
+                "user_id": user_id,
+                "group_id": str(group_id),
+                "sala_uuid": sala["sala_uuid"]
+            },
+            room=f"group_{sala['sala_uuid']}",
+            include_self=False
+        )
+
+    log("JOIN_ROOMS", user_id=user_id, directas=len(directas), grupos=len(grupales), denegados=len(denegados))
+    if traffic_recorder is not None and rooms:
+        traffic_recorder.note(request.sid, "rooms_joined", sala_uuid=[room["sala_uuid"] for room in rooms])
+
+    # Precargar perfiles de los contactos en una sola consulta
+    if directas:
+        socketio.start_background_task(get_users_info, [user_id, *directas])
+
+    emit(
+        "rooms_joined",
+        {
+            "status": "ok",
+            "rooms": rooms,
+            "denied_group_ids": [str(group_id) for group_id in denegados]
+        },
+    )
+
+
+@socket_event("leave_group")
 def on_leave_group(data):
     """
     Saca al usuario de un chat grupal
@@ -603,9 +1776,8 @@ def on_leave_group(data):
         room_name = f"group_{sala_chat['sala_uuid']}"
         leave_room(room_name)
         
-        # Actualizar rooms del usuario
-        if user_id in connected_users and room_name in connected_users[user_id]["rooms"]:
-            connected_users[user_id]["rooms"].remove(room_name)
+        # Actualizar rooms de la conexión
+        presence.leave(request.sid, room_name)
         
         # Notificar al grupo que un usuario salió
         emit(
@@ -617,7 +1789,11 @@ def on_leave_group(data):
             room=room_name
         )
     
-    print(f"[LEAVE_GROUP] user_id={user_id} | group_id={group_id}")
+    log("LEAVE_GROUP", user_id=user_id, group_id=group_id)
+    
+    # Si el cliente sale porque dejó el grupo, actualizar el índice de miembros
+    if user_id.isdigit() and group_id.isdigit():
+        socketio.start_background_task(recheck_group_member, group_id, user_id)
 
     emit(
         "group_left",
@@ -628,77 +1804,99 @@ def on_leave_group(data):
     )
 
 
-@socketio.on("send_direct_message")
-def on_send_direct_message(data):
-    """Compatibilidad con clientes que usan send_direct_message"""
+def legacy_send_payload(data, target_field, chat_type):
+    """
+    Traduce un payload de send_direct_message / send_group_message al de
+    send_message. Retorna (payload, None) o (None, mensaje de error).
+    """
     if not isinstance(data, dict):
-        emit("error", {"message": "Payload inválido"})
-        return
+        return None, "Payload inválido"
 
     sender_id = data.get("sender_id")
-    recipient_id = data.get("recipient_id")
+    target = data.get(target_field)
     content = data.get("content")
     file_url = data.get("file_url")
-    message_type = data.get("type", "texto")
-    timestamp = data.get("timestamp") or datetime.utcnow().isoformat()
 
-    if not sender_id or not recipient_id:
-        emit("error", {"message": "sender_id y recipient_id son requeridos"})
-        return
+    if not sender_id or not target:
+        return None, f"sender_id y {target_field} son requeridos"
 
     if not content and not file_url:
-        emit("error", {"message": "content o file_url es requerido"})
-        return
+        return None, "content o file_url es requerido"
 
-    payload = {
-        "to": str(recipient_id),
+    return {
+        "to": str(target),
         "message": content,
         "sender_id": str(sender_id),
-        "timestamp": timestamp,
-        "type": "directo",
-        "message_type": message_type,
+        "timestamp": data.get("timestamp") or datetime.utcnow().isoformat(),
+        "type": chat_type,
+        "message_type": data.get("type", "texto"),
         "url_archivo": file_url
-    }
+    }, None
+
+
+@socket_event("send_direct_message")
+def on_send_direct_message(data):
+    """Compatibilidad con clientes que usan send_direct_message"""
+    payload, error = legacy_send_payload(data, "recipient_id", "directo")
+    if error:
+        emit("error", {"message": error})
+        return
 
     on_send_message(payload)
 
 
-@socketio.on("send_group_message")
+@socket_event("send_group_message")
 def on_send_group_message(data):
     """Compatibilidad con clientes que usan send_group_message"""
-    if not isinstance(data, dict):
-        emit("error", {"message": "Payload inválido"})
+    payload, error = legacy_send_payload(data, "group_id", "grupal")
+    if error:
+        emit("error", {"message": error})
         return
 
-    sender_id = data.get("sender_id")
-    group_id = data.get("group_id")
-    content = data.get("content")
-    file_url = data.get("file_url")
-    message_type = data.get("type", "texto")
-    timestamp = data.get("timestamp") or datetime.utcnow().isoformat()
+    on_send_message(payload)
 
-    if not sender_id or not group_id:
-        emit("error", {"message": "sender_id y group_id son requeridos"})
-        return
 
-    if not content and not file_url:
-        emit("error", {"message": "content o file_url es requerido"})
-        return
+# Valores aceptados en send_message
+MESSAGE_TYPES = ("texto", "imagen", "archivo", "audio", "sistema")
+CHAT_TYPES = ("directo", "grupal")
 
-    payload = {
-        "to": str(group_id),
-        "message": content,
-        "sender_id": str(sender_id),
-        "timestamp": timestamp,
-        "type": "grupal",
-        "message_type": message_type,
-        "url_archivo": file_url
+
+def parse_send_message(data):
+    """
+    Valida y normaliza un payload de send_message.
+    Retorna (campos, None) o (None, mensaje de error para el ack).
+    """
+    if not isinstance(data, dict):
+        return None, "Payload inválido"
+
+    missing = [field for field in ("message", "sender_id", "timestamp", "type") if field not in data]
+    if missing:
+        return None, f"Faltan campos: {', '.join(missing)}"
+
+    campos = {
+        "sala_uuid": data.get("sala_uuid"),
+        "to": data.get("to"),
+        "sender_id": str(data["sender_id"]),
+        "chat_type": str(data["type"]).lower(),
+        "message_type": str(data.get("message_type", "texto")).lower(),
+        "content": data["message"],
+        "url_archivo": data.get("url_archivo"),
+        "timestamp": data["timestamp"],
     }
 
-    on_send_message(payload)
+    if not campos["sala_uuid"] and not campos["to"]:
+        return None, "sala_uuid o to es requerido"
+
+    if campos["message_type"] not in MESSAGE_TYPES:
+        return None, f"message_type debe ser uno de: {', '.join(MESSAGE_TYPES)}"
+
+    if campos["chat_type"] not in CHAT_TYPES:
+        return None, "type debe ser 'directo' o 'grupal'"
+
+    return campos, None
 
 
-@socketio.on("send_message")
+@socket_event("send_message")
 def on_send_message(data):
     """
     Maneja el envío de mensajes (directo o grupal) y los guarda en la BD
@@ -714,53 +1912,27 @@ def on_send_message(data):
         "url_archivo": "https://..." (opcional)
     }
     """
-    if not isinstance(data, dict):
-        emit("ack", {"status": "error", "message": "Payload inválido"})
-        return
-
-    missing = [field for field in ["message", "sender_id", "timestamp", "type"] if field not in data]
-    if missing:
-        emit("ack", {"status": "error", "message": f"Faltan campos: {', '.join(missing)}"})
-        return
-
-    # Normalizar datos
-    sala_uuid = data.get("sala_uuid")
-    to_value = data.get("to")
-    sender_id = str(data["sender_id"])
-    chat_type = str(data["type"]).lower()
-    message_type = str(data.get("message_type", "texto")).lower()
-    message_content = data["message"]
-    url_archivo = data.get("url_archivo")
-    timestamp = data["timestamp"]
-
-    if not sala_uuid and not to_value:
-        emit("ack", {"status": "error", "message": "sala_uuid o to es requerido"})
-        return
-
-    # Validar tipo de mensaje
-    valid_message_types = ["texto", "imagen", "archivo", "audio", "sistema"]
-    if message_type not in valid_message_types:
-        emit("ack", {
-            "status": "error",
-            "message": f"message_type debe ser uno de: {', '.join(valid_message_types)}"
-        })
-        return
-
-    # Validar tipo de chat
-    if chat_type not in ["directo", "grupal"]:
-        emit("ack", {
-            "status": "error",
-            "message": "type debe ser 'directo' o 'grupal'"
-        })
+    campos, error = parse_send_message(data)
+    if error:
+        emit("ack", {"status": "error", "message": error})
         return
 
-    print(
-        "[SEND_MESSAGE] "
-        f"from={sender_id} "
-        f"sala_uuid={sala_uuid} "
-        f"type={chat_type} "
-        f"message_type={message_type} "
-        f"timestamp={timestamp}"
+    sala_uuid = campos["sala_uuid"]
+    to_value = campos["to"]
+    sender_id = campos["sender_id"]
+    chat_type = campos["chat_type"]
+    message_type = campos["message_type"]
+    message_content = campos["content"]
+    url_archivo = campos["url_archivo"]
+    timestamp = campos["timestamp"]
+
+    log(
+        "SEND_MESSAGE",
+        sender_id=sender_id,
+        sala_uuid=sala_uuid,
+        type=chat_type,
+        message_type=message_type,
+        timestamp=timestamp,
     )
 
     # Resolver sala_uuid si viene el campo legacy 'to'
@@ -781,36 +1953,38 @@ def on_send_message(data):
 
     sala_uuid = str(sala_uuid)
 
+    envio = {
+        "sala_uuid": sala_uuid,
+        "sender_id": sender_id,
+        "chat_type": chat_type,
+        "message_type": message_type,
+        "content": message_content,
+        "url_archivo": url_archivo,
+        "timestamp": timestamp
+    }
+    metadatos = {
+        "client_timestamp": timestamp,
+        "type": chat_type
+    }
+
     # Intentar guardar en base de datos (fallback si falla)
     mensaje_guardado = None
-    sala_chat_id = None
     db_available = True
+    db_error = False
+    
+    sala_info = None
+    
+    # Con el circuit breaker abierto no se encola: el lote fallaría igual
+    write_behind = message_writer is not None and (db_breaker is None or db_breaker.state == "closed")
     
     try:
-        # Obtener info de la sala desde BD
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT id, tipo_sala, usuario_a_id, usuario_b_id, grupo_id
-                FROM salas_chat
-                WHERE sala_uuid = %s
-            """, (sala_uuid,))
-            sala_info = cursor.fetchone()
-        
-        if not sala_info:
-            print(f"[WARN] Sala no encontrada en BD, usando fallback: {sala_uuid}")
-            db_available = False
+        if write_behind:
+            # Write-behind: solo resolver la sala; el INSERT va en el próximo lote
+            sala_info = get_sala_info(sala_uuid)
         else:
-            sala_chat_id = sala_info["id"]
-            
-            # Guardar mensaje
-            metadatos = {
-                "client_timestamp": timestamp,
-                "type": chat_type
-            }
-            
-            mensaje_guardado = save_message(
-                sala_chat_id,
+            # Resolver sala y guardar mensaje en una sola transacción
+            sala_info, mensaje_guardado = persist_message(
+                sala_uuid,
                 sender_id,
                 message_type,
                 message_content,
@@ -818,89 +1992,265 @@ def on_send_message(data):
                 metadatos
             )
         
+        if not sala_info:
+            log("WARN", f"Sala no encontrada en BD, usando fallback: {sala_uuid}")
+            db_available = False
+        
     except Exception as e:
-        print(f"[WARNING] Error al guardar mensaje en BD: {e}")
-        print(f"[WARN] Usando modo offline - mensaje se enviará sin persistencia")
+        log("WARNING", f"Error al guardar mensaje en BD: {e}")
+        log("WARN", "Usando modo offline - mensaje se enviará sin persistencia")
         db_available = False
+        db_error = True
+    
+    if write_behind and db_available:
+        queue_message(request.sid, envio, sala_info, metadatos)
+        return
     
     # Si falla la BD, generar datos locales para que el mensaje se envíe igualmente
     if not mensaje_guardado:
         if not db_available:
-            print(f"[OFFLINE] Enviando mensaje sin persistencia en BD")
-            # Generar UUID determinístico para el mensaje
-            mensaje_uuid = str(uuid_pkg.uuid5(uuid_pkg.NAMESPACE_DNS, f"offline-{sender_id}-{timestamp}"))
-            mensaje_guardado = {
-                "id": 0,
-                "mensaje_uuid": mensaje_uuid,
-                "enviado_en": datetime.now()
-            }
+            send_offline(request.sid, envio, metadatos, sala_info, spool=db_error)
         else:
             emit("ack", {
                 "status": "error",
                 "message": "No se pudo guardar el mensaje"
             })
-            return
+        return
     
+    dispatch_message(request.sid, envio, mensaje_guardado, sala_info, db_available)
+
+
+def send_offline(sid, envio, metadatos, sala_info=None, spool=True):
+    """
+    Envía el mensaje sin persistencia (id 0 y uuid local). Con `spool` (la BD
+    está caída, no es una sala inexistente) lo guarda en el spool offline para
+    insertarlo cuando MySQL vuelva.
+    """
+    log("OFFLINE", "Enviando mensaje sin persistencia en BD")
+    # UUID único por mensaje: dos envíos con el mismo timestamp del cliente
+    # son mensajes distintos y el spool los deduplica por este valor
+    mensaje_guardado = {
+        "id": 0,
+        "mensaje_uuid": str(uuid_pkg.uuid4()),
+        "enviado_en": datetime.now()
+    }
+    if spool and offline_spool is not None and envio["sender_id"].isdigit():
+        fallback = room_registry.get_fallback(envio["sala_uuid"])
+        offline_spool.append({
+            "mensaje_uuid": mensaje_guardado["mensaje_uuid"],
+            "sala_uuid": envio["sala_uuid"],
+            "chat_type": envio["chat_type"],
+            "sender_id": envio["sender_id"],
+            "tipo_mensaje": envio["message_type"],
+            "contenido": envio["content"],
+            "url_archivo": envio["url_archivo"],
+            "metadatos": json.dumps(metadatos),
+            "enviado_en": mensaje_guardado["enviado_en"].replace(microsecond=0).isoformat(),
+            # Sala de fallback: con qué usuarios o grupo crear la sala real al guardarlo
+            "destino": {
+                k: fallback[k] for k in ("tipo_sala", "usuario_a_id", "usuario_b_id", "grupo_id")
+            } if fallback else None,
+        })
+    dispatch_message(sid, envio, mensaje_guardado, sala_info, False)
+
+
+def build_message_data(envio, mensaje_guardado, db_available):
+    """Arma el payload de receive_message para un mensaje ya guardado (o offline)"""
     # Obtener datos del remitente para incluir en el mensaje
-    sender_info = get_user_info(sender_id)
+    sender_info = get_user_info(envio["sender_id"])
     sender_name = sender_info["nombre_completo"] if sender_info else "Usuario Desconocido"
     sender_email = sender_info["correo"] if sender_info else "desconocido@upred.mx"
     
-    # Preparar datos para emitir
-    message_data = {
-        "from": sender_id,
+    return {
+        "from": envio["sender_id"],
         "sender_name": sender_name,
         "sender_email": sender_email,
-        "message": message_content,
-        "type": chat_type,
-        "message_type": message_type,
-        "timestamp": timestamp,
-        "url_archivo": url_archivo,
+        "message": envio["content"],
+        "type": envio["chat_type"],
+        "message_type": envio["message_type"],
+        "timestamp": envio["timestamp"],
+        "url_archivo": envio["url_archivo"],
         "mensaje_id": str(mensaje_guardado["id"]),
         "mensaje_uuid": str(mensaje_guardado["mensaje_uuid"]),
         "enviado_en": mensaje_guardado["enviado_en"].isoformat() if isinstance(mensaje_guardado["enviado_en"], datetime) else str(mensaje_guardado["enviado_en"]),
-        "sala_uuid": sala_uuid,
+        "sala_uuid": envio["sala_uuid"],
         "offline": not db_available
     }
 
+
+def history_entry(message_data):
+    """Convierte un payload de receive_message al formato de message_history_loaded"""
+    return {
+        "id": message_data["mensaje_id"],
+        "mensaje_uuid": message_data["mensaje_uuid"],
+        "sala_uuid": message_data["sala_uuid"],
+        "from": message_data["from"],
+        "sender_name": message_data["sender_name"],
+        "sender_email": message_data["sender_email"],
+        "message": message_data["message"],
+        "type": message_data["type"],
+        "message_type": message_data["message_type"],
+        "url_archivo": message_data["url_archivo"],
+        "timestamp": message_data["enviado_en"],
+        "enviado_en": message_data["enviado_en"]
+    }
+
+
+def dispatch_message(sid, envio, mensaje_guardado, sala_info, db_available):
+    """
+    Emite el mensaje a la sala (y al room personal del receptor en chats directos)
+    y envía el ack al remitente. Funciona dentro y fuera del contexto de un evento.
+    """
+    message_data = build_message_data(envio, mensaje_guardado, db_available)
+    sala_uuid = envio["sala_uuid"]
+    chat_type = envio["chat_type"]
+    sender_id = envio["sender_id"]
+
+    if history_buffer is not None and db_available and mensaje_guardado["id"]:
+        entry = history_entry(message_data)
+        history_buffer.append(sala_uuid, entry)
+        cluster.publish("history_append", {"sala_uuid": sala_uuid, "entry": entry})
+
     # Determinar el nombre de la room
     room_name = f"chat_{sala_uuid}" if chat_type == "directo" else f"group_{sala_uuid}"
-    
-    # Emitir mensaje a la room (todos los conectados en esa sala)
-    emit("receive_message", message_data, room=room_name)
+    targets = [room_name]
 
     # Garantizar entrega en chat individual al room personal del receptor
     if chat_type == "directo" and db_available and sala_info:
-        recipient_id = None
         usuario_a_id = str(sala_info.get("usuario_a_id")) if sala_info.get("usuario_a_id") is not None else None
         usuario_b_id = str(sala_info.get("usuario_b_id")) if sala_info.get("usuario_b_id") is not None else None
         if usuario_a_id and usuario_b_id:
-            recipient_id = usuario_b_id if sender_id == usuario_a_id else usuario_a_id
-        if recipient_id:
-            emit("receive_message", message_data, room=recipient_id)
+            targets.append(usuario_b_id if sender_id == usuario_a_id else usuario_a_id)
+    
+    # Con fan-out, también a los miembros conectados que no hicieron join_group
+    if chat_type == "grupal" and settings.group_fanout_personal and sala_info and sala_info.get("grupo_id"):
+        targets.extend(group_fanout_rooms(sala_info["grupo_id"]))
+    
+    # Un solo emit a la unión de rooms: se codifica una vez y cada socket
+    # recibe una copia aunque esté en la sala y en su room personal
+    metrics.observe("emit_fanout_rooms", emit_to_rooms(socketio, "receive_message", message_data, targets))
+    if not db_available:
+        metrics.inc("offline_fallbacks_total", "message")
 
-    print(f"[MESSAGE_SENT] mensaje_id={mensaje_guardado['id']} | from={sender_name} | room={room_name} | offline={not db_available}")
+    log("MESSAGE_SENT", mensaje_id=mensaje_guardado["id"], sender_id=sender_id, room=room_name, offline=not db_available)
+    if traffic_recorder is not None:
+        traffic_recorder.note(sid, "ack", mensaje_id=mensaje_guardado["id"])
 
     # Enviar confirmación al remitente
     status_msg = "Mensaje enviado y guardado en BD" if db_available else "Mensaje enviado (sin persistencia)"
-    emit(
+    socketio.emit(
         "ack",
         {
             "status": "sent",
             "sender_id": sender_id,
-            "timestamp": timestamp,
+            "timestamp": envio["timestamp"],
             "type": chat_type,
-            "message_type": message_type,
+            "message_type": envio["message_type"],
             "mensaje_id": str(mensaje_guardado["id"]),
             "mensaje_uuid": str(mensaje_guardado["mensaje_uuid"]),
             "sala_uuid": sala_uuid,
             "offline": not db_available,
             "message": status_msg
         },
+        to=sid,
     )
 
 
-@socketio.on("mark_delivered")
+def queue_message(sid, envio, sala_info, metadatos):
+    """
+    Encola el mensaje en el write-behind. La difusión y el ack se envían
+    cuando el lote que lo contiene queda confirmado en BD.
+    """
+    # remitente_id es numérico en BD: validarlo aquí y no en el lote
+    if not envio["sender_id"].isdigit():
+        socketio.emit("ack", {
+            "status": "error",
+            "message": "sender_id inválido"
+        }, to=sid)
+        return
+
+    pendiente = {
+        "mensaje_uuid": str(uuid_pkg.uuid4()),
+        "sala_chat_id": int(sala_info["id"]),
+        "remitente_id": int(envio["sender_id"]),
+        "tipo_mensaje": envio["message_type"],
+        "contenido": envio["content"],
+        "url_archivo": envio["url_archivo"],
+        "metadatos": json.dumps(metadatos) if metadatos else None,
+        "enviado_en": datetime.now().replace(microsecond=0)
+    }
+
+    def on_commit(mensaje_guardado, error):
+        # Corre en el hilo del BatchWriter: la difusión (que puede consultar
+        # perfiles en BD) va en su propio greenthread para no frenar los lotes
+        if mensaje_guardado and not error:
+            socketio.start_background_task(dispatch_message, sid, envio, mensaje_guardado, sala_info, True)
+        elif error is not None and not is_row_error(error):
+            # BD caída: mismo camino que sin write-behind (envío offline + spool)
+            log("WARNING", f"Lote de mensajes sin guardar, enviando offline: {error}")
+            socketio.start_background_task(send_offline, sid, envio, metadatos, sala_info)
+        else:
+            socketio.emit("ack", {
+                "status": "error",
+                "message": "No se pudo guardar el mensaje"
+            }, to=sid)
+
+    try:
+        message_writer.submit(pendiente, on_commit)
+    except BatchQueueFull:
+        log("WRITE_BEHIND", f"Cola llena, mensaje rechazado: from={envio['sender_id']}")
+        socketio.emit("ack", {
+            "status": "error",
+            "message": "Servidor saturado, intenta de nuevo"
+        }, to=sid)
+
+
+def _parse_mensaje_ids(data):
+    """Valida la lista mensaje_ids de los eventos bulk; retorna None si es inválida"""
+    mensaje_ids = data.get("mensaje_ids")
+    if not isinstance(mensaje_ids, list) or not mensaje_ids or len(mensaje_ids) > MAX_BULK_RECEIPTS:
+        return None
+    try:
+        return list(dict.fromkeys(int(mensaje_id) for mensaje_id in mensaje_ids))
+    except (TypeError, ValueError):
+        return None
+
+
+def record_receipt(sid, mensaje_id, user_id, leido):
+    """
+    Registra una confirmación individual. Con el coalescedor activo se agrupa con
+    las que lleguen en la misma ventana y la confirmación se emite tras el lote.
+    """
+    evento, etiqueta = ("read_confirmed", "MARK_READ") if leido else ("delivery_confirmed", "MARK_DELIVERED")
+    error_msg = "No se pudo marcar el mensaje como leído" if leido else "No se pudo marcar el mensaje como entregado"
+
+    def on_commit(success, error):
+        if success and not error:
+            log(etiqueta, mensaje_id=mensaje_id, user_id=user_id)
+            socketio.emit(evento, {
+                "status": "ok",
+                "mensaje_id": mensaje_id,
+                "user_id": user_id
+            }, to=sid)
+        else:
+            socketio.emit("error", {"message": error_msg}, to=sid)
+
+    if receipt_writer is not None:
+        try:
+            receipt_writer.submit(
+                {"mensaje_id": int(mensaje_id), "destinatario_id": int(user_id), "leido": leido},
+                on_commit
+            )
+            return
+        except BatchQueueFull:
+            # Cola saturada: escribir directamente
+            pass
+
+    success = mark_message_read(mensaje_id, user_id) if leido else mark_message_delivered(mensaje_id, user_id)
+    on_commit(success, None)
+
+
+@socket_event("mark_delivered")
 def on_mark_delivered(data):
     """
     Marca un mensaje como entregado
@@ -923,22 +2273,13 @@ def on_mark_delivered(data):
         return
     
     try:
-        success = mark_message_delivered(mensaje_id, user_id)
-        if success:
-            print(f"[MARK_DELIVERED] mensaje_id={mensaje_id} | user_id={user_id}")
-            emit("delivery_confirmed", {
-                "status": "ok",
-                "mensaje_id": mensaje_id,
-                "user_id": user_id
-            })
-        else:
-            emit("error", {"message": "No se pudo marcar el mensaje como entregado"})
+        record_receipt(request.sid, mensaje_id, user_id, leido=False)
     except Exception as e:
-        print(f"[ERROR] mark_delivered: {e}")
+        log("ERROR", f"mark_delivered: {e}")
         emit("error", {"message": "Error al marcar mensaje como entregado"})
 
 
-@socketio.on("mark_read")
+@socket_event("mark_read")
 def on_mark_read(data):
     """
     Marca un mensaje como leído
@@ -961,128 +2302,386 @@ def on_mark_read(data):
         return
     
     try:
-        success = mark_message_read(mensaje_id, user_id)
-        if success:
-            print(f"[MARK_READ] mensaje_id={mensaje_id} | user_id={user_id}")
-            emit("read_confirmed", {
-                "status": "ok",
-                "mensaje_id": mensaje_id,
-                "user_id": user_id
-            })
-        else:
-            emit("error", {"message": "No se pudo marcar el mensaje como leído"})
+        record_receipt(request.sid, mensaje_id, user_id, leido=True)
     except Exception as e:
-        print(f"[ERROR] mark_read: {e}")
+        log("ERROR", f"mark_read: {e}")
         emit("error", {"message": "Error al marcar mensaje como leído"})
 
 
-@socketio.on("load_message_history")
+@socket_event("mark_delivered_bulk")
+def on_mark_delivered_bulk(data):
+    """
+    Marca varios mensajes como entregados con una sola escritura
+    
+    Formato esperado:
+    {
+        "mensaje_ids": ["123", "124", ...],  (máximo MAX_BULK_RECEIPTS)
+        "user_id": "456"
+    }
+    """
+    if not isinstance(data, dict):
+        emit("error", {"message": "Payload inválido para mark_delivered_bulk"})
+        return
+    
+    mensaje_ids = _parse_mensaje_ids(data)
+    user_id = data.get("user_id")
+    
+    if not mensaje_ids or not user_id:
+        emit("error", {"message": f"mensaje_ids (lista de 1 a {MAX_BULK_RECEIPTS}) y user_id son requeridos"})
+        return
+    
+    if mark_messages_delivered(mensaje_ids, user_id):
+        log("MARK_DELIVERED_BULK", count=len(mensaje_ids), user_id=user_id)
+        emit("delivery_confirmed_bulk", {
+            "status": "ok",
+            "mensaje_ids": [str(mensaje_id) for mensaje_id in mensaje_ids],
+            "user_id": user_id,
+            "count": len(mensaje_ids)
+        })
+    else:
+        emit("error", {"message": "No se pudieron marcar los mensajes como entregados"})
+
+
+@socket_event("mark_read_bulk")
+def on_mark_read_bulk(data):
+    """
+    Marca varios mensajes como leídos con una sola escritura
+    
+    Formato esperado:
+    {
+        "mensaje_ids": ["123", "124", ...],  (máximo MAX_BULK_RECEIPTS)
+        "user_id": "456"
+    }
+    """
+    if not isinstance(data, dict):
+        emit("error", {"message": "Payload inválido para mark_read_bulk"})
+        return
+    
+    mensaje_ids = _parse_mensaje_ids(data)
+    user_id = data.get("user_id")
+    
+    if not mensaje_ids or not user_id:
+        emit("error", {"message": f"mensaje_ids (lista de 1 a {MAX_BULK_RECEIPTS}) y user_id son requeridos"})
+        return
+    
+    if mark_messages_read(mensaje_ids, user_id):
+        log("MARK_READ_BULK", count=len(mensaje_ids), user_id=user_id)
+        emit("read_confirmed_bulk", {
+            "status": "ok",
+            "mensaje_ids": [str(mensaje_id) for mensaje_id in mensaje_ids],
+            "user_id": user_id,
+            "count": len(mensaje_ids)
+        })
+    else:
+        emit("error", {"message": "No se pudieron marcar los mensajes como leídos"})
+
+
+@socket_event("mark_room_read_until")
+def on_mark_room_read_until(data):
+    """
+    Marca como leídos todos los mensajes de una sala hasta mensaje_id (inclusive)
+    
+    Formato esperado:
+    {
+        "sala_uuid": "uuid-de-la-sala",
+        "mensaje_id": "123",
+        "user_id": "456"  (opcional, default: user_id de la conexión)
+    }
+    """
+    if not isinstance(data, dict):
+        emit("error", {"message": "Payload inválido para mark_room_read_until"})
+        return
+    
+    sala_uuid = data.get("sala_uuid")
+    mensaje_id = data.get("mensaje_id")
+    user_id = data.get("user_id") or request.args.get("user_id")
+    
+    if not sala_uuid or not mensaje_id or not user_id:
+        emit("error", {"message": "sala_uuid, mensaje_id y user_id son requeridos"})
+        return
+    
+    try:
+        affected = mark_room_read_until(str(sala_uuid), mensaje_id, user_id)
+    except Exception as e:
+        log("ERROR", f"mark_room_read_until: {e}")
+        emit("error", {"message": "Error al marcar la sala como leída"})
+        return
+    
+    if affected is None:
+        emit("error", {"message": "Sala no encontrada"})
+        return
+    
+    log("MARK_ROOM_READ", sala_uuid=sala_uuid, hasta=mensaje_id, user_id=user_id, afectados=affected)
+    
+    emit("room_read_confirmed", {
+        "status": "ok",
+        "sala_uuid": str(sala_uuid),
+        "mensaje_id": mensaje_id,
+        "user_id": user_id,
+        "affected": affected
+    })
+
+
+def build_history_query(sala_chat_id, limit, before_id=None, after_id=None):
+    """
+    Arma la consulta paginada por keyset sobre (enviado_en, id).
+
+    Sin cursor trae los más recientes; con before_id, los anteriores a ese mensaje;
+    con after_id, los posteriores. Pide limit + 1 filas para saber si hay más.
+    Retorna (sql, params, descendente).
+    """
+    cursor_id = before_id if before_id is not None else after_id
+    descendente = after_id is None
+    
+    cursor_join = ""
+    cursor_filter = ""
+    params = []
+    if cursor_id is not None:
+        cursor_join = "JOIN mensajes c ON c.id = %s AND c.sala_chat_id = m.sala_chat_id"
+        params.append(int(cursor_id))
+        if before_id is not None:
+            cursor_filter = """
+                AND m.enviado_en <= c.enviado_en
+                AND (m.enviado_en < c.enviado_en OR m.id < c.id)"""
+        else:
+            cursor_filter = """
+                AND m.enviado_en >= c.enviado_en
+                AND (m.enviado_en > c.enviado_en OR m.id > c.id)"""
+    
+    orden = "DESC" if descendente else "ASC"
+    sql = f"""
+        SELECT 
+            m.id,
+            m.mensaje_uuid,
+            m.sala_chat_id,
+            m.remitente_id,
+            m.tipo_mensaje,
+            m.contenido,
+            m.url_archivo,
+            m.metadatos,
+            m.enviado_en,
+            u.nombre,
+            u.apellido_paterno,
+            u.apellido_materno,
+            u.correo_institucional
+        FROM mensajes m
+        JOIN usuarios u ON m.remitente_id = u.id
+        {cursor_join}
+        WHERE m.sala_chat_id = %s
+        AND m.eliminado_en IS NULL{cursor_filter}
+        ORDER BY m.enviado_en {orden}, m.id {orden}
+        LIMIT %s
+    """
+    params.extend([int(sala_chat_id), limit + 1])
+    return sql, params, descendente
+
+
+def shape_history_row(msg, sala_uuid, perfiles):
+    """Convierte una fila de historial en el dict que recibe el cliente"""
+    # Perfil del remitente (la fila ya trae sus datos: se reutiliza para la caché)
+    remitente_id = int(msg["remitente_id"])
+    if remitente_id not in perfiles:
+        perfiles[remitente_id] = cache_user_info({
+            "id": remitente_id,
+            "nombre": msg["nombre"],
+            "apellido_paterno": msg["apellido_paterno"],
+            "apellido_materno": msg["apellido_materno"],
+            "correo_institucional": msg["correo_institucional"]
+        })
+    nombre_completo = perfiles[remitente_id]["nombre_completo"]
+    
+    try:
+        metadatos = json.loads(msg["metadatos"]) if msg["metadatos"] else {}
+    except:
+        metadatos = {}
+    
+    enviado_en = msg["enviado_en"].isoformat() if isinstance(msg["enviado_en"], datetime) else str(msg["enviado_en"])
+    return {
+        "id": str(msg["id"]),
+        "mensaje_uuid": str(msg["mensaje_uuid"]),
+        "sala_uuid": sala_uuid,
+        "from": str(msg["remitente_id"]),
+        "sender_name": nombre_completo,
+        "sender_email": msg["correo_institucional"],
+        "message": msg["contenido"],
+        "type": metadatos.get("type", "directo"),
+        "message_type": msg["tipo_mensaje"],
+        "url_archivo": msg["url_archivo"],
+        "timestamp": enviado_en,
+        "enviado_en": enviado_en
+    }
+
+
+def stream_history(conn, sql, params, limit, chunk_size, sala_uuid, descendente):
+    """
+    Emite el historial como eventos message_history_chunk leyendo de un cursor
+    del lado del servidor: en memoria nunca hay más de chunk_size filas.
+
+    A diferencia de message_history_loaded (siempre de antiguo a nuevo), los
+    chunks salen en el orden de la consulta: de nuevo a antiguo sin cursor o
+    con before_id ("order": "desc") y de antiguo a nuevo con after_id
+    ("order": "asc"). Invertirlo obligaría a leer todo antes de enviar.
+    """
+    direction = "before" if descendente else "after"
+    perfiles = {}
+    enviados = 0
+    chunk_index = 0
+    ultimo_id = None
+    has_more = False
+    
+    cursor = conn.cursor(MeasuredSSCursor)
+    try:
+        cursor.execute(sql, params)
+        while enviados < limit:
+            filas = cursor.fetchmany(min(chunk_size, limit - enviados))
+            if not filas:
+                break
+            enviados += len(filas)
+            ultimo_id = filas[-1]["id"]
+            emit("message_history_chunk", {
+                "status": "ok",
+                "sala_uuid": sala_uuid,
+                "chunk_index": chunk_index,
+                "order": "desc" if descendente else "asc",
+                "messages": [shape_history_row(msg, sala_uuid, perfiles) for msg in filas],
+                "last": False
+            })
+            chunk_index += 1
+        
+        # La consulta pide limit + 1 filas: si queda una, hay más páginas
+        has_more = enviados >= limit and cursor.fetchone() is not None
+    finally:
+        cursor.close()
+    
+    emit("message_history_chunk", {
+        "status": "ok",
+        "sala_uuid": sala_uuid,
+        "chunk_index": chunk_index,
+        "order": "desc" if descendente else "asc",
+        "messages": [],
+        "last": True,
+        "message_count": enviados,
+        "has_more": has_more,
+        "next_cursor": str(ultimo_id) if has_more else None,
+        "direction": direction
+    })
+    return enviados
+
+
+@socket_event("load_message_history")
 def on_load_message_history(data):
     """
-    Carga el historial de mensajes de una sala
+    Carga el historial de mensajes de una sala, paginado por cursor
     
     Formato esperado:
     {
         "sala_uuid": "uuid-de-la-sala",
-        "limit": 50  (opcional, default 50)
+        "limit": 50,  (opcional, default 50, máximo 200; con stream hasta 10000)
+        "before_id": "123",  (opcional: mensajes anteriores a este)
+        "after_id": "456",  (opcional: mensajes posteriores a este)
+        "stream": false,  (opcional: enviar en eventos message_history_chunk)
+        "chunk_size": 100  (opcional, solo con stream)
     }
+    
+    La respuesta incluye has_more y next_cursor: para seguir paginando se envía
+    next_cursor como before_id (o after_id si se pidió after_id). Los mensajes
+    de message_history_loaded van de antiguo a nuevo ("order": "asc"); con
+    stream, cada message_history_chunk indica su orden en "order".
     """
     if not isinstance(data, dict):
         emit("error", {"message": "Payload inválido para load_message_history"})
         return
     
     sala_uuid = data.get("sala_uuid")
-    limit = min(int(data.get("limit", 50)), 200)  # Máximo 200 mensajes
+    stream = bool(data.get("stream", False))
+    
+    try:
+        max_limit = MAX_HISTORY_STREAM_LIMIT if stream else MAX_HISTORY_LIMIT
+        limit = max(1, min(int(data.get("limit", 50)), max_limit))
+        chunk_size = max(1, min(int(data.get("chunk_size", HISTORY_CHUNK_SIZE)), MAX_HISTORY_LIMIT))
+        before_id = int(data["before_id"]) if data.get("before_id") else None
+        after_id = int(data["after_id"]) if data.get("after_id") else None
+    except (TypeError, ValueError):
+        emit("error", {"message": "limit, chunk_size, before_id y after_id deben ser numéricos"})
+        return
     
     if not sala_uuid:
         emit("error", {"message": "sala_uuid es requerido"})
         return
     
-    print(f"[LOAD_HISTORY] sala_uuid={sala_uuid} | limit={limit}")
+    if before_id is not None and after_id is not None:
+        emit("error", {"message": "Usa before_id o after_id, no ambos"})
+        return
+    
+    sala_uuid = str(sala_uuid)
+    log("LOAD_HISTORY", sala_uuid=sala_uuid, limit=limit, before_id=before_id, after_id=after_id, stream=stream)
+    
+    # Páginas dentro de la ventana del buffer se responden sin tocar MySQL
+    buffer_version = None
+    if history_buffer is not None and not stream:
+        pagina = history_buffer.get_page(sala_uuid, limit, before_id, after_id)
+        if pagina is not None:
+            emit("message_history_loaded", {
+                "status": "ok",
+                "sala_uuid": sala_uuid,
+                "message_count": len(pagina["messages"]),
+                "order": "asc",
+                **pagina
+            })
+            log("HISTORY_SENT", count=len(pagina["messages"]), source="buffer")
+            return
+        buffer_version = history_buffer.version(sala_uuid)
     
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
             # Obtener sala_chat_id desde el UUID
-            cursor.execute("""
-                SELECT id FROM salas_chat
-                WHERE sala_uuid = %s
-            """, (sala_uuid,))
-            
-            sala = cursor.fetchone()
+            sala = get_sala_info(sala_uuid, cursor)
             if not sala:
                 emit("error", {"message": "Sala no encontrada"})
                 return
             
-            sala_chat_id = sala["id"]
+            sql, params, descendente = build_history_query(sala["id"], limit, before_id, after_id)
             
-            # Obtener mensajes más recientes (ordenados por antiguo a nuevo)
-            cursor.execute("""
-                SELECT 
-                    m.id,
-                    m.mensaje_uuid,
-                    m.sala_chat_id,
-                    m.remitente_id,
-                    m.tipo_mensaje,
-                    m.contenido,
-                    m.url_archivo,
-                    m.metadatos,
-                    m.enviado_en,
-                    u.nombre,
-                    u.apellido_paterno,
-                    u.apellido_materno,
-                    u.correo_institucional
-                FROM mensajes m
-                JOIN usuarios u ON m.remitente_id = u.id
-                WHERE m.sala_chat_id = %s
-                AND m.eliminado_en IS NULL
-                ORDER BY m.enviado_en DESC
-                LIMIT %s
-            """, (sala_chat_id, limit))
+            if stream:
+                enviados = stream_history(conn, sql, params, limit, chunk_size, sala_uuid, descendente)
+                log("HISTORY_STREAMED", count=enviados, chunk_size=chunk_size)
+                return
             
+            cursor.execute(sql, params)
             mensajes = cursor.fetchall()
             
-            # Invertir para enviar de antiguo a nuevo
-            mensajes_list = []
-            for msg in reversed(mensajes):
-                # Construir nombre completo del remitente
-                nombre_completo = f"{msg['nombre']} {msg['apellido_paterno']}"
-                if msg["apellido_materno"]:
-                    nombre_completo += f" {msg['apellido_materno']}"
-                
-                try:
-                    metadatos = json.loads(msg["metadatos"]) if msg["metadatos"] else {}
-                except:
-                    metadatos = {}
-                
-                mensaje_dict = {
-                    "id": str(msg["id"]),
-                    "mensaje_uuid": str(msg["mensaje_uuid"]),
-                    "sala_uuid": sala_uuid,
-                    "from": str(msg["remitente_id"]),
-                    "sender_name": nombre_completo,
-                    "sender_email": msg["correo_institucional"],
-                    "message": msg["contenido"],
-                    "type": metadatos.get("type", "directo"),
-                    "message_type": msg["tipo_mensaje"],
-                    "url_archivo": msg["url_archivo"],
-                    "timestamp": msg["enviado_en"].isoformat() if isinstance(msg["enviado_en"], datetime) else str(msg["enviado_en"]),
-                    "enviado_en": msg["enviado_en"].isoformat() if isinstance(msg["enviado_en"], datetime) else str(msg["enviado_en"])
-                }
-                mensajes_list.append(mensaje_dict)
+            has_more = len(mensajes) > limit
+            mensajes = mensajes[:limit]
+            next_cursor = str(mensajes[-1]["id"]) if has_more and mensajes else None
+            
+            # Enviar siempre de antiguo a nuevo
+            if descendente:
+                mensajes.reverse()
+            
+            perfiles = {}
+            mensajes_list = [shape_history_row(msg, sala_uuid, perfiles) for msg in mensajes]
+            
+            # La página más reciente carga el buffer de la sala
+            if buffer_version is not None and before_id is None and after_id is None:
+                history_buffer.prime(sala_uuid, mensajes_list, not has_more, buffer_version)
             
             emit("message_history_loaded", {
                 "status": "ok",
                 "sala_uuid": sala_uuid,
                 "message_count": len(mensajes_list),
-                "messages": mensajes_list
+                "messages": mensajes_list,
+                "order": "asc",
+                "has_more": has_more,
+                "next_cursor": next_cursor,
+                "direction": "before" if descendente else "after"
             })
             
-            print(f"[HISTORY_SENT] {len(mensajes_list)} mensajes cargados")
+            log("HISTORY_SENT", count=len(mensajes_list), source="db")
             
     except Exception as e:
-        print(f"[ERROR] load_message_history: {e}")
+        log("ERROR", f"load_message_history: {e}")
         emit("error", {"message": f"Error al cargar historial: {str(e)}"})
 
 
@@ -1133,5 +2732,6 @@ if __name__ == "__main__":
         port=PORT,
         debug=(FLASK_ENV == "development"),
         allow_unsafe_werkzeug=(FLASK_ENV == "development"),
+        max_size=settings.max_connections,
         **ssl_args,
     )
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Benchmark: una consulta lenta ya no congela a los demás sockets.
+
+Un greenthread "latido" duerme 5 ms en bucle y registra el mayor hueco entre
+latidos mientras se ejecuta una llamada de red lenta. Si la llamada bloquea el
+hub, el hueco crece hasta la duración de la llamada; si coopera, se mantiene
+cerca de 5 ms. Cada cliente conectado al servidor sufre ese mismo hueco.
+
+Modos:
+  bloqueante   socket nativo (como PyMySQL SIN monkey_patch)
+  verde        socket parcheado (como PyMySQL con monkey_patch, el modo de app.py)
+  tpool        socket nativo ejecutado con BlockingExecutor
+  cloudinary   upload_chat_image real (SDK + urllib3 verde) con
+               BlockingExecutor.run_green, contra un servidor HTTP local lento
+  mysql        SELECT SLEEP() real con PyMySQL (requiere BD configurada, --mysql)
+
+Uso: python -m benchmarks.bench_blocking_io [--delay 0.5] [--mysql]
+"""
+
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import os
+import time
+
+from eventlet import patcher
+
+original_socket = patcher.original("socket")
+original_threading = patcher.original("threading")
+original_time = patcher.original("time")
+
+HEARTBEAT_INTERVAL = 0.005
+
+
+def start_slow_server(delay):
+    """Servidor TCP en hilo nativo que responde tras `delay` segundos"""
+    server = original_socket.socket(original_socket.AF_INET, original_socket.SOCK_STREAM)
+    server.setsockopt(original_socket.SOL_SOCKET, original_socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+
+    def serve():
+        while True:
+            conn, _ = server.accept()
+            conn.recv(64)
+            original_time.sleep(delay)
+            conn.sendall(b"ok")
+            conn.close()
+
+    thread = original_threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return server.getsockname()
+
+
+def start_slow_http_server(delay):
+    """Servidor HTTP en hilo nativo que lee la petición completa y responde como la API de subida"""
+    server = original_socket.socket(original_socket.AF_INET, original_socket.SOCK_STREAM)
+    server.setsockopt(original_socket.SOL_SOCKET, original_socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+    body = b'{"secure_url": "https://res.cloudinary.com/demo/image/upload/chat/bench.png"}'
+
+    def serve():
+        while True:
+            conn, _ = server.accept()
+            data = b""
+            while b"\r\n\r\n" not in data:
+                data += conn.recv(65536)
+            head, rest = data.split(b"\r\n\r\n", 1)
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":", 1)[1])
+            while len(rest) < length:
+                rest += conn.recv(65536)
+            original_time.sleep(delay)
+            conn.sendall(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nConnection: close\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+            )
+            conn.close()
+
+    thread = original_threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return server.getsockname()
+
+
+def slow_call(address, socket_module):
+    client = socket_module.create_connection(address)
+    try:
+        client.sendall(b"query")
+        return client.recv(64)
+    finally:
+        client.close()
+
+
+def measure(name, func):
+    gaps = []
+    running = [True]
+
+    def heartbeat():
+        last = time.perf_counter()
+        while running[0]:
+            eventlet.sleep(HEARTBEAT_INTERVAL)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    beat = eventlet.spawn(heartbeat)
+    eventlet.sleep(HEARTBEAT_INTERVAL * 4)
+
+    started = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - started
+
+    eventlet.sleep(HEARTBEAT_INTERVAL * 4)
+    running[0] = False
+    beat.wait()
+
+    print(f"  {name:<12} llamada={elapsed * 1000:8.1f} ms | máximo hueco del hub={max(gaps) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bloqueo del hub de eventlet por I/O lenta")
+    parser.add_argument("--delay", type=float, default=0.5, help="Duración de la llamada lenta (s)")
+    parser.add_argument("--mysql", action="store_true", help="Incluir SELECT SLEEP() contra la BD de .env")
+    args = parser.parse_args()
+
+    # Credenciales de prueba: el modo cloudinary no sale a la red
+    for name in ("CLOUDINARY_CLOUD_NAME", "CLOUDINARY_API_KEY", "CLOUDINARY_API_SECRET"):
+        os.environ[name] = "bench"
+    from services import BlockingExecutor
+
+    import socket as green_socket
+
+    address = start_slow_server(args.delay)
+    executor = BlockingExecutor(2)
+
+    print(f"Llamada lenta de {args.delay * 1000:.0f} ms; latido cada {HEARTBEAT_INTERVAL * 1000:.0f} ms")
+    measure("bloqueante", lambda: slow_call(address, original_socket))
+    measure("verde", lambda: slow_call(address, green_socket))
+    measure("tpool", lambda: executor.run(slow_call, address, original_socket))
+
+    # Camino real de /upload/image: el SDK apuntado al servidor HTTP local
+    host, port = start_slow_http_server(args.delay)
+    import cloudinary
+    from services import upload_chat_image
+
+    cloudinary.config(upload_prefix=f"http://{host}:{port}")
+    measure("cloudinary", lambda: executor.run_green(upload_chat_image, b"\x89PNG" + b"\0" * 4096))
+
+    if args.mysql:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        from app import get_db_connection
+
+        def slow_query():
+            with get_db_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT SLEEP(%s)", (args.delay,))
+                cursor.fetchone()
+
+        measure("mysql", slow_query)
+
+
+if __name__ == "__main__":
+    main()
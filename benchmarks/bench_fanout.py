@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark: fan-out de mensajes a varias rooms (costo de serialización y
+entregas por socket).
+
+Arma un servidor python-socketio sin red (los paquetes se cuentan en lugar de
+enviarse) con un grupo de `--members` miembros: `--online` de ellos conectados
+(algunos con dos dispositivos) y `--joined` de esos con join_group hecho.
+
+"por miembro" emite al room del grupo y luego un emit por cada room personal:
+codifica el paquete N+1 veces y los sockets que están en ambos rooms reciben
+el mensaje dos veces. "lote" es lo que hace dispatch_message con
+GROUP_FANOUT_PERSONAL: un solo emit a la lista de rooms.
+
+El escenario directo es un chat 1 a 1 cuyo receptor tiene `--devices`
+sockets, todos en chat_{sala_uuid} y en su room personal. "dos emits" es el
+dispatch_message original (sala y luego room personal); "emit_to_rooms" es
+el actual. Cada escenario verifica que todos los sockets reciban el mensaje
+exactamente una vez con la estrategia actual y termina con error si no.
+
+Uso: python -m benchmarks.bench_fanout [--members 500] [--online 0.6] [--joined 0.5] [--devices 2] [--messages 200]
+"""
+
+import argparse
+import json
+import random
+import time
+from collections import Counter
+
+import socketio
+
+from services.fanout import emit_to_rooms
+
+GROUP_ROOM = "group_bench"
+DIRECT_ROOM = "chat_bench"
+
+MESSAGE = {
+    "mensaje_id": "123456",
+    "mensaje_uuid": "5f0c7d2e-8c1a-4c55-9a41-0f6d2a4b7e11",
+    "sala_uuid": "bench",
+    "sender_id": "1",
+    "sender_name": "Usuario Uno",
+    "type": "grupal",
+    "message_type": "texto",
+    "content": "Hola a todos, ¿a qué hora es la reunión del viernes?",
+    "url_archivo": None,
+    "enviado_en": "2026-10-17T10:00:00",
+}
+
+
+class CountingServer(socketio.Server):
+    """Server que cuenta los paquetes por sid en lugar de escribirlos al socket"""
+
+    def __init__(self):
+        super().__init__(async_mode="threading")
+        self.deliveries = Counter()
+
+    def _send_eio_packet(self, eio_sid, eio_pkt):
+        self.deliveries[eio_sid] += 1
+
+
+def build_group(members, online, joined, seed=7):
+    server = CountingServer()
+    manager = server.manager
+    rng = random.Random(seed)
+    member_ids = [str(n) for n in range(1, members + 1)]
+    online_ids = rng.sample(member_ids, int(members * online))
+    connections = 0
+
+    for user_id in online_ids:
+        in_group = rng.random() < joined
+        for device in range(2 if rng.random() < 0.2 else 1):
+            eio_sid = f"eio-{user_id}-{device}"
+            sid = manager.connect(eio_sid, "/")
+            manager.enter_room(sid, "/", user_id, eio_sid)
+            if in_group:
+                manager.enter_room(sid, "/", GROUP_ROOM, eio_sid)
+            connections += 1
+
+    return server, [GROUP_ROOM, *online_ids], connections
+
+
+def build_direct(devices):
+    server = CountingServer()
+    manager = server.manager
+    connections = 0
+    for user_id, count in (("1", 1), ("2", devices)):
+        for device in range(count):
+            eio_sid = f"eio-{user_id}-{device}"
+            sid = manager.connect(eio_sid, "/")
+            manager.enter_room(sid, "/", user_id, eio_sid)
+            manager.enter_room(sid, "/", DIRECT_ROOM, eio_sid)
+            connections += 1
+    return server, [DIRECT_ROOM, "2"], connections
+
+
+def one_emit_per_room(server, rooms):
+    for room in rooms:
+        server.emit("receive_message", MESSAGE, to=room)
+
+
+def batched(server, rooms):
+    emit_to_rooms(server, "receive_message", MESSAGE, rooms)
+
+
+def run(name, strategy, built, args):
+    server, rooms, connections = built
+
+    encodes = 0
+    original_encode = server.packet_class.encode
+
+    def counting_encode(pkt):
+        nonlocal encodes
+        encodes += 1
+        return original_encode(pkt)
+
+    server.packet_class.encode = counting_encode
+    try:
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            strategy(server, rooms)
+        elapsed = time.perf_counter() - start
+    finally:
+        server.packet_class.encode = original_encode
+
+    delivered = sum(server.deliveries.values())
+    duplicates = delivered - connections * args.messages
+    result = {
+        "connections": connections,
+        "ms_per_message": round(elapsed / args.messages * 1000, 3),
+        "encodes_per_message": encodes / args.messages,
+        "deliveries_per_message": delivered / args.messages,
+        "duplicates_per_message": duplicates / args.messages,
+        "unreached": connections - len(server.deliveries),
+    }
+    print(
+        f"{name:<14} {result['ms_per_message']:>8.3f} ms/mensaje | "
+        f"codificaciones={result['encodes_per_message']:.0f} | "
+        f"entregas={result['deliveries_per_message']:.0f} para {connections} sockets "
+        f"(duplicadas={result['duplicates_per_message']:.0f})"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan-out de mensajes de grupo a rooms personales")
+    parser.add_argument("--members", type=int, default=500)
+    parser.add_argument("--online", type=float, default=0.6, help="Fracción de miembros conectados")
+    parser.add_argument("--joined", type=float, default=0.5, help="Fracción de conectados con join_group")
+    parser.add_argument("--devices", type=int, default=2, help="Sockets del receptor en el chat directo")
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    print(f"Grupo de {args.members} miembros, {args.messages} mensajes")
+    group = lambda: build_group(args.members, args.online, args.joined)
+    results = {
+        "grupo": {
+            "por_miembro": run("por miembro", one_emit_per_room, group(), args),
+            "lote": run("lote", batched, group(), args),
+        },
+    }
+
+    print(f"Chat directo, receptor con {args.devices} sockets, {args.messages} mensajes")
+    direct = lambda: build_direct(args.devices)
+    results["directo"] = {
+        "dos_emits": run("dos emits", one_emit_per_room, direct(), args),
+        "emit_to_rooms": run("emit_to_rooms", batched, direct(), args),
+    }
+
+    failed = [
+        scenario for scenario, key in (("grupo", "lote"), ("directo", "emit_to_rooms"))
+        if results[scenario][key]["duplicates_per_message"] or results[scenario][key]["unreached"]
+    ]
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if failed:
+        raise SystemExit(f"Entregas duplicadas o faltantes en: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
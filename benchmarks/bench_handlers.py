@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks del costo en Python puro del camino caliente.
+
+Mide por separado la validación y normalización de send_message
+(parse_send_message), la traducción de los eventos de compatibilidad
+(legacy_send_payload), el armado de receive_message (build_message_data,
+history_entry), la conversión de filas de historial (shape_history_row) y,
+de punta a punta, los handlers send_message / send_direct_message /
+send_group_message / load_message_history con el cliente de pruebas de
+Flask-SocketIO. La BD es el doble SQLite en memoria de benchmarks.fakes sin
+latencia, así que lo medido es CPU de Python.
+
+Cada caso se repite `--repeat` veces y se reporta el mejor tiempo por
+operación. Con `--baseline` se compara contra un JSON anterior y el proceso
+termina con error si algún caso es más lento que `--tolerance`.
+
+Uso: python -m benchmarks.bench_handlers [--repeat 5] [--json actual.json] [--baseline anterior.json --tolerance 0.25]
+"""
+
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+
+from benchmarks.fakes import FakeMySQL
+
+SEND = {
+    "message": "Hola, ¿nos vemos en la biblioteca a las 5?",
+    "sender_id": "1",
+    "timestamp": "2026-10-17T10:00:00Z",
+    "type": "directo",
+    "message_type": "texto",
+}
+
+
+def best_per_op(func, loops, repeat):
+    """Mejor tiempo por llamada en microsegundos entre `repeat` corridas de `loops` llamadas"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best * 1e6
+
+
+def build_cases(app, fake):
+    """Casos {nombre: (función, loops)} sobre salas y perfiles ya en caché"""
+    client = app.socketio.test_client(app.app, query_string="user_id=1&rejoin=0")
+    other = app.socketio.test_client(app.app, query_string="user_id=2&rejoin=0")
+    client.emit("join_direct_chat", {"other_user_id": "2"})
+    client.emit("join_group", {"group_id": "7"})
+    joined = {event["name"]: event["args"][0] for event in client.get_received()}
+    direct_uuid = joined["direct_chat_joined"]["sala_uuid"]
+    group_uuid = joined["group_joined"]["sala_uuid"]
+    other.get_received()
+
+    direct = dict(SEND, sala_uuid=direct_uuid)
+    group = dict(SEND, sala_uuid=group_uuid, type="grupal")
+    invalid = dict(SEND, sala_uuid=direct_uuid, message_type="video")
+    legacy_direct = {"sender_id": "1", "recipient_id": "2", "content": SEND["message"], "timestamp": SEND["timestamp"]}
+    legacy_group = {"sender_id": "1", "group_id": "7", "content": SEND["message"], "timestamp": SEND["timestamp"]}
+
+    campos, _ = app.parse_send_message(direct)
+    envio = {
+        "sala_uuid": direct_uuid,
+        "sender_id": campos["sender_id"],
+        "chat_type": campos["chat_type"],
+        "message_type": campos["message_type"],
+        "content": campos["content"],
+        "url_archivo": campos["url_archivo"],
+        "timestamp": campos["timestamp"],
+    }
+    guardado = {"id": 123456, "mensaje_uuid": "5f0c7d2e-8c1a-4c55-9a41-0f6d2a4b7e11", "enviado_en": datetime(2026, 10, 17, 10)}
+    app.get_user_info("1")
+    message_data = app.build_message_data(envio, guardado, True)
+
+    row = {
+        "id": 123456,
+        "mensaje_uuid": guardado["mensaje_uuid"],
+        "remitente_id": 1,
+        "contenido": SEND["message"],
+        "tipo_mensaje": "texto",
+        "url_archivo": None,
+        "metadatos": json.dumps({"client_timestamp": SEND["timestamp"], "type": "directo"}),
+        "enviado_en": guardado["enviado_en"],
+        "nombre": "Usuario1",
+        "apellido_paterno": "Prueba",
+        "apellido_materno": "Banco",
+        "correo_institucional": "u1@upred.mx",
+    }
+    known = {1: app.cache_user_info({"id": 1, "nombre": "Usuario1", "apellido_paterno": "Prueba",
+                                     "apellido_materno": "Banco", "correo_institucional": "u1@upred.mx"})}
+
+    def handler(event, payload):
+        def call():
+            client.emit(event, payload)
+            # Vaciar lo recibido para que la lista del cliente de pruebas no crezca
+            client.get_received()
+        return call
+
+    return {
+        "parse_send_message": (lambda: app.parse_send_message(direct), 20000),
+        "parse_send_message (inválido)": (lambda: app.parse_send_message(invalid), 20000),
+        "legacy_send_payload": (lambda: app.legacy_send_payload(legacy_direct, "recipient_id", "directo"), 20000),
+        "build_message_data": (lambda: app.build_message_data(envio, guardado, True), 20000),
+        "history_entry": (lambda: app.history_entry(message_data), 20000),
+        "shape_history_row": (lambda: app.shape_history_row(row, direct_uuid, known), 20000),
+        "shape_history_row (perfil nuevo)": (lambda: app.shape_history_row(row, direct_uuid, {}), 20000),
+        "handler send_message (directo)": (handler("send_message", direct), 500),
+        "handler send_message (grupal)": (handler("send_message", group), 500),
+        "handler send_direct_message": (handler("send_direct_message", legacy_direct), 500),
+        "handler send_group_message": (handler("send_group_message", legacy_group), 500),
+        "handler load_message_history": (handler("load_message_history", {"sala_uuid": direct_uuid, "limit": 50}), 500),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks del camino caliente sin BD real")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplica las iteraciones de cada caso")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    parser.add_argument("--baseline", help="JSON de una corrida anterior para comparar")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Aumento máximo aceptado contra la línea base")
+    args = parser.parse_args()
+
+    # Los logs por evento se miden en bench_logging
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("AUTO_REJOIN_ROOMS", "false")
+    fake = FakeMySQL().seed(users=50, groups={7: range(1, 51)}).install()
+
+    import app
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["us_per_op"]
+
+    results = {}
+    regressions = []
+    for name, (func, loops) in build_cases(app, fake).items():
+        loops = max(1, int(loops * args.scale))
+        func()
+        results[name] = round(best_per_op(func, loops, args.repeat), 3)
+        line = f"{name:<36} {results[name]:>10.3f} µs/op"
+        if name in baseline and baseline[name]:
+            change = results[name] / baseline[name] - 1
+            line += f"   {change:+7.1%} vs línea base"
+            if change > args.tolerance:
+                regressions.append(name)
+                line += "  <- regresión"
+        print(line)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"us_per_op": results, "repeat": args.repeat}, f, indent=2, ensure_ascii=False)
+
+    if regressions:
+        raise SystemExit(f"{len(regressions)} caso(s) más lentos que la línea base: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga: cuántos usuarios y mensajes/s aguanta una instancia de app.py.
+
+Levanta un worker (benchmarks.worker) sobre el doble SQLite de MySQL o, con
+`--mysql`, sobre la BD configurada en .env (MySQL o compatible, con los
+usuarios y grupos ya cargados) y conecta `--clients` clientes Socket.IO.
+Cada fase ejercita un evento y mide hasta su respuesta:
+
+  connect               conexión WebSocket hasta el paquete CONNECT
+  join_direct_chat      cada cliente con su pareja (1-2, 3-4, ...) -> direct_chat_joined
+  join_group            grupos de `--group-size` usuarios -> group_joined
+  send_message          `--messages` mensajes, alternando chat directo y grupo -> ack
+  mark_read             los mensajes directos recibidos -> read_confirmed
+  load_message_history  historial del chat directo de cada cliente -> message_history_loaded
+
+`--concurrency` hilos generan la carga en lazo cerrado: cada cliente espera
+su respuesta antes de enviar de nuevo y un cliente pertenece a un solo hilo.
+Los clientes que no están enviando siguen conectados. La memoria por conexión
+sale del RSS del worker antes y después de conectar a todos.
+
+Los clientes corren en este proceso con hilos nativos: con una sola CPU
+compiten con el worker y la medición es una cota inferior.
+
+Uso: python -m benchmarks.bench_load [--clients 2000] [--concurrency 50] [--messages 5000] [--json resultados.json]
+"""
+
+import argparse
+import json
+import os
+import queue
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.bench_workers import free_port, wait_for_port
+from benchmarks.common import summarize
+from benchmarks.fakes import FakeMySQL
+from benchmarks.sio_client import SioClient
+
+# Eventos con los que el servidor responde a cada petición del cliente
+RESPONSES = ("direct_chat_joined", "group_joined", "ack", "read_confirmed", "message_history_loaded", "error")
+
+
+class LoadClient:
+    """SioClient con una cola de respuestas (una petición pendiente a la vez)"""
+
+    def __init__(self, url, user_id, partner_id, group_id):
+        self.user_id = str(user_id)
+        self.partner_id = str(partner_id)
+        self.group_id = str(group_id)
+        self.direct_uuid = None
+        self.group_uuid = None
+        self.unread = []
+        self.responses = queue.Queue()
+        self.sio = SioClient(url, user_id, query="rejoin=0")
+        for event in RESPONSES:
+            self.sio.on(event, lambda data, event=event: self.responses.put((event, data)))
+        self.sio.on("receive_message", self._on_message)
+
+    def _on_message(self, data):
+        if data.get("type") == "directo" and data.get("from") != self.user_id and data.get("mensaje_id") not in (None, "0"):
+            self.unread.append(data["mensaje_id"])
+
+    def request(self, event, data, expected, timeout):
+        """Emite y espera la respuesta; retorna (latencia, payload) o lanza RuntimeError"""
+        start = time.perf_counter()
+        self.sio.emit(event, data)
+        while True:
+            try:
+                name, payload = self.responses.get(timeout=timeout)
+            except queue.Empty:
+                raise RuntimeError(f"{event}: sin respuesta en {timeout} s")
+            if name == expected:
+                break
+            if name == "error":
+                raise RuntimeError(f"{event}: {payload.get('message')}")
+            # Respuesta tardía de una petición anterior que venció: se descarta
+        elapsed = time.perf_counter() - start
+        if isinstance(payload, dict) and payload.get("status") == "error":
+            raise RuntimeError(f"{event}: {payload.get('message')}")
+        return elapsed, payload
+
+    def close(self):
+        self.sio.close()
+
+
+def worker_rss(pid):
+    """RSS del proceso en bytes (Linux)"""
+    with open(f"/proc/{pid}/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def drive(name, items, concurrency, op):
+    """
+    Ejecuta op(client, arg) sobre `items` [(client, arg)] con `concurrency`
+    hilos; todos los items de un cliente van al mismo hilo, en orden.
+    """
+    lanes = [[] for _ in range(max(1, concurrency))]
+    owners = {}
+    for client, arg in items:
+        lane = owners.setdefault(id(client), len(owners) % len(lanes))
+        lanes[lane].append((client, arg))
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run_lane(lane):
+        local, failures = [], []
+        for client, arg in lane:
+            try:
+                local.append(op(client, arg))
+            except (RuntimeError, OSError, ConnectionError) as e:
+                failures.append(str(e))
+        with lock:
+            latencies.extend(local)
+            errors.extend(failures)
+
+    threads = [threading.Thread(target=run_lane, args=(lane,), daemon=True) for lane in lanes if lane]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    result = {
+        "operations": len(latencies),
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "latency": summarize(latencies),
+    }
+    if errors:
+        result["first_error"] = errors[0]
+    lat = result["latency"]
+    print(
+        f"{name:<22} {result['operations']:>7} ops | {result['throughput_per_sec']:>9.1f} /s | "
+        f"p50={lat['p50_ms']:>8.2f} ms p95={lat['p95_ms']:>8.2f} ms p99={lat['p99_ms']:>8.2f} ms | "
+        f"errores={len(errors)}"
+    )
+    return result
+
+
+def seed_database(clients, group_size):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="upred-load-"), "upred.sqlite")
+    groups = {}
+    for index in range(clients):
+        groups.setdefault(index // group_size + 1, []).append(index + 1)
+    FakeMySQL(path=db_path).seed(users=clients, groups=groups)
+    return db_path
+
+
+def run(args):
+    # Cada cliente usa un socket aquí y otro en el worker
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    port = free_port()
+    cmd = [sys.executable, "-m", "benchmarks.worker", "--port", str(port), "--queue", ""]
+    if not args.mysql:
+        cmd += ["--db", seed_database(args.clients, args.group_size), "--rtt", str(args.rtt)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    url = f"ws://127.0.0.1:{port}"
+    clients = [None] * args.clients
+
+    try:
+        wait_for_port(port)
+        time.sleep(0.5)
+        rss_before = worker_rss(proc.pid)
+        phases = {}
+
+        def connect(_, index):
+            partner = index ^ 1 if (index ^ 1) < args.clients else index
+            start = time.perf_counter()
+            clients[index] = LoadClient(url, index + 1, partner + 1, index // args.group_size + 1)
+            return time.perf_counter() - start
+
+        # Sin cliente todavía: cada índice se reparte solo por su posición
+        slots = [(object(), index) for index in range(args.clients)]
+        phases["connect"] = drive("connect", slots, args.concurrency, connect)
+        connected = [client for client in clients if client is not None]
+        time.sleep(0.5)
+        rss_after = worker_rss(proc.pid)
+        memory = {
+            "worker_rss_before_mb": round(rss_before / 1024 / 1024, 1),
+            "worker_rss_after_mb": round(rss_after / 1024 / 1024, 1),
+            "bytes_per_connection": round((rss_after - rss_before) / len(connected)) if connected else 0,
+        }
+        print(f"{'memoria':<22} {memory['worker_rss_before_mb']} MB -> {memory['worker_rss_after_mb']} MB "
+              f"({memory['bytes_per_connection']} B por conexión)")
+
+        def join_direct(client, _):
+            elapsed, payload = client.request(
+                "join_direct_chat", {"other_user_id": client.partner_id}, "direct_chat_joined", args.timeout)
+            client.direct_uuid = payload["sala_uuid"]
+            return elapsed
+
+        def join_group(client, _):
+            elapsed, payload = client.request(
+                "join_group", {"group_id": client.group_id}, "group_joined", args.timeout)
+            client.group_uuid = payload["sala_uuid"]
+            return elapsed
+
+        phases["join_direct_chat"] = drive("join_direct_chat", [(c, None) for c in connected], args.concurrency, join_direct)
+        phases["join_group"] = drive("join_group", [(c, None) for c in connected], args.concurrency, join_group)
+
+        def send(client, n):
+            sala_uuid, chat_type = (client.direct_uuid, "directo") if n % 2 == 0 else (client.group_uuid, "grupal")
+            if sala_uuid is None:
+                raise RuntimeError("send_message: el cliente no tiene sala")
+            elapsed, _ = client.request("send_message", {
+                "sala_uuid": sala_uuid,
+                "message": f"mensaje de carga {n}",
+                "sender_id": client.user_id,
+                "timestamp": "2026-10-17T10:00:00Z",
+                "type": chat_type,
+            }, "ack", args.timeout)
+            return elapsed
+
+        senders = [connected[n % len(connected)] for n in range(args.messages)]
+        phases["send_message"] = drive("send_message", [(c, n) for n, c in enumerate(senders)], args.concurrency, send)
+        time.sleep(0.5)
+
+        def mark_read(client, mensaje_id):
+            elapsed, _ = client.request(
+                "mark_read", {"mensaje_id": mensaje_id, "user_id": client.user_id}, "read_confirmed", args.timeout)
+            return elapsed
+
+        reads = [(c, mensaje_id) for c in connected for mensaje_id in list(c.unread)]
+        phases["mark_read"] = drive("mark_read", reads, args.concurrency, mark_read)
+
+        def load_history(client, _):
+            elapsed, _ = client.request(
+                "load_message_history", {"sala_uuid": client.direct_uuid, "limit": 50}, "message_history_loaded", args.timeout)
+            return elapsed
+
+        with_room = [(c, None) for c in connected if c.direct_uuid]
+        phases["load_message_history"] = drive("load_message_history", with_room, args.concurrency, load_history)
+
+        return {
+            "config": {
+                "clients": args.clients,
+                "connected": len(connected),
+                "concurrency": args.concurrency,
+                "messages": args.messages,
+                "group_size": args.group_size,
+                "database": "mysql" if args.mysql else "sqlite",
+                "rtt": args.rtt,
+                "cpus": os.cpu_count(),
+            },
+            "memory": memory,
+            "phases": phases,
+        }
+    finally:
+        for client in clients:
+            if client is not None:
+                client.close()
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de una instancia de app.py")
+    parser.add_argument("--clients", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Hilos que generan carga en lazo cerrado")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--group-size", type=int, default=50)
+    parser.add_argument("--timeout", type=float, default=30.0, help="Segundos de espera por respuesta")
+    parser.add_argument("--rtt", type=float, default=0.0, help="Latencia simulada por consulta del doble SQLite")
+    parser.add_argument("--mysql", action="store_true", help="Usar la BD de .env en lugar del doble SQLite")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    print(f"{args.clients} clientes, concurrencia {args.concurrency}, {args.messages} mensajes")
+    results = run(args)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark: costo de los logs por mensaje para quien atiende el evento.
+
+Cada mensaje genera las dos líneas del camino caliente de send_message
+([SEND_MESSAGE] y [MESSAGE_SENT]). "print" es lo que hacía app.py (print
+síncrono a stdout); "event_log" usa EventLog (cola + hilo escritor) en texto
+y en JSON, y "muestreo" agrega LOG_SAMPLE=messages=0.01.
+
+El destino es un stream en memoria ("rápido") o uno que tarda `--delay`
+segundos por write, como un pipe de logs saturado ("lento"). Se mide el
+tiempo que el log le quita al handler; lo que el escritor tarde después en
+vaciar la cola se reporta aparte.
+
+Uso: python -m benchmarks.bench_logging [--messages 20000] [--delay 0.001]
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.common import summarize
+from services.event_log import EventLog
+
+
+class NullStream:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.writes = 0
+        self.chars = 0
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        self.writes += 1
+        self.chars += len(text)
+
+    def flush(self):
+        pass
+
+
+def legacy(stream):
+    def log_message(n):
+        print(
+            "[SEND_MESSAGE] "
+            f"from={n % 500} "
+            f"sala_uuid=5f0c7d2e-8c1a-4c55-9a41-{n:012d} "
+            "type=directo "
+            "message_type=texto "
+            "timestamp=2026-10-17T10:00:00Z",
+            file=stream,
+        )
+        print(f"[MESSAGE_SENT] mensaje_id={n} | from=Usuario {n % 500} | room=chat_{n} | offline=False", file=stream)
+    return log_message, None
+
+
+def event_log(stream, **options):
+    events = EventLog(stream=stream, **options)
+
+    def log_message(n):
+        events.log(
+            "SEND_MESSAGE",
+            sender_id=n % 500,
+            sala_uuid=f"5f0c7d2e-8c1a-4c55-9a41-{n:012d}",
+            type="directo",
+            message_type="texto",
+            timestamp="2026-10-17T10:00:00Z",
+        )
+        events.log("MESSAGE_SENT", mensaje_id=n, sender_id=n % 500, room=f"chat_{n}", offline=False)
+    return log_message, events
+
+
+def run(name, factory, messages, delay):
+    stream = NullStream(delay)
+    log_message, events = factory(stream)
+    latencies = []
+    start = time.perf_counter()
+    for n in range(messages):
+        started = time.perf_counter()
+        log_message(n)
+        latencies.append(time.perf_counter() - started)
+    elapsed = time.perf_counter() - start
+
+    drain_start = time.perf_counter()
+    if events is not None:
+        events.close(timeout=120)
+    drain = time.perf_counter() - drain_start
+
+    result = summarize(latencies)
+    result["us_per_message"] = round(elapsed / messages * 1e6, 2)
+    result["drain_s"] = round(drain, 3)
+    result["writes"] = stream.writes
+    if events is not None:
+        result.update({key: events.stats()[key] for key in ("written", "dropped", "sampled_out")})
+    print(
+        f"{name:<20} {result['us_per_message']:>9.2f} µs/mensaje | p99={result['p99_ms'] * 1000:>8.1f} µs | "
+        f"writes={stream.writes} | vaciado={drain:.3f} s"
+        + (f" | descartados={result['dropped']} muestreados={result['sampled_out']}" if events is not None else "")
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Costo por mensaje de print vs EventLog")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--delay", type=float, default=0.001, help="Segundos por write del stream lento")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    strategies = [
+        ("print", legacy),
+        ("event_log texto", event_log),
+        ("event_log json", lambda stream: event_log(stream, json_output=True)),
+        ("muestreo 1%", lambda stream: event_log(stream, sample={"messages": 0.01})),
+    ]
+    results = {}
+    for label, delay in (("rapido", 0.0), ("lento", args.delay)):
+        # Con el stream lento print tarda `delay` por línea: se usan menos mensajes
+        messages = args.messages if delay == 0 else min(args.messages, 1000)
+        print(f"Stream {label} ({messages} mensajes, 2 líneas c/u, {delay * 1000:.1f} ms por write)")
+        results[label] = {name: run(name, factory, messages, delay) for name, factory in strategies}
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: memoria y costo de desconexión del registro de presencia.
+
+"antes" reproduce connected_users ({user_id: {"sid", "rooms": [...]}} con
+búsqueda lineal por sid en cada desconexión). "después" usa PresenceRegistry
+(índices sid→Session y user_id→{sids}, rooms en sets, Session con
+__slots__). Cada conexión se une a su room personal y a `--rooms` salas.
+
+La tormenta de reconexiones desconecta y vuelve a conectar `--reconnects`
+usuarios, como tras una caída del Wi-Fi del campus.
+
+Uso: python -m benchmarks.bench_presence [--connections 50000] [--rooms 3] [--reconnects 2000]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from services.presence import PresenceRegistry
+
+
+class LegacyPresence:
+    """connected_users tal como lo usaban on_connect / on_disconnect / join_*"""
+
+    def __init__(self):
+        self.connected_users = {}
+
+    def connect(self, sid, user_id):
+        self.connected_users[user_id] = {"sid": sid, "rooms": [user_id]}
+
+    def join(self, user_id, room):
+        if user_id in self.connected_users:
+            if room not in self.connected_users[user_id]["rooms"]:
+                self.connected_users[user_id]["rooms"].append(room)
+
+    def disconnect(self, sid):
+        for uid, data in list(self.connected_users.items()):
+            if data["sid"] == sid:
+                del self.connected_users[uid]
+                return uid
+
+
+class CurrentPresence:
+    def __init__(self):
+        self.registry = PresenceRegistry()
+
+    def connect(self, sid, user_id):
+        self.registry.connect(sid, user_id)
+        self.registry.join(sid, user_id)
+
+    def join(self, sid, room):
+        self.registry.join(sid, room)
+
+    def disconnect(self, sid):
+        session, _ = self.registry.disconnect(sid)
+        return session.user_id if session else None
+
+
+def populate(impl, connections, rooms, legacy):
+    for n in range(connections):
+        sid = f"sid{n:020d}"
+        user_id = str(n + 1)
+        impl.connect(sid, user_id)
+        for r in range(rooms):
+            room = f"chat_{(n * 7 + r) % (connections // 2 or 1):036d}"
+            impl.join(user_id if legacy else sid, room)
+
+
+def run(name, factory, connections, rooms, reconnects, legacy):
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    impl = factory()
+    start = time.perf_counter()
+    populate(impl, connections, rooms, legacy)
+    connect_elapsed = time.perf_counter() - start
+    memory = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    victims = random.Random(7).sample(range(connections), reconnects)
+    start = time.perf_counter()
+    for n in victims:
+        sid = f"sid{n:020d}"
+        impl.disconnect(sid)
+        impl.connect(f"re{sid}", str(n + 1))
+    storm_elapsed = time.perf_counter() - start
+
+    result = {
+        "connections": connections,
+        "memory_mb": round(memory / 1024 / 1024, 2),
+        "bytes_per_connection": round(memory / connections, 1),
+        "connect_us": round(connect_elapsed / connections * 1e6, 2),
+        "reconnect_storm_s": round(storm_elapsed, 4),
+        "disconnect_us": round(storm_elapsed / reconnects * 1e6, 2),
+    }
+    print(
+        f"{name:<8} memoria={result['memory_mb']:>7.2f} MB ({result['bytes_per_connection']:.0f} B/conexión) | "
+        f"tormenta de {reconnects} reconexiones={result['reconnect_storm_s']:.3f} s "
+        f"({result['disconnect_us']:.1f} µs c/u)"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria y desconexión del registro de presencia")
+    parser.add_argument("--connections", type=int, default=50000)
+    parser.add_argument("--rooms", type=int, default=3, help="Salas por conexión además de la personal")
+    parser.add_argument("--reconnects", type=int, default=2000)
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    print(f"{args.connections} conexiones, {args.rooms} salas c/u")
+    results = {
+        "antes": run("antes", LegacyPresence, args.connections, args.rooms, args.reconnects, legacy=True),
+        "despues": run("después", CurrentPresence, args.connections, args.rooms, args.reconnects, legacy=False),
+    }
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
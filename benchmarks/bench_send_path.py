@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Benchmark: round trips a la BD y latencia por mensaje de send_message.
+
+"antes" reproduce el acceso a BD del handler original: tres conexiones nuevas
+por mensaje (consulta de sala; INSERT + SELECT para releer enviado_en;
+consulta del perfil del remitente). "después" ejecuta el handler actual
+(pool + persist_message + cachés) con el cliente de pruebas de Flask-SocketIO.
+
+La BD es el doble SQLite de benchmarks.fakes; `--rtt` simula la latencia de
+red por round trip y conectar cuesta 3 round trips.
+
+Uso: python -m benchmarks.bench_send_path [--messages 500] [--rtt 0.0005]
+"""
+
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import json
+import time
+import uuid as uuid_pkg
+
+from benchmarks.common import summarize
+from benchmarks.fakes import FakeMySQL
+
+
+def legacy_send(fake, sala_uuid, sender_id, content):
+    """Acceso a BD de on_send_message antes del pool y de persist_message"""
+    conn = fake.connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, tipo_sala, usuario_a_id, usuario_b_id, grupo_id
+        FROM salas_chat
+        WHERE sala_uuid = %s
+    """, (sala_uuid,))
+    sala_info = cursor.fetchone()
+    conn.commit()
+    conn.close()
+
+    conn = fake.connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO mensajes (
+            mensaje_uuid, sala_chat_id, remitente_id,
+            tipo_mensaje, contenido, url_archivo, metadatos
+        )
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, (str(uuid_pkg.uuid4()), sala_info["id"], int(sender_id), "texto", content, None,
+          json.dumps({"client_timestamp": "t", "type": "directo"})))
+    cursor.execute("""
+        SELECT id, mensaje_uuid, enviado_en
+        FROM mensajes
+        WHERE id = %s
+    """, (cursor.lastrowid,))
+    cursor.fetchone()
+    conn.commit()
+    conn.close()
+
+    conn = fake.connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT id, nombre, apellido_paterno, apellido_materno, correo_institucional
+        FROM usuarios
+        WHERE id = %s
+    """, (int(sender_id),))
+    cursor.fetchone()
+    conn.commit()
+    conn.close()
+
+
+def run(name, fake, messages, send_one):
+    fake.reset_counters()
+    latencies = []
+    for i in range(messages):
+        started = time.perf_counter()
+        send_one(i)
+        latencies.append(time.perf_counter() - started)
+
+    result = summarize(latencies)
+    for key in ("connects", "queries", "commits", "round_trips"):
+        result[f"{key}_per_msg"] = round(fake.counters[key] / messages, 2)
+
+    print(
+        f"  {name:<8} round trips/msg={result['round_trips_per_msg']:5.2f} "
+        f"(conexiones={result['connects_per_msg']:.2f}, consultas={result['queries_per_msg']:.2f}) | "
+        f"p50={result['p50_ms']:7.3f} ms | p99={result['p99_ms']:7.3f} ms"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Round trips y latencia por mensaje en send_message")
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--rtt", type=float, default=0.0005, help="Latencia simulada por round trip (s)")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    fake = FakeMySQL(rtt=args.rtt).seed(users=10).install()
+
+    import app
+
+    app.app.logger.disabled = True
+    sala = app.get_or_create_direct_chat("1", "2")
+    sala_uuid = sala["sala_uuid"]
+    client = app.socketio.test_client(app.app, query_string="user_id=1")
+
+    def current_send(i):
+        client.emit("send_message", {
+            "sala_uuid": sala_uuid,
+            "message": f"mensaje {i}",
+            "sender_id": "1",
+            "timestamp": "t",
+            "type": "directo",
+        })
+        client.get_received()
+
+    print(f"{args.messages} mensajes, rtt simulado={args.rtt * 1000:.2f} ms")
+    results = {
+        "antes": run("antes", fake, args.messages, lambda i: legacy_send(fake, sala_uuid, "1", f"mensaje {i}")),
+        "despues": run("después", fake, args.messages, current_send),
+    }
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
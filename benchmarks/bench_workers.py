@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Benchmark: mensajes/s de un chat grupal según la cantidad de workers.
+
+Levanta N procesos de app.py (benchmarks.worker) sobre una BD SQLite
+compartida; con N > 1 los conecta con el broker local (SOCKETIO_MESSAGE_QUEUE
+local://). Los clientes se reparten entre workers, todos se unen al mismo
+grupo y `--senders` de ellos envían mensajes en lazo cerrado (cada uno espera
+su ack antes del siguiente). Se mide hasta que todos los miembros recibieron
+todos los mensajes, sin importar en qué worker estén.
+
+Los clientes corren repartidos en `--client-procs` procesos (hilos nativos,
+sin eventlet), para que el generador de carga no sea el cuello de botella con
+varios workers. Los workers, el broker y los clientes comparten la máquina:
+la escala solo se ve con CPUs libres para todos ellos. Con 1 CPU (el entorno
+donde se escribió) hay regresión: los procesos se turnan el mismo núcleo y
+cada mensaje suma el salto por el broker hacia los otros workers. Medido con
+100 clientes, 20 emisores y 1000 mensajes:
+
+                  --client-procs 1    --client-procs 4
+    1 worker         ~280 msg/s          ~210 msg/s
+    2 workers        ~245 msg/s          ~165 msg/s
+    4 workers        ~170 msg/s          ~165 msg/s
+
+Todas las entregas llegan en todos los casos. Con varias CPUs, usar tantos
+workers como núcleos libres deje el generador de carga.
+
+Con `--proxy` cada caso se mide además a través de StickyProxy en su propio
+proceso (como run.py --prod). El proxy usa dos hilos por conexión y copia
+cada frame una vez más; en la misma máquina costó ~15-25 % de msg/s (1
+worker: ~245 directo vs ~180-210 con proxy; 2 workers: ~180-190 vs
+~140-150) y ~20 ms más de ack p50.
+
+Uso: python -m benchmarks.bench_workers [--workers 1,2,4] [--clients 100] [--messages 1000] [--client-procs 4] [--proxy]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid as uuid_pkg
+
+from benchmarks.common import summarize
+from benchmarks.fakes import FakeMySQL
+from benchmarks.sio_client import SioClient
+from services.message_queue import LocalBroker
+from services.sticky_proxy import StickyProxy
+
+GROUP_ID = 1
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"El worker en el puerto {port} no arrancó")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def proxy_process(port, backends):
+    """Proxy con afinidad en su propio proceso, como en run.py --prod"""
+    StickyProxy("127.0.0.1", port, backends).serve_forever()
+
+
+def client_process(urls, user_ids, senders, per_sender, sala_uuid, expected, barrier, results):
+    """
+    Un proceso de carga: conecta `user_ids` (cada uno a su URL), los une al
+    grupo y, tras la barrera, `senders` de ellos envían `per_sender` mensajes.
+    Reporta entregas recibidas y latencias de ack.
+    """
+    received = [0]
+    received_lock = threading.Lock()
+    all_received = threading.Event()
+    joined = threading.Event()
+    pending_joins = [len(user_ids)]
+
+    def on_joined(data):
+        with received_lock:
+            pending_joins[0] -= 1
+            if pending_joins[0] == 0:
+                joined.set()
+
+    def on_message(data):
+        with received_lock:
+            received[0] += 1
+            if received[0] >= expected:
+                all_received.set()
+
+    conns = []
+    for url, user_id in zip(urls, user_ids):
+        client = SioClient(url, user_id=user_id)
+        client.on("group_joined", on_joined)
+        client.on("receive_message", on_message)
+        conns.append(client)
+    for client in conns:
+        client.emit("join_group", {"group_id": str(GROUP_ID)})
+    if not joined.wait(30):
+        barrier.abort()
+        raise RuntimeError(f"Solo {len(user_ids) - pending_joins[0]} de {len(user_ids)} clientes se unieron al grupo")
+
+    latencies = []
+
+    def sender(client):
+        acked = queue.Queue()
+        client.on("ack", lambda data: acked.put(data))
+        for n in range(per_sender):
+            start = time.perf_counter()
+            client.emit("send_message", {
+                "sala_uuid": sala_uuid,
+                "message": f"mensaje {n}",
+                "sender_id": client.user_id,
+                "timestamp": "t",
+                "type": "grupal",
+            })
+            acked.get(timeout=30)
+            latencies.append(time.perf_counter() - start)
+
+    # Barrera 1: todos unidos; barrera 2: todos terminaron de enviar
+    barrier.wait()
+    threads = [threading.Thread(target=sender, args=(client,)) for client in conns[:senders]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    barrier.wait()
+
+    all_received.wait(60)
+    for client in conns:
+        client.close()
+    results.put({"received": received[0], "latencies": latencies})
+
+
+def run(workers, clients, messages, senders, broker_url, client_procs, proxy=False):
+    db_path = os.path.join(tempfile.mkdtemp(prefix="upred-bench-"), "upred.sqlite")
+    fake = FakeMySQL(path=db_path).seed(users=clients, groups={GROUP_ID: range(1, clients + 1)})
+    # Sala creada de antemano para que los workers no compitan por crearla
+    sala_uuid = str(uuid_pkg.uuid4())
+    fake.db.execute(
+        "INSERT INTO salas_chat (sala_uuid, tipo_sala, grupo_id) VALUES (?, 'grupal', ?)",
+        (sala_uuid, GROUP_ID),
+    )
+    fake.db.commit()
+
+    ports = [free_port() for _ in range(workers)]
+    procs = []
+    for port in ports:
+        cmd = [sys.executable, "-m", "benchmarks.worker", "--port", str(port), "--db", db_path]
+        cmd += ["--queue", broker_url if workers > 1 else ""]
+        procs.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL))
+
+    try:
+        for port in ports:
+            wait_for_port(port)
+
+        # spawn y no fork: este proceso ya tiene hilos (broker local)
+        ctx = multiprocessing.get_context("spawn")
+        if proxy:
+            # Todos los clientes entran por el proxy, que elige worker por user_id
+            proxy_port = free_port()
+            procs.append(ctx.Process(
+                target=proxy_process,
+                args=(proxy_port, [("127.0.0.1", port) for port in ports]),
+                daemon=True,
+            ))
+            procs[-1].start()
+            wait_for_port(proxy_port)
+        client_procs = max(1, min(client_procs, clients))
+        barrier = ctx.Barrier(client_procs + 1)
+        results = ctx.Queue()
+        per_sender = messages // senders
+        # Los emisores son los primeros `senders` usuarios, repartidos entre procesos
+        for p in range(client_procs):
+            user_ids = list(range(p + 1, clients + 1, client_procs))
+            if proxy:
+                urls = [f"ws://127.0.0.1:{proxy_port}"] * len(user_ids)
+            else:
+                urls = [f"ws://127.0.0.1:{ports[(user_id - 1) % workers]}" for user_id in user_ids]
+            proc_senders = sum(1 for user_id in user_ids if user_id <= senders)
+            procs.append(ctx.Process(
+                target=client_process,
+                args=(urls, user_ids, proc_senders, per_sender, sala_uuid,
+                      per_sender * senders * len(user_ids), barrier, results),
+                daemon=True,
+            ))
+            procs[-1].start()
+
+        barrier.wait(60)
+        start = time.perf_counter()
+        barrier.wait(300)
+        sent_elapsed = time.perf_counter() - start
+
+        received = 0
+        latencies = []
+        for _ in range(client_procs):
+            result = results.get(timeout=90)
+            received += result["received"]
+            latencies += result["latencies"]
+        elapsed = time.perf_counter() - start
+
+        expected = per_sender * senders * clients
+        return {
+            "workers": workers,
+            "proxy": proxy,
+            "clients": clients,
+            "client_procs": client_procs,
+            "messages": per_sender * senders,
+            "messages_per_sec": round(per_sender * senders / sent_elapsed, 1),
+            "deliveries": received,
+            "expected_deliveries": expected,
+            "deliveries_per_sec": round(received / elapsed, 1),
+            "ack_latency": summarize(latencies),
+        }
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            if isinstance(proc, subprocess.Popen):
+                proc.wait()
+            else:
+                proc.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mensajes/s de un grupo según la cantidad de workers")
+    parser.add_argument("--workers", default="1,2,4", help="Lista de cantidades de workers")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--senders", type=int, default=20)
+    parser.add_argument("--client-procs", type=int, default=4, help="Procesos que reparten a los clientes")
+    parser.add_argument("--proxy", action="store_true", help="Medir también cada caso a través de StickyProxy")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    broker = LocalBroker(port=0).start()
+    broker_url = f"local://127.0.0.1:{broker.port}"
+
+    results = []
+    for workers in [int(n) for n in args.workers.split(",")]:
+        for proxy in ([False, True] if args.proxy else [False]):
+            result = run(workers, args.clients, args.messages, args.senders, broker_url, args.client_procs, proxy)
+            results.append(result)
+            lat = result["ack_latency"]
+            print(
+                f"{workers} worker(s) {'proxy  ' if proxy else 'directo'}: {result['messages_per_sec']:>8.1f} msg/s | "
+                f"{result['deliveries_per_sec']:>9.1f} entregas/s "
+                f"({result['deliveries']}/{result['expected_deliveries']}) | "
+                f"ack p50={lat['p50_ms']:.2f} ms p99={lat['p99_ms']:.2f} ms"
+            )
+
+    broker.close()
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+Doble de MySQL en memoria para benchmarks, basado en SQLite.
+
+Expone la interfaz de PyMySQL que usa app.py (connect, cursor, execute,
+fetchone/fetchall, commit, rollback, ping) y traduce el dialecto MySQL de las
+consultas a SQLite. Cada operación cuenta como un round trip y puede simular
+latencia de red con `rtt`; conectar cuesta `connect_rtts` round trips
+(TCP + saludo + autenticación).
+
+Uso:
+    fake = FakeMySQL(rtt=0.001)
+    fake.seed(users=100, groups={7: range(1, 51)})
+    fake.install()      # reemplaza pymysql.connect antes de importar app
+"""
+
+import os
+import re
+import sqlite3
+import time
+
+import pymysql
+
+SCHEMA = """
+CREATE TABLE usuarios (
+    id                      INTEGER PRIMARY KEY,
+    nombre                  TEXT NOT NULL,
+    apellido_paterno        TEXT NOT NULL,
+    apellido_materno        TEXT,
+    correo_institucional    TEXT NOT NULL
+);
+CREATE TABLE miembros_grupo (
+    grupo_id                INTEGER NOT NULL,
+    usuario_id              INTEGER NOT NULL,
+    estado_membresia        TEXT NOT NULL DEFAULT 'activo',
+    PRIMARY KEY (grupo_id, usuario_id)
+);
+CREATE TABLE salas_chat (
+    id                      INTEGER PRIMARY KEY AUTOINCREMENT,
+    sala_uuid               TEXT NOT NULL UNIQUE,
+    tipo_sala               TEXT NOT NULL,
+    usuario_a_id            INTEGER,
+    usuario_b_id            INTEGER,
+    grupo_id                INTEGER
+);
+CREATE UNIQUE INDEX uq_sala_directa ON salas_chat (usuario_a_id, usuario_b_id) WHERE tipo_sala = 'directo';
+CREATE UNIQUE INDEX uq_sala_grupal ON salas_chat (grupo_id) WHERE tipo_sala = 'grupal';
+CREATE TABLE mensajes (
+    id                      INTEGER PRIMARY KEY AUTOINCREMENT,
+    mensaje_uuid            TEXT NOT NULL UNIQUE,
+    sala_chat_id            INTEGER NOT NULL,
+    remitente_id            INTEGER NOT NULL,
+    tipo_mensaje            TEXT NOT NULL DEFAULT 'texto',
+    contenido               TEXT,
+    url_archivo             TEXT,
+    metadatos               TEXT,
+    enviado_en              TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    editado_en              TIMESTAMP,
+    eliminado_en            TIMESTAMP
+);
+CREATE INDEX idx_mensajes_sala_enviado ON mensajes (sala_chat_id, enviado_en DESC);
+CREATE TABLE destinatarios_mensaje (
+    mensaje_id              INTEGER NOT NULL,
+    destinatario_id         INTEGER NOT NULL,
+    entregado_en            TIMESTAMP,
+    leido_en                TIMESTAMP,
+    PRIMARY KEY (mensaje_id, destinatario_id)
+);
+"""
+
+# Clave primaria/única usada como destino de ON CONFLICT al traducir upserts
+UPSERT_KEYS = {
+    "destinatarios_mensaje": "(mensaje_id, destinatario_id)",
+    "mensajes": "(mensaje_uuid)",
+    "salas_chat": "(sala_uuid)",
+}
+
+
+def translate(sql):
+    """Traduce el dialecto MySQL usado por app.py a SQLite"""
+    sql = sql.replace("%s", "?")
+    sql = re.sub(r"\bLEAST\(", "MIN(", sql)
+    sql = re.sub(r"\bGREATEST\(", "MAX(", sql)
+    sql = sql.replace("NOW()", "CURRENT_TIMESTAMP")
+    sql = sql.replace("INSERT IGNORE", "INSERT OR IGNORE")
+
+    match = re.search(r"ON DUPLICATE KEY UPDATE(.*)$", sql, re.S)
+    if match:
+        table = re.search(r"INSERT\s+INTO\s+(\w+)", sql).group(1)
+        updates = re.sub(r"VALUES\((\w+)\)", r"excluded.\1", match.group(1))
+        head = sql[:match.start()]
+        if re.search(r"\)\s*SELECT\b", head, re.S):
+            # SQLite necesita un WHERE en INSERT ... SELECT ... ON CONFLICT
+            head = head.rstrip() + (" AND 1 " if re.search(r"\bWHERE\b", head) else " WHERE 1 ")
+        sql = f"{head} ON CONFLICT{UPSERT_KEYS[table]} DO UPDATE SET {updates}"
+    return sql
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.backend.db.cursor()
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, query, args=None):
+        self.connection.backend._round_trip("queries")
+        if args is None:
+            args = ()
+        elif isinstance(args, dict):
+            raise NotImplementedError("Parámetros con nombre no soportados")
+        self._cursor.execute(translate(query), tuple(args))
+        self.rowcount = self._cursor.rowcount
+        self.lastrowid = self._cursor.lastrowid
+        return self.rowcount
+
+    def executemany(self, query, args):
+        self.connection.backend._round_trip("queries")
+        self._cursor.executemany(translate(query), [tuple(a) for a in args])
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def _row(self, row):
+        if row is None:
+            return None
+        return {col[0]: value for col, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._row(r) for r in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeConnection:
+    def __init__(self, backend):
+        self.backend = backend
+        self.open = True
+
+    def cursor(self, cursor=None):
+        return FakeCursor(self)
+
+    def begin(self):
+        self.backend._round_trip("queries")
+
+    def commit(self):
+        self.backend._round_trip("commits")
+        self.backend.db.commit()
+
+    def rollback(self):
+        self.backend._round_trip("commits")
+        self.backend.db.rollback()
+
+    def ping(self, reconnect=False):
+        self.backend._round_trip("pings")
+
+    def close(self):
+        self.open = False
+
+
+class FakeMySQL:
+    """Base de datos falsa compartida por todas las conexiones del proceso"""
+
+    def __init__(self, rtt=0.0, connect_rtts=3, path=":memory:"):
+        self.rtt = rtt
+        self.connect_rtts = connect_rtts
+        # Con `path` en disco varios procesos (workers) comparten los mismos datos
+        existing = path != ":memory:" and os.path.exists(path)
+        self.db = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            timeout=30,
+        )
+        if not existing:
+            self.db.executescript(SCHEMA)
+        if path != ":memory:":
+            # Sin fsync por commit: se simula el costo de MySQL con `rtt`, no el del disco
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=OFF")
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.counters = {"connects": 0, "queries": 0, "commits": 0, "pings": 0, "round_trips": 0}
+
+    def _round_trip(self, kind, count=1):
+        self.counters[kind] += 1
+        self.counters["round_trips"] += count
+        if self.rtt:
+            time.sleep(self.rtt * count)
+
+    def connect(self, **kwargs):
+        self._round_trip("connects", self.connect_rtts)
+        return FakeConnection(self)
+
+    def install(self):
+        """Reemplaza pymysql.connect por este doble"""
+        pymysql.connect = self.connect
+        return self
+
+    def seed(self, users=10, groups=None):
+        """Crea `users` usuarios (ids 1..N) y grupos {grupo_id: [usuario_id, ...]}"""
+        self.db.executemany(
+            "INSERT INTO usuarios VALUES (?, ?, ?, ?, ?)",
+            [
+                (i, f"Usuario{i}", "Prueba", "Banco" if i % 2 else None, f"u{i}@upred.mx")
+                for i in range(1, users + 1)
+            ],
+        )
+        for grupo_id, miembros in (groups or {}).items():
+            self.db.executemany(
+                "INSERT INTO miembros_grupo (grupo_id, usuario_id) VALUES (?, ?)",
+                [(grupo_id, u) for u in miembros],
+            )
+        self.db.commit()
+        return self
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Reproduce una grabación de TRAFFIC_RECORD_PATH contra una instancia de app.py.
+
+Cada conexión grabada abre su propio cliente Socket.IO y cada evento se envía
+en su instante relativo dividido entre `--speed` (1 = tiempo real, 10 = diez
+veces más rápido, max = sin esperas), en lazo abierto: no se espera la
+respuesta de un evento para enviar el siguiente, así se conservan las ráfagas
+de la grabación (p. ej. los cambios de clase).
+
+Los tokens de la grabación se traducen así:
+  u<N>, g<N>   usuario / grupo N + `--user-offset` / `--group-offset`
+  r<N>, m<N>   sala / mensaje que devolvió la respuesta anotada en la
+               grabación (direct_chat_joined, group_joined, rooms_joined,
+               connected, ack); si todavía no llegó se espera hasta
+               `--resolve-timeout` y si no, el evento se omite
+  {"s": N}     texto de relleno de N caracteres (timestamp: la hora actual)
+
+Sin `--url` se levanta un worker (benchmarks.worker) sobre el doble SQLite con
+los usuarios y los grupos que aparecen en la grabación, así dos builds se
+comparan con la misma carga sin depender de staging. Con `--url` los usuarios
+y grupos deben existir en el destino (y los usuarios ser miembros de sus
+grupos).
+
+`--start`/`--duration` reproducen solo una ventana (un pico): lo anterior a la
+ventana se usa únicamente para conectar y unir a las salas, sin medir.
+`--inspect` resume la grabación (eventos, conexiones y segundos más cargados)
+sin reproducirla.
+
+Uso:
+  python -m benchmarks.replay_traffic traffic.jsonl.gz --inspect
+  python -m benchmarks.replay_traffic traffic.jsonl.gz [--speed 1|10|max] [--url ws://staging:5000] [--json resultado.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from benchmarks.bench_workers import free_port, wait_for_port
+from benchmarks.common import summarize
+from benchmarks.fakes import FakeMySQL
+from benchmarks.sio_client import SioClient
+from services.traffic_recorder import id_kind, read_recording
+
+# Evento con que el servidor responde a cada evento del cliente
+RESPONSES = {
+    "join_direct_chat": "direct_chat_joined",
+    "join_group": "group_joined",
+    "join_rooms": "rooms_joined",
+    "leave_group": "group_left",
+    "send_message": "ack",
+    "send_direct_message": "ack",
+    "send_group_message": "ack",
+    "mark_delivered": "delivery_confirmed",
+    "mark_read": "read_confirmed",
+    "mark_delivered_bulk": "delivery_confirmed_bulk",
+    "mark_read_bulk": "read_confirmed_bulk",
+    "mark_room_read_until": "room_read_confirmed",
+    "load_message_history": "message_history_loaded",
+}
+
+# Eventos que solo preparan el estado (conexiones y salas): antes de la
+# ventana de --start se reproducen sin medir
+SETUP_EVENTS = {"connect", "disconnect", "join_direct_chat", "join_group", "join_rooms", "leave_group"}
+
+FILLER = "Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod tempor. "
+
+
+class Unresolved(Exception):
+    """Token de sala o mensaje cuya respuesta anotada aún no llega"""
+
+    def __init__(self, kind, token):
+        super().__init__(token)
+        self.kind = kind
+        self.token = token
+
+
+def filler(length):
+    return (FILLER * (length // len(FILLER) + 1))[:length]
+
+
+class ReplayClient:
+    """Una conexión grabada: peticiones en vuelo y anotaciones por emparejar"""
+
+    def __init__(self, token, user_id):
+        self.token = token
+        self.user_id = user_id
+        self.sio = None
+        # Eventos que llegan mientras se conecta; se envían en orden al conectar
+        self.lock = threading.Lock()
+        self.backlog = []
+        self.ready = False
+        self.pending = deque()
+        # Por evento de respuesta: tokens anotados en la grabación y payloads reales recibidos
+        self.notes = defaultdict(deque)
+        self.values = defaultdict(deque)
+
+    def close(self):
+        if self.sio is not None:
+            self.sio.close()
+
+
+class Replay:
+    def __init__(self, url, speed, user_offset=0, group_offset=0, resolve_timeout=2.0, connect_workers=32):
+        self.url = url
+        # Los handshakes van en paralelo para no atrasar el resto de los envíos
+        self.connector = ThreadPoolExecutor(max_workers=connect_workers)
+        self.speed = speed
+        self.user_offset = user_offset
+        self.group_offset = group_offset
+        self.resolve_timeout = resolve_timeout
+        self.cond = threading.Condition()
+        self.clients = {}
+        self.resolved = {"r": {}, "m": {}}
+        self.sent = Counter()
+        self.errors = Counter()
+        self.skipped = Counter()
+        self.latencies = defaultdict(list)
+        self.lag = []
+
+    # --- traducción de tokens -------------------------------------------------
+
+    def resolve(self, kind, token):
+        if token is None:
+            return None
+        if kind in ("u", "g"):
+            return str(int(token[1:]) + (self.user_offset if kind == "u" else self.group_offset))
+        value = self.resolved[kind].get(token)
+        if value is None:
+            raise Unresolved(kind, token)
+        return value
+
+    def build(self, value, key=None, parent=None):
+        """Payload real a partir de la forma grabada"""
+        kind = id_kind(key, parent) if key is not None else None
+        if kind is not None:
+            if isinstance(value, list):
+                return [self.resolve(kind, token) for token in value]
+            return self.resolve(kind, value)
+        if isinstance(value, dict):
+            if set(value) == {"s"}:
+                if key == "timestamp":
+                    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+                return filler(value["s"])
+            if set(value) == {"n"}:
+                return value["n"]
+            return {name: self.build(item, name, value) for name, item in value.items()}
+        if isinstance(value, list):
+            return [self.build(item) for item in value]
+        return value
+
+    def _pair(self, client, event):
+        """Empareja en orden las anotaciones de `event` con las respuestas reales"""
+        notes, values = client.notes[event], client.values[event]
+        while notes and values:
+            tokens, real = notes.popleft(), values.popleft()
+            for key, token in tokens.items():
+                kind = id_kind(key, tokens)
+                if kind not in self.resolved:
+                    continue
+                if event in ("connected", "rooms_joined"):
+                    actual = [room.get("sala_uuid") for room in real.get("rooms", [])]
+                else:
+                    actual = real.get(key)
+                if isinstance(token, list):
+                    for item, value in zip(token, actual or []):
+                        self.resolved[kind].setdefault(item, str(value))
+                elif actual is not None:
+                    self.resolved[kind].setdefault(token, str(actual))
+        self.cond.notify_all()
+
+    # --- respuestas (hilos lectores de los clientes) -------------------------
+
+    def _on_response(self, client, event, data):
+        now = time.perf_counter()
+        failed = event == "error" or (isinstance(data, dict) and data.get("status") == "error")
+        if event == "message_history_chunk" and not data.get("last"):
+            return
+        with self.cond:
+            for index, (name, expected, started, measured) in enumerate(client.pending):
+                if event == "error" or expected == event:
+                    del client.pending[index]
+                    if failed:
+                        self.errors[name] += 1
+                    elif measured:
+                        self.latencies[name].append(now - started)
+                    break
+            if not failed and isinstance(data, dict) and event in ("connected", "direct_chat_joined", "group_joined", "rooms_joined", "ack"):
+                client.values[event].append(data)
+                self._pair(client, event)
+
+    def _handlers(self, client):
+        events = set(RESPONSES.values()) | {"error", "connected", "message_history_chunk"}
+        return {event: (lambda data=None, event=event: self._on_response(client, event, data)) for event in events}
+
+    # --- envío ----------------------------------------------------------------
+
+    def connect(self, token, payload, measured):
+        user_id = self.resolve("u", (payload or {}).get("user_id"))
+        if user_id is None:
+            self.skipped["connect sin user_id"] += 1
+            return
+        client = self.clients[token] = ReplayClient(token, user_id)
+        query = "rejoin=0" if (payload or {}).get("rejoin") == "0" else ""
+        self.connector.submit(self._open, client, query, measured)
+
+    def _open(self, client, query, measured):
+        started = time.perf_counter()
+        try:
+            client.sio = SioClient(self.url, client.user_id, query=query, handlers=self._handlers(client))
+        except (OSError, ConnectionError):
+            with self.cond:
+                self.errors["connect"] += 1
+            self.clients.pop(client.token, None)
+            return
+        if measured:
+            with self.cond:
+                self.sent["connect"] += 1
+                self.latencies["connect"].append(time.perf_counter() - started)
+        with client.lock:
+            for record, backlog_measured in client.backlog:
+                self.send(client, record, backlog_measured)
+            client.backlog.clear()
+            client.ready = True
+
+    def dispatch(self, record, measured):
+        token = record.get("c")
+        if "o" in record:
+            client = self.clients.get(token)
+            if client is not None and record.get("p"):
+                with self.cond:
+                    client.notes[record["o"]].append(record["p"])
+                    self._pair(client, record["o"])
+            return
+
+        event = record["e"]
+        if event == "connect":
+            self.connect(token, record.get("p"), measured)
+            return
+        client = self.clients.get(token)
+        if client is None:
+            # La conexión empezó antes de la grabación o no se pudo abrir
+            self.skipped["sin conexión"] += 1
+            return
+        with client.lock:
+            if not client.ready:
+                client.backlog.append((record, measured))
+                return
+        self.send(client, record, measured)
+
+    def send(self, client, record, measured):
+        event = record["e"]
+        if event == "disconnect":
+            with self.cond:
+                self.errors["sin respuesta"] += len(client.pending)
+                client.pending.clear()
+            client.close()
+            self.clients.pop(client.token, None)
+            return
+
+        try:
+            payload = self.build(record.get("p"))
+        except Unresolved as e:
+            with self.cond:
+                self.cond.wait_for(lambda: e.token in self.resolved[e.kind], self.resolve_timeout)
+            try:
+                payload = self.build(record.get("p"))
+            except Unresolved:
+                self.skipped[f"{event} sin resolver"] += 1
+                return
+
+        expected = RESPONSES.get(event)
+        if event == "load_message_history" and isinstance(payload, dict) and payload.get("stream"):
+            expected = "message_history_chunk"
+        if expected is not None:
+            with self.cond:
+                client.pending.append((event, expected, time.perf_counter(), measured))
+        try:
+            client.sio.emit(event, payload)
+        except OSError:
+            with self.cond:
+                self.errors[event] += 1
+            return
+        if measured:
+            with self.cond:
+                self.sent[event] += 1
+
+    def wait_responses(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while any(client.pending or not client.ready for client in list(self.clients.values())):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.cond.wait(min(remaining, 0.1))
+
+    def run(self, records, start=0.0, end=None, drain=5.0):
+        """Reproduce `records` ordenados por t; retorna el resumen"""
+        window = [r for r in records if r["t"] >= start and (end is None or r["t"] < end)]
+        setup = [r for r in records if r["t"] < start and ("o" in r or r.get("e") in SETUP_EVENTS)]
+        for record in setup:
+            self.dispatch(record, measured=False)
+        if setup:
+            self.wait_responses(drain)
+
+        origin = window[0]["t"] if window else start
+        base = time.perf_counter()
+        for record in window:
+            if self.speed:
+                due = base + (record["t"] - origin) / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                self.lag.append(max(0.0, time.perf_counter() - due))
+            self.dispatch(record, measured=True)
+        elapsed = time.perf_counter() - base
+
+        self.wait_responses(drain)
+        with self.cond:
+            for client in list(self.clients.values()):
+                self.errors["sin respuesta"] += len(client.pending)
+                client.pending.clear()
+
+        recorded = (window[-1]["t"] - origin) if window else 0.0
+        return {
+            "recorded_s": round(recorded, 3),
+            "elapsed_s": round(elapsed, 3),
+            "events": sum(self.sent.values()),
+            "events_per_sec": round(sum(self.sent.values()) / elapsed, 1) if elapsed else 0.0,
+            "dispatch_lag": summarize(self.lag),
+            "sent": dict(self.sent),
+            "errors": dict(self.errors),
+            "skipped": dict(self.skipped),
+            "latency": {event: summarize(values) for event, values in sorted(self.latencies.items())},
+        }
+
+    def close(self):
+        self.connector.shutdown(wait=True)
+        for client in list(self.clients.values()):
+            client.close()
+        self.clients.clear()
+
+
+def load(path):
+    records = sorted(read_recording(path), key=lambda record: record["t"])
+    if not records:
+        raise SystemExit(f"{path}: grabación vacía")
+    return records
+
+
+def inspect(records, top=5):
+    events = Counter(record["e"] for record in records if "e" in record)
+    per_second = Counter(int(record["t"]) for record in records if "e" in record)
+    duration = records[-1]["t"] - records[0]["t"]
+    print(f"{sum(events.values())} eventos en {duration:.1f} s, {events['connect']} conexiones")
+    for event, count in events.most_common():
+        print(f"  {event:<24} {count:>8}")
+    print("Segundos más cargados:")
+    for second, count in per_second.most_common(top):
+        print(f"  t={second:>7} s  {count:>6} eventos")
+
+
+def seed_from_recording(records):
+    """Base SQLite con los usuarios y la membresía de grupos que aparecen en la grabación"""
+    users = 0
+    members = defaultdict(set)
+    client_user = {}
+
+    def ids(value, kind):
+        values = value if isinstance(value, list) else [value]
+        return [int(token[1:]) for token in values if isinstance(token, str) and token.startswith(kind)]
+
+    for record in records:
+        payload = record.get("p")
+        if "e" not in record or not isinstance(payload, dict):
+            continue
+        user = None
+        if record["e"] == "connect":
+            user = (ids(payload.get("user_id"), "u") or [None])[0]
+            client_user[record["c"]] = user
+        user = user or client_user.get(record["c"])
+        for key, value in payload.items():
+            kind = id_kind(key, payload)
+            if kind == "u":
+                users = max([users, *ids(value, "u")])
+            elif kind == "g" and user:
+                for group in ids(value, "g"):
+                    members[group].add(user)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="upred-replay-"), "upred.sqlite")
+    FakeMySQL(path=db_path).seed(users=users, groups={group: sorted(ids) for group, ids in members.items()})
+    return db_path
+
+
+def report(result):
+    lag = result["dispatch_lag"]
+    print(f"{result['events']} eventos en {result['elapsed_s']} s (grabados en {result['recorded_s']} s) "
+          f"= {result['events_per_sec']} /s | retraso de envío p50={lag['p50_ms']} ms p99={lag['p99_ms']} ms")
+    for event, lat in result["latency"].items():
+        print(f"  {event:<24} {lat['count']:>7} resp | p50={lat['p50_ms']:>8.2f} ms p95={lat['p95_ms']:>8.2f} ms "
+              f"p99={lat['p99_ms']:>8.2f} ms | errores={result['errors'].get(event, 0)}")
+    for label, counts in (("Errores", result["errors"]), ("Omitidos", result["skipped"])):
+        if counts:
+            print(f"{label}: " + ", ".join(f"{name}={count}" for name, count in sorted(counts.items())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduce tráfico grabado con TRAFFIC_RECORD_PATH")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", default="1", help="Multiplicador de velocidad (1, 10, ...) o max")
+    parser.add_argument("--url", help="ws://host:puerto de la instancia (sin él, un worker local sobre SQLite)")
+    parser.add_argument("--start", type=float, default=0.0, help="Segundo de la grabación donde empieza la ventana")
+    parser.add_argument("--duration", type=float, default=None, help="Segundos de grabación a reproducir")
+    parser.add_argument("--user-offset", type=int, default=0)
+    parser.add_argument("--group-offset", type=int, default=0)
+    parser.add_argument("--resolve-timeout", type=float, default=2.0)
+    parser.add_argument("--connect-workers", type=int, default=32, help="Handshakes en paralelo")
+    parser.add_argument("--drain", type=float, default=10.0, help="Segundos de espera por respuestas al terminar")
+    parser.add_argument("--inspect", action="store_true", help="Solo resumir la grabación")
+    parser.add_argument("--json", help="Guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    records = load(args.recording)
+    if args.inspect:
+        inspect(records)
+        return
+
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    proc = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        cmd = [sys.executable, "-m", "benchmarks.worker", "--port", str(port), "--queue", "", "--db", seed_from_recording(records)]
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+        wait_for_port(port)
+        url = f"ws://127.0.0.1:{port}"
+
+    replay = Replay(url, speed, args.user_offset, args.group_offset, args.resolve_timeout, args.connect_workers)
+    end = args.start + args.duration if args.duration is not None else None
+    print(f"Reproduciendo {args.recording} a velocidad {args.speed} contra {url}")
+    try:
+        result = replay.run(records, args.start, end, args.drain)
+    finally:
+        replay.close()
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+    result["config"] = {"recording": args.recording, "speed": args.speed, "url": args.url or "local", "start": args.start, "duration": args.duration}
+    report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Cliente Socket.IO mínimo sobre WebSocket para benchmarks.
+
+Habla directamente el protocolo Engine.IO v4 / Socket.IO v5 (solo namespace
+"/", sin binarios ni acks del cliente) sobre un WebSocket RFC 6455 propio, así
+no hace falta instalar el cliente completo de python-socketio con sus
+dependencias HTTP. Cada cliente usa un hilo lector.
+
+Uso:
+    client = SioClient("ws://127.0.0.1:5000", user_id=1)
+    client.on("receive_message", lambda data: ...)
+    client.emit("join_group", {"group_id": "1"})
+"""
+
+import base64
+import json
+import os
+import socket
+import struct
+import threading
+from urllib.parse import urlsplit
+
+
+class WebSocket:
+    """WebSocket cliente sin extensiones: solo frames de texto, ping y close"""
+
+    def __init__(self, url, timeout=10):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        self.sock = socket.create_connection((parts.hostname, parts.port or 80), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._send_lock = threading.Lock()
+
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.sock.sendall((
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {parts.hostname}:{parts.port or 80}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+
+        # Lo que llegue después de la respuesta HTTP ya es el primer frame
+        self._buffer = b""
+        while b"\r\n\r\n" not in self._buffer:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Conexión cerrada durante el handshake")
+            self._buffer += chunk
+        head, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+        status_line = head.split(b"\r\n", 1)[0]
+        if b" 101 " not in status_line:
+            raise ConnectionError(f"Upgrade rechazado: {status_line!r}")
+        self.sock.settimeout(None)
+
+    def _read_exact(self, size):
+        while len(self._buffer) < size:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("Conexión cerrada")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def send(self, text, opcode=0x1):
+        payload = text.encode() if isinstance(text, str) else text
+        length = len(payload)
+        header = bytes([0x80 | opcode])
+        if length < 126:
+            header += bytes([0x80 | length])
+        elif length < 65536:
+            header += bytes([0x80 | 126]) + struct.pack("!H", length)
+        else:
+            header += bytes([0x80 | 127]) + struct.pack("!Q", length)
+        mask = os.urandom(4)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        with self._send_lock:
+            self.sock.sendall(header + mask + masked)
+
+    def receive(self):
+        """Retorna el siguiente mensaje de texto, o None si se cerró la conexión"""
+        message = b""
+        try:
+            while True:
+                first, second = self._read_exact(2)
+                opcode = first & 0x0F
+                length = second & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", self._read_exact(2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", self._read_exact(8))[0]
+                payload = self._read_exact(length)
+
+                if opcode == 0x8:
+                    return None
+                if opcode == 0x9:
+                    self.send(payload, opcode=0xA)
+                    continue
+                if opcode == 0xA:
+                    continue
+                message += payload
+                if first & 0x80:
+                    return message.decode()
+        except OSError:
+            return None
+
+    def close(self):
+        try:
+            self.send(b"", opcode=0x8)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class SioClient:
+    def __init__(self, url, user_id, timeout=10, query="", handlers=None):
+        self.user_id = str(user_id)
+        # Con `handlers` no se pierden los eventos que llegan junto con el CONNECT
+        self.handlers = dict(handlers or {})
+        self.received = {}
+        self.sid = None
+        self.error = None
+        self._connected = threading.Event()
+        extra = f"&{query}" if query else ""
+        self.ws = WebSocket(f"{url}/socket.io/?EIO=4&transport=websocket&user_id={self.user_id}{extra}", timeout)
+
+        handshake = self.ws.receive()
+        if not handshake or not handshake.startswith("0"):
+            raise ConnectionError(f"Handshake Engine.IO inválido: {handshake!r}")
+        self.ws.send("40")
+
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        if not self._connected.wait(timeout):
+            raise ConnectionError(f"Sin respuesta de connect para user_id={self.user_id}")
+        if self.error:
+            raise ConnectionError(f"Conexión rechazada para user_id={self.user_id}: {self.error}")
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def emit(self, event, data=None):
+        self.ws.send("42" + json.dumps([event, data], separators=(",", ":")))
+
+    def close(self):
+        try:
+            self.ws.send("41")
+        except OSError:
+            pass
+        self.ws.close()
+
+    def _read_loop(self):
+        while True:
+            packet = self.ws.receive()
+            if packet is None:
+                return
+            if packet == "2":
+                self.ws.send("3")
+            elif packet.startswith("40"):
+                self.sid = json.loads(packet[2:] or "{}").get("sid")
+                self._connected.set()
+            elif packet.startswith("42"):
+                event, *args = json.loads(packet[2:])
+                self.received[event] = self.received.get(event, 0) + 1
+                handler = self.handlers.get(event)
+                if handler is not None:
+                    handler(*args)
+            elif packet.startswith("44"):
+                self.error = packet[2:] or "rechazada"
+                self._connected.set()
+                return
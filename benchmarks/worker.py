@@ -0,0 +1,44 @@
+"""
+Worker de app.py sobre el doble de MySQL, para benchmarks con varios procesos.
+
+La BD SQLite en `--db` se comparte entre workers; sin `--db` se usa la BD
+configurada en .env (MySQL o compatible). La cola de mensajes se toma de
+SOCKETIO_MESSAGE_QUEUE (o de `--queue`).
+
+Uso: python -m benchmarks.worker --port 5001 [--db /tmp/upred.sqlite] [--queue local://127.0.0.1:6390]
+"""
+
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import os
+
+from benchmarks.fakes import FakeMySQL
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, required=True)
+    parser.add_argument("--db", default=None, help="archivo SQLite compartido (sin él, la BD de .env)")
+    parser.add_argument("--queue", default=None, help="URL de SOCKETIO_MESSAGE_QUEUE")
+    parser.add_argument("--rtt", type=float, default=0.0, help="latencia simulada de MySQL en segundos")
+    args = parser.parse_args()
+
+    if args.queue is not None:
+        os.environ["SOCKETIO_MESSAGE_QUEUE"] = args.queue
+    os.environ.setdefault("FLASK_ENV", "production")
+    # Los logs por mensaje distorsionan la medición
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    if args.db:
+        FakeMySQL(rtt=args.rtt, path=args.db).install()
+
+    from app import app, settings, socketio
+
+    socketio.run(app, host="127.0.0.1", port=args.port, log_output=False, max_size=settings.max_connections)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,9 +16,51 @@ class Settings:
     db_user: str
     db_password: str
     db_name: str
+    db_connect_timeout: int
+    db_pool_size: int
+    db_pool_timeout: float
+    db_pool_recycle: int
+    db_pool_ping_interval: int
+    db_breaker_failures: int
+    db_breaker_cooldown: float
+    db_breaker_half_open_calls: int
+    room_cache_size: int
+    room_cache_ttl: int
+    user_cache_size: int
+    user_cache_ttl: int
+    cache_invalidate_token: str
+    group_members_cache_size: int
+    group_members_cache_ttl: int
+    write_behind_enabled: bool
+    write_behind_batch_size: int
+    write_behind_linger_ms: int
+    write_behind_max_queue: int
+    write_behind_put_timeout: float
+    receipt_coalesce_ms: int
+    receipt_batch_size: int
+    history_buffer_size: int
+    history_buffer_max_bytes: int
+    history_buffer_ttl: int
+    offline_spool_dir: str
+    offline_spool_fsync_ms: int
+    offline_spool_replay_interval: float
+    offline_spool_batch_size: int
+    auto_rejoin_rooms: bool
+    group_fanout_personal: bool
+    log_format: str
+    log_level: str
+    log_levels: str
+    log_sample: str
+    traffic_record_path: str
+    socketio_message_queue: str
+    cluster_heartbeat: float
+    max_connections: int
+    web_workers: int
+    worker_base_port: int
     cloudinary_cloud_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
+    blocking_pool_size: int
 
     @property
     def cors_origins(self):
@@ -45,7 +87,49 @@ def load_settings() -> Settings:
         db_user=os.getenv("DB_USER", "root"),
         db_password=os.getenv("DB_PASSWORD", ""),
         db_name=os.getenv("DB_NAME", "upred_db"),
+        db_connect_timeout=int(os.getenv("DB_CONNECT_TIMEOUT", "5")),
+        db_pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+        db_pool_timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+        db_pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "3600")),
+        db_pool_ping_interval=int(os.getenv("DB_POOL_PING_INTERVAL", "30")),
+        db_breaker_failures=int(os.getenv("DB_BREAKER_FAILURES", "5")),
+        db_breaker_cooldown=float(os.getenv("DB_BREAKER_COOLDOWN", "5")),
+        db_breaker_half_open_calls=int(os.getenv("DB_BREAKER_HALF_OPEN_CALLS", "1")),
+        room_cache_size=int(os.getenv("ROOM_CACHE_SIZE", "10000")),
+        room_cache_ttl=int(os.getenv("ROOM_CACHE_TTL", "600")),
+        user_cache_size=int(os.getenv("USER_CACHE_SIZE", "20000")),
+        user_cache_ttl=int(os.getenv("USER_CACHE_TTL", "300")),
+        cache_invalidate_token=os.getenv("CACHE_INVALIDATE_TOKEN", ""),
+        group_members_cache_size=int(os.getenv("GROUP_MEMBERS_CACHE_SIZE", "5000")),
+        group_members_cache_ttl=int(os.getenv("GROUP_MEMBERS_CACHE_TTL", "120")),
+        write_behind_enabled=os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes"),
+        write_behind_batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100")),
+        write_behind_linger_ms=int(os.getenv("WRITE_BEHIND_LINGER_MS", "10")),
+        write_behind_max_queue=int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "5000")),
+        write_behind_put_timeout=float(os.getenv("WRITE_BEHIND_PUT_TIMEOUT", "1")),
+        receipt_coalesce_ms=int(os.getenv("RECEIPT_COALESCE_MS", "20")),
+        receipt_batch_size=int(os.getenv("RECEIPT_BATCH_SIZE", "500")),
+        history_buffer_size=int(os.getenv("HISTORY_BUFFER_SIZE", "50")),
+        history_buffer_max_bytes=int(os.getenv("HISTORY_BUFFER_MAX_BYTES", str(32 * 1024 * 1024))),
+        history_buffer_ttl=int(os.getenv("HISTORY_BUFFER_TTL", "300")),
+        offline_spool_dir=os.getenv("OFFLINE_SPOOL_DIR", "offline_spool"),
+        offline_spool_fsync_ms=int(os.getenv("OFFLINE_SPOOL_FSYNC_MS", "50")),
+        offline_spool_replay_interval=float(os.getenv("OFFLINE_SPOOL_REPLAY_INTERVAL", "5")),
+        offline_spool_batch_size=int(os.getenv("OFFLINE_SPOOL_BATCH_SIZE", "200")),
+        auto_rejoin_rooms=os.getenv("AUTO_REJOIN_ROOMS", "true").lower() in ("1", "true", "yes"),
+        group_fanout_personal=os.getenv("GROUP_FANOUT_PERSONAL", "false").lower() in ("1", "true", "yes"),
+        log_format=os.getenv("LOG_FORMAT", "text").lower(),
+        log_level=os.getenv("LOG_LEVEL", "INFO"),
+        log_levels=os.getenv("LOG_LEVELS", ""),
+        log_sample=os.getenv("LOG_SAMPLE", ""),
+        traffic_record_path=os.getenv("TRAFFIC_RECORD_PATH", ""),
+        socketio_message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE", ""),
+        cluster_heartbeat=float(os.getenv("CLUSTER_HEARTBEAT", "5")),
+        max_connections=int(os.getenv("MAX_CONNECTIONS", "10000")),
+        web_workers=int(os.getenv("WEB_WORKERS", "1")),
+        worker_base_port=int(os.getenv("WORKER_BASE_PORT", "0")),
         cloudinary_cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME", ""),
         cloudinary_api_key=os.getenv("CLOUDINARY_API_KEY", ""),
         cloudinary_api_secret=os.getenv("CLOUDINARY_API_SECRET", ""),
+        blocking_pool_size=int(os.getenv("BLOCKING_POOL_SIZE", "4")),
     )
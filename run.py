@@ -6,13 +6,22 @@ Uso: python run.py [options]
 Options:
   --dev              Modo desarrollo (default)
   --prod             Modo producción
+  --workers N        Procesos worker en producción (default: WEB_WORKERS)
   --check            Solo validar sin ejecutar
   --help             Mostrar ayuda
 """
 
+import eventlet
+
+# Debe ejecutarse antes de que validate() importe PyMySQL
+eventlet.monkey_patch()
+
 import sys
 import os
 import argparse
+import signal
+import subprocess
+import time
 from pathlib import Path
 
 
@@ -66,8 +75,18 @@ def validate():
     return True
 
 
+def current_settings():
+    """Settings con .env aplicado (app.py lo carga igual al importarse)"""
+    from dotenv import load_dotenv
+    from config import load_settings
+
+    load_dotenv()
+    return load_settings()
+
+
 def run_dev():
     """Ejecutar en modo desarrollo"""
+    settings = current_settings()
     print("\n" + "="*60)
     print("🚀 Iniciando WebSocket REDUP (Desarrollo)")
     print("="*60)
@@ -77,7 +96,7 @@ def run_dev():
     print("  1. Obtén la IP de esta máquina:")
     print("     Windows: ipconfig | findstr IPv4")
     print("     Linux:   hostname -I")
-    print("  2. En RED-UP Android, configura: http://<IP>:5000")
+    print(f"  2. En RED-UP Android, configura: http://<IP>:{settings.port}")
     print("\n" + "="*60 + "\n")
     
     os.environ["FLASK_ENV"] = "development"
@@ -86,36 +105,129 @@ def run_dev():
     
     socketio.run(
         app,
-        host="0.0.0.0",
-        port=5000,
+        host=settings.host,
+        port=settings.port,
         debug=True,
         use_reloader=False,  # Por si hay issues con reloader
-        log_output=True
+        log_output=True,
+        max_size=settings.max_connections
     )
 
 
-def run_prod():
+def run_prod(workers=1):
     """Ejecutar en modo producción"""
+    settings = current_settings()
+
     print("\n" + "="*60)
     print("🚀 Iniciando WebSocket REDUP (Producción)")
     print("="*60)
     print("Modo de producción activado")
     print("Logs limitados (solo errores)")
+    print(f"Escuchando en {settings.host}:{settings.port} con {workers} worker(s)")
     print("\n" + "="*60 + "\n")
     
     os.environ["FLASK_ENV"] = "production"
     
+    if workers > 1:
+        run_cluster(settings, workers)
+        return
+    
     from app import app, socketio
     
     socketio.run(
         app,
-        host="0.0.0.0",
-        port=5000,
+        host=settings.host,
+        port=settings.port,
+        debug=False,
+        log_output=False,
+        max_size=settings.max_connections
+    )
+
+
+def run_worker(port):
+    """Proceso worker lanzado por run_cluster (solo escucha en localhost)"""
+    os.environ["FLASK_ENV"] = "production"
+    
+    from app import app, settings, socketio
+    
+    socketio.run(
+        app,
+        host="127.0.0.1",
+        port=port,
         debug=False,
-        log_output=False
+        log_output=False,
+        max_size=settings.max_connections
     )
 
 
+def spawn_worker(port, env):
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--worker-port", str(port)],
+        env=env,
+    )
+
+
+def run_cluster(settings, workers):
+    """
+    Levanta `workers` procesos detrás de un proxy con afinidad en HOST:PORT y
+    los reinicia si terminan. Los emits entre workers viajan por
+    SOCKETIO_MESSAGE_QUEUE; si no está configurada se usa el broker local.
+    """
+    from services import LocalBroker, StickyProxy
+
+    env = dict(os.environ, FLASK_ENV="production")
+    broker = None
+    if not settings.socketio_message_queue:
+        broker = LocalBroker("127.0.0.1", 0).start()
+        env["SOCKETIO_MESSAGE_QUEUE"] = f"local://127.0.0.1:{broker.port}"
+
+    base_port = settings.worker_base_port or settings.port + 1
+    ports = [base_port + i for i in range(workers)]
+    procs = [spawn_worker(port, env) for port in ports]
+    # Reinicios recientes por worker, para espaciar los que fallan al arrancar
+    crashes = [[] for _ in ports]
+    restart_at = [None for _ in ports]
+
+    proxy = StickyProxy(settings.host, settings.port, [("127.0.0.1", port) for port in ports]).start()
+    print(f"[SUPERVISOR] Proxy en {settings.host}:{settings.port} -> workers en puertos {ports[0]}-{ports[-1]}")
+
+    def shutdown(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        while True:
+            time.sleep(1)
+            now = time.monotonic()
+            for i, proc in enumerate(procs):
+                if restart_at[i] is not None:
+                    if now >= restart_at[i]:
+                        restart_at[i] = None
+                        procs[i] = spawn_worker(ports[i], env)
+                    continue
+
+                code = proc.poll()
+                if code is None:
+                    continue
+
+                crashes[i] = [t for t in crashes[i] if now - t < 60] + [now]
+                delay = min(2 ** (len(crashes[i]) - 1), 30)
+                restart_at[i] = now + delay
+                print(f"[SUPERVISOR] Worker {i} (puerto {ports[i]}) terminó con código {code}; reinicio en {delay}s")
+    finally:
+        proxy.close()
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if broker is not None:
+            broker.close()
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Iniciador de WebSocket REDUP",
@@ -124,6 +236,7 @@ def main():
 Ejemplos de uso:
   python run.py                    # Modo desarrollo (default)
   python run.py --prod            # Modo producción
+  python run.py --prod --workers 4  # Producción con 4 procesos
   python run.py --check           # Solo validar
   python run.py --help            # Esta ayuda
         """
@@ -140,6 +253,18 @@ Ejemplos de uso:
         action="store_true",
         help="Modo producción"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Procesos worker en producción (default: WEB_WORKERS)"
+    )
+    parser.add_argument(
+        "--worker-port",
+        type=int,
+        default=None,
+        help=argparse.SUPPRESS
+    )
     parser.add_argument(
         "--check",
         action="store_true",
@@ -148,6 +273,11 @@ Ejemplos de uso:
     
     args = parser.parse_args()
     
+    # Los workers los lanza run_cluster después de validar
+    if args.worker_port:
+        run_worker(args.worker_port)
+        return
+    
     # Validar
     if not validate():
         sys.exit(1)
@@ -160,7 +290,8 @@ Ejemplos de uso:
     # Ejecutar
     try:
         if args.prod:
-            run_prod()
+            workers = args.workers if args.workers is not None else current_settings().web_workers
+            run_prod(max(1, workers))
         else:
             run_dev()
     except KeyboardInterrupt:
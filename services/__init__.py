@@ -1 +1,18 @@
 from .cloudinary_service import upload_chat_image
+from .batching import BatchQueueFull, BatchWriter
+from .blocking import BlockingExecutor
+from .cache import TTLCache
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, is_connection_error
+from .cluster import ClusterNode
+from .db_pool import ConnectionPool, PoolTimeoutError
+from .event_log import EventLog, event_log, log, parse_category_map, parse_level
+from .fanout import emit_to_rooms
+from .history_buffer import RecentMessagesBuffer
+from .membership_cache import GroupMembershipIndex
+from .message_queue import LocalBroker, create_bus, create_client_manager
+from .metrics import Histogram, MetricsRegistry
+from .offline_spool import OfflineSpool
+from .presence import PresenceRegistry
+from .room_cache import RoomRegistry
+from .sticky_proxy import StickyProxy
+from .traffic_recorder import TrafficRecorder, read_recording
@@ -0,0 +1,171 @@
+import threading
+import time
+from collections import deque
+
+from .event_log import log
+from .metrics import Histogram
+
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+FLUSH_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class BatchQueueFull(Exception):
+    """La cola del BatchWriter sigue llena tras esperar `put_timeout`"""
+
+
+class BatchWriter:
+    """
+    Cola en proceso que agrupa elementos y los escribe en lotes.
+
+    Un hilo (greenthread con eventlet) toma hasta `max_batch` elementos o los
+    que lleguen durante `linger` segundos desde el primero, y llama a
+    `flush_func(items)`, que debe retornar un resultado por elemento en el mismo
+    orden. Cada elemento puede traer un callback `callback(resultado, error)`
+    que se invoca al terminar su lote.
+
+    La cola está acotada a `max_queue`: `submit` espera hasta `put_timeout`
+    segundos por espacio y luego lanza BatchQueueFull (backpressure).
+
+    Si `flush_func` falla con un lote de varios elementos y `isolate_errors(error)`
+    es verdadero (por omisión, siempre), el lote se parte en mitades y se
+    reintenta cada una: un elemento inválido solo hace fallar su propio
+    callback y no los de otros clientes que cayeron en la misma ventana.
+    """
+
+    def __init__(self, flush_func, max_batch=100, linger=0.01, max_queue=10000, put_timeout=1.0, name="batch",
+                 isolate_errors=None):
+        if max_batch < 1 or max_queue < 1:
+            raise ValueError("max_batch y max_queue deben ser mayores o iguales a 1")
+
+        self.flush_func = flush_func
+        self.max_batch = max_batch
+        self.linger = linger
+        self.max_queue = max_queue
+        self.put_timeout = put_timeout
+        self.name = name
+        self.isolate_errors = isolate_errors
+
+        self._items = deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._stopping = False
+        self._thread = None
+
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.flush_latency = Histogram(FLUSH_LATENCY_BUCKETS)
+        self.flushed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.splits = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"batch-{self.name}", daemon=True)
+            self._thread.start()
+
+    def submit(self, item, callback=None):
+        """Encola un elemento; espera por espacio hasta put_timeout segundos"""
+        deadline = time.monotonic() + self.put_timeout
+        with self._lock:
+            while len(self._items) >= self.max_queue:
+                remaining = deadline - time.monotonic()
+                if self._stopping or remaining <= 0:
+                    self.rejected += 1
+                    raise BatchQueueFull(f"Cola '{self.name}' llena ({self.max_queue} elementos)")
+                self._not_full.wait(remaining)
+
+            if self._stopping:
+                self.rejected += 1
+                raise BatchQueueFull(f"Cola '{self.name}' detenida")
+
+            self._items.append((item, callback))
+            self._not_empty.notify()
+
+    def _take_batch(self):
+        with self._lock:
+            while not self._items and not self._stopping:
+                self._not_empty.wait()
+            if not self._items:
+                return None
+
+            # Esperar a que el lote se llene o venza el linger del primer elemento
+            deadline = time.monotonic() + self.linger
+            while len(self._items) < self.max_batch and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._not_empty.wait(remaining)
+
+            batch = [self._items.popleft() for _ in range(min(self.max_batch, len(self._items)))]
+            self._not_full.notify_all()
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        items = [item for item, _ in batch]
+        started = time.perf_counter()
+        outcomes = self._flush_items(items)
+        self.flush_latency.observe(time.perf_counter() - started)
+        self.batch_sizes.observe(len(items))
+        self.flushed += len(items)
+
+        for (_, callback), (result, error) in zip(batch, outcomes):
+            if callback is None:
+                continue
+            try:
+                callback(result, error)
+            except Exception as e:
+                log("BATCH-ERROR", f"{self.name} callback: {e}")
+
+    def _flush_items(self, items):
+        """Escribe `items`; retorna (resultado, error) por elemento, partiendo el lote si falla"""
+        try:
+            return [(result, None) for result in self.flush_func(items)]
+        except Exception as e:
+            if len(items) > 1 and (self.isolate_errors is None or self.isolate_errors(e)):
+                self.splits += 1
+                log("BATCH-ERROR", f"{self.name}: {e}; reintentando en mitades", items=len(items))
+                middle = len(items) // 2
+                return self._flush_items(items[:middle]) + self._flush_items(items[middle:])
+            log("BATCH-ERROR", f"{self.name}: {e}", items=len(items))
+            self.errors += 1
+            return [(None, e)] * len(items)
+
+    def stop(self, timeout=5.0):
+        """Deja de aceptar elementos y escribe todo lo pendiente"""
+        with self._lock:
+            self._stopping = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        # Lo que el hilo no alcanzó a escribir se escribe aquí mismo
+        while True:
+            with self._lock:
+                batch = [self._items.popleft() for _ in range(min(self.max_batch, len(self._items)))]
+            if not batch:
+                break
+            self._flush(batch)
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._items),
+            "max_queue": self.max_queue,
+            "max_batch": self.max_batch,
+            "linger_ms": round(self.linger * 1000, 3),
+            "flushed": self.flushed,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "splits": self.splits,
+            "batch_size": self.batch_sizes.snapshot(),
+            "flush_latency_seconds": self.flush_latency.snapshot(),
+        }
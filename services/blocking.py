@@ -0,0 +1,40 @@
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+
+
+class BlockingExecutor:
+    """
+    Ejecuta llamadas bloqueantes en los hilos nativos de eventlet (tpool).
+
+    Sirve para código que monkey_patch no puede volver cooperativo (extensiones
+    en C, trabajo intensivo de CPU como firmar y subir imágenes). El semáforo
+    acota cuántas llamadas ocupan hilos a la vez; el resto espera sin bloquear
+    el hub.
+
+    run_green() solo acota la concurrencia y ejecuta la llamada en el
+    greenthread actual: es para librerías cuyo I/O ya volvió cooperativo
+    monkey_patch (el SDK de Cloudinary usa urllib3 sobre sockets verdes), que
+    no deben correr en tpool porque eventlet no soporta I/O verde desde hilos
+    nativos.
+    """
+
+    def __init__(self, max_workers=4):
+        if max_workers < 1:
+            raise ValueError("max_workers debe ser mayor o igual a 1")
+        self.max_workers = max_workers
+        self._slots = Semaphore(max_workers)
+
+    def run(self, func, *args, **kwargs):
+        with self._slots:
+            return tpool.execute(func, *args, **kwargs)
+
+    def run_green(self, func, *args, **kwargs):
+        with self._slots:
+            return func(*args, **kwargs)
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "in_use": self.max_workers - self._slots.counter,
+            "waiting": self._slots.counter - self._slots.balance,
+        }
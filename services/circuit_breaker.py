@@ -0,0 +1,163 @@
+import threading
+import time
+
+import pymysql
+
+from .event_log import INFO, WARNING, log
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpenError(pymysql.err.OperationalError):
+    """La BD se marcó como inaccesible: se falla sin intentar conectar"""
+
+
+def is_connection_error(error):
+    """
+    Errores que indican que MySQL no responde: errores del cliente PyMySQL
+    (códigos 2000+, p. ej. 2003 no se pudo conectar, 2013 conexión perdida),
+    InterfaceError y errores de socket. Los errores que devuelve el servidor
+    (duplicados, deadlocks, sintaxis) significan que sí respondió.
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (pymysql.err.InterfaceError, OSError)):
+        return True
+    if isinstance(error, pymysql.err.OperationalError):
+        code = error.args[0] if error.args else None
+        return not isinstance(code, int) or code >= 2000
+    return False
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker compartido para la capa de BD.
+
+    closed: las llamadas pasan; `failure_threshold` errores de conexión
+    seguidos lo abren. open: allow() retorna False y quien llama falla de
+    inmediato (sin esperar el connect_timeout). Pasados `cooldown` segundos
+    pasa a half_open y deja pasar hasta `half_open_calls` llamadas de prueba:
+    un éxito lo cierra y un error lo vuelve a abrir por otro `cooldown`.
+
+    Con `probe` (una función que consulta la BD y lanza excepción si falla),
+    start() deja un hilo que hace esa llamada de prueba apenas vence el
+    cooldown, así el circuito se cierra aunque no llegue tráfico.
+    `on_open` se llama al abrirse (p. ej. para cerrar las conexiones ociosas).
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=5.0, half_open_calls=1, probe=None, on_open=None, name="mysql"):
+        if failure_threshold < 1 or half_open_calls < 1:
+            raise ValueError("failure_threshold y half_open_calls deben ser mayores o iguales a 1")
+
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.half_open_calls = half_open_calls
+        self.probe = probe
+        self.on_open = on_open
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._tripped = threading.Event()
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_at = 0.0
+        self._trials = 0
+
+        self.opened = 0
+        self.rejected = 0
+        self.probes = 0
+        self.probe_failures = 0
+
+    def allow(self):
+        """True si la llamada puede intentar usar la BD"""
+        if self.state == CLOSED:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN and now - self._opened_at >= self.cooldown:
+                self._set_state(HALF_OPEN)
+                self._half_open_at = now
+                self._trials = 0
+            elif self.state == HALF_OPEN and now - self._half_open_at >= self.cooldown:
+                # Una llamada de prueba no informó resultado a tiempo: se permite otra tanda
+                self._half_open_at = now
+                self._trials = 0
+            if self.state == HALF_OPEN and self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            if self.state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        if self.state == CLOSED and not self._failures:
+            return
+        with self._lock:
+            self._failures = 0
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+                self._tripped.clear()
+
+    def record_failure(self, error=None):
+        opened = False
+        with self._lock:
+            self._failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self._failures >= self.failure_threshold):
+                self._opened_at = time.monotonic()
+                self.opened += 1
+                self._set_state(OPEN, error)
+                self._tripped.set()
+                opened = True
+        if opened and self.on_open is not None:
+            try:
+                self.on_open()
+            except Exception as e:
+                log("DB-BREAKER", f"on_open: {e}", level=WARNING)
+
+    def _set_state(self, state, error=None):
+        previous, self.state = self.state, state
+        if state == OPEN:
+            log("DB-BREAKER", f"{self.name}: {previous} -> open por {self.cooldown}s", level=WARNING,
+                failures=self._failures, error=error)
+        else:
+            log("DB-BREAKER", f"{self.name}: {previous} -> {state}", level=INFO)
+
+    def start(self, spawn):
+        """Inicia el hilo de prueba de salud con `spawn(func)` (p. ej. socketio.start_background_task)"""
+        if self.probe is not None:
+            spawn(self._probe_loop)
+
+    def _probe_loop(self):
+        while True:
+            self._tripped.wait()
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
+                continue
+            if not self.allow():
+                # Las llamadas de prueba de este half_open ya están en curso
+                time.sleep(min(self.cooldown, 1.0))
+                continue
+            self.probes += 1
+            try:
+                self.probe()
+            except Exception as e:
+                self.probe_failures += 1
+                self.record_failure(e)
+            else:
+                self.record_success()
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "failure_threshold": self.failure_threshold,
+            "cooldown": self.cooldown,
+            "open_for": round(time.monotonic() - self._opened_at, 3) if self.state != CLOSED else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "probes": self.probes,
+            "probe_failures": self.probe_failures,
+        }
@@ -0,0 +1,168 @@
+import json
+import threading
+import time
+import uuid as uuid_pkg
+
+from .event_log import log
+
+
+class ClusterNode:
+    """
+    Coordinación entre workers que comparten una cola de mensajes.
+
+    Publica eventos propios de la aplicación en `channel` (separado del canal
+    de Socket.IO) y mantiene una vista global de presencia: cada worker anuncia
+    cuándo un usuario pasa a tener su primera conexión o pierde la última, y
+    cada `heartbeat` segundos publica su lista completa. Un worker que no se
+    reporta en `expiry` segundos se da por caído y sus usuarios se descartan.
+
+    Sin `bus` funciona como un único worker (solo presencia local).
+    """
+
+    def __init__(self, bus=None, channel="upred-cluster", heartbeat=5.0, expiry=15.0):
+        self.bus = bus
+        self.channel = channel
+        self.heartbeat = heartbeat
+        self.expiry = expiry
+        self.worker_id = uuid_pkg.uuid4().hex
+
+        self._local = {}
+        self._remote = {}
+        self._handlers = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+        self.events_published = 0
+        self.events_received = 0
+
+    # ----------------------------------------------------------------
+    # Eventos
+    # ----------------------------------------------------------------
+
+    def on(self, kind, handler):
+        """Registra `handler(payload)` para los eventos `kind` de otros workers"""
+        self._handlers[kind] = handler
+
+    def publish(self, kind, payload=None):
+        if self.bus is None:
+            return
+        message = json.dumps({"w": self.worker_id, "k": kind, "p": payload})
+        try:
+            self.bus.publish(self.channel, message)
+            self.events_published += 1
+        except Exception as e:
+            log("CLUSTER-ERROR", f"No se pudo publicar {kind}: {e}")
+
+    def start(self, spawn):
+        """Inicia escucha y heartbeat con `spawn(func)` (p. ej. socketio.start_background_task)"""
+        if self.bus is None or self._started:
+            return
+        self._started = True
+        spawn(self._listen)
+        spawn(self._heartbeat)
+        self.publish("hello")
+
+    def _listen(self):
+        for raw in self.bus.listen(self.channel):
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            if message.get("w") == self.worker_id:
+                continue
+            self.events_received += 1
+            try:
+                self._dispatch(message["w"], message["k"], message.get("p"))
+            except Exception as e:
+                log("CLUSTER-ERROR", f"Evento {message.get('k')}: {e}")
+
+    def _dispatch(self, worker_id, kind, payload):
+        if kind == "hello":
+            # Un worker nuevo necesita la presencia actual de los demás
+            self._publish_snapshot()
+        elif kind == "snapshot":
+            with self._lock:
+                self._remote[worker_id] = (set(payload), time.monotonic())
+        elif kind == "online":
+            with self._lock:
+                users, _ = self._remote.get(worker_id, (set(), None))
+                users.add(payload)
+                self._remote[worker_id] = (users, time.monotonic())
+        elif kind == "offline":
+            with self._lock:
+                users, _ = self._remote.get(worker_id, (set(), None))
+                users.discard(payload)
+                self._remote[worker_id] = (users, time.monotonic())
+        elif kind == "bye":
+            with self._lock:
+                self._remote.pop(worker_id, None)
+        else:
+            handler = self._handlers.get(kind)
+            if handler is not None:
+                handler(payload)
+
+    def _publish_snapshot(self):
+        with self._lock:
+            users = list(self._local)
+        self.publish("snapshot", users)
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat)
+            self._publish_snapshot()
+            limit = time.monotonic() - self.expiry
+            with self._lock:
+                for worker_id, (_, seen) in list(self._remote.items()):
+                    if seen < limit:
+                        del self._remote[worker_id]
+                        log("CLUSTER", f"Worker {worker_id[:8]} sin heartbeat, se descarta su presencia")
+
+    def stop(self):
+        self.publish("bye")
+
+    # ----------------------------------------------------------------
+    # Presencia
+    # ----------------------------------------------------------------
+
+    def user_connected(self, user_id):
+        with self._lock:
+            count = self._local.get(user_id, 0)
+            self._local[user_id] = count + 1
+        if count == 0:
+            self.publish("online", user_id)
+
+    def user_disconnected(self, user_id):
+        with self._lock:
+            count = self._local.get(user_id, 0)
+            if count <= 1:
+                self._local.pop(user_id, None)
+            else:
+                self._local[user_id] = count - 1
+        if count == 1:
+            self.publish("offline", user_id)
+
+    def is_online(self, user_id):
+        with self._lock:
+            if user_id in self._local:
+                return True
+            return any(user_id in users for users, _ in self._remote.values())
+
+    def online_users(self):
+        with self._lock:
+            users = set(self._local)
+            for remote_users, _ in self._remote.values():
+                users |= remote_users
+        return users
+
+    def stats(self):
+        with self._lock:
+            local_users = len(self._local)
+            workers = len(self._remote) + 1
+        return {
+            "worker_id": self.worker_id,
+            "workers": workers,
+            "local_users": local_users,
+            "online_users": len(self.online_users()),
+            "events_published": self.events_published,
+            "events_received": self.events_received,
+        }
@@ -0,0 +1,194 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+
+
+class PoolTimeoutError(Exception):
+    """No se obtuvo una conexión libre del pool dentro del tiempo de espera"""
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created_at", "last_used_at", "generation")
+
+    def __init__(self, conn, generation=0):
+        now = time.monotonic()
+        self.conn = conn
+        self.created_at = now
+        self.last_used_at = now
+        self.generation = generation
+
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones PyMySQL.
+
+    Usa primitivas de `threading`, que eventlet convierte en verdes con
+    monkey_patch, así que un cliente esperando una conexión no bloquea el hub.
+    Las conexiones ociosas se reutilizan en orden LIFO (la más reciente primero),
+    se verifican con ping si llevan demasiado tiempo sin usarse y se reciclan al
+    superar su edad máxima.
+
+    close_all() incrementa la generación del pool: las conexiones prestadas en
+    ese momento se cierran al devolverse en vez de volver a la lista ociosa.
+    """
+
+    def __init__(self, connect_kwargs, max_size=10, timeout=5.0, recycle=3600, ping_interval=30):
+        if max_size < 1:
+            raise ValueError("max_size debe ser mayor o igual a 1")
+
+        self.connect_kwargs = dict(connect_kwargs)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []
+        self._size = 0
+        self._waiting = 0
+        self._generation = 0
+
+        # Contadores para estadísticas
+        self._checkouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._discarded = 0
+        self._timeouts = 0
+        self._wait_time = 0.0
+
+    def _connect(self):
+        generation = self._generation
+        conn = pymysql.connect(**self.connect_kwargs)
+        with self._cond:
+            self._created += 1
+        return _PooledConnection(conn, generation)
+
+    def _close_quietly(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+
+    def _validate(self, pooled):
+        """Recicla o verifica una conexión ociosa antes de entregarla"""
+        now = time.monotonic()
+
+        if self.recycle and now - pooled.created_at > self.recycle:
+            self._close_quietly(pooled)
+            with self._cond:
+                self._recycled += 1
+            return self._connect()
+
+        if self.ping_interval is not None and now - pooled.last_used_at > self.ping_interval:
+            try:
+                pooled.conn.ping(reconnect=False)
+            except Exception:
+                self._close_quietly(pooled)
+                with self._cond:
+                    self._discarded += 1
+                return self._connect()
+
+        return pooled
+
+    def acquire(self, timeout=None):
+        """Toma una conexión del pool, esperando hasta `timeout` segundos"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        pooled = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    pooled = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    # Reservar el lugar; la conexión se abre fuera del lock
+                    self._size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Sin conexiones disponibles tras {timeout}s (max_size={self.max_size})"
+                    )
+
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+
+            self._checkouts += 1
+            self._wait_time += time.monotonic() - started
+
+        try:
+            if pooled is None:
+                return self._connect()
+            return self._validate(pooled)
+        except Exception:
+            # No se pudo abrir la conexión: liberar el lugar reservado
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, pooled, broken=False):
+        """Devuelve una conexión al pool o la descarta si quedó inservible"""
+        if broken or not pooled.conn.open or pooled.generation != self._generation:
+            self._close_quietly(pooled)
+            with self._cond:
+                self._size -= 1
+                self._discarded += 1
+                self._cond.notify()
+            return
+
+        pooled.last_used_at = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Context manager que presta una conexión y la devuelve al terminar"""
+        pooled = self.acquire(timeout)
+        broken = False
+        try:
+            yield pooled.conn
+        except (pymysql.err.OperationalError, pymysql.err.InterfaceError):
+            # Error a nivel de conexión (caída, timeout, etc.): no reutilizar
+            broken = True
+            raise
+        finally:
+            self.release(pooled, broken=broken)
+
+    def close_all(self):
+        """Cierra las conexiones ociosas (las prestadas se cierran al devolverse)"""
+        with self._cond:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._close_quietly(pooled)
+
+    def stats(self):
+        with self._cond:
+            idle = len(self._idle)
+            return {
+                "max_size": self.max_size,
+                "generation": self._generation,
+                "size": self._size,
+                "idle": idle,
+                "in_use": self._size - idle,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "created": self._created,
+                "recycled": self._recycled,
+                "discarded": self._discarded,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._wait_time * 1000 / self._checkouts, 3) if self._checkouts else 0.0,
+            }
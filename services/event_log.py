@@ -0,0 +1,243 @@
+import atexit
+import json
+import sys
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+from eventlet.patcher import original
+
+# Hilo nativo aunque el proceso use monkey_patch: si stdout se vuelve lento,
+# el que espera es el hilo escritor y no el hub de eventlet
+_threading = original("threading")
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+LEVELS = {name: level for level, name in LEVEL_NAMES.items()}
+
+# Categoría de cada etiqueta; las que no aparecen van a "server"
+TAG_CATEGORIES = {
+    "CONNECT": "connections",
+    "CONNECT-ERROR": "connections",
+    "DISCONNECT": "connections",
+    "REJOIN": "connections",
+    "JOIN_DIRECT_CHAT": "rooms",
+    "JOIN_GROUP": "rooms",
+    "JOIN_ROOMS": "rooms",
+    "LEAVE_GROUP": "rooms",
+    "SEND_MESSAGE": "messages",
+    "MESSAGE_SENT": "messages",
+    "OFFLINE": "messages",
+    "WRITE_BEHIND": "messages",
+    "MARK_DELIVERED": "receipts",
+    "MARK_READ": "receipts",
+    "MARK_DELIVERED_BULK": "receipts",
+    "MARK_READ_BULK": "receipts",
+    "MARK_ROOM_READ": "receipts",
+    "LOAD_HISTORY": "history",
+    "HISTORY_SENT": "history",
+    "HISTORY_STREAMED": "history",
+    "DB-ERROR": "db",
+    "DB-BREAKER": "db",
+    "BATCH-ERROR": "db",
+    "CACHE_INVALIDATE": "cluster",
+    "CLUSTER": "cluster",
+    "CLUSTER-ERROR": "cluster",
+    "BROKER": "cluster",
+    "BROKER-ERROR": "cluster",
+    "PROXY-ERROR": "cluster",
+}
+
+
+def tag_level(tag):
+    """Nivel por defecto de una etiqueta: *ERROR es ERROR, WARN/WARNING/ADVERTENCIA es WARNING"""
+    if tag.endswith("ERROR"):
+        return ERROR
+    if tag in ("WARN", "WARNING", "ADVERTENCIA"):
+        return WARNING
+    return INFO
+
+
+def parse_level(value):
+    value = str(value).strip().upper()
+    if value.isdigit():
+        return int(value)
+    if value not in LEVELS:
+        raise ValueError(f"Nivel de log inválido: {value}")
+    return LEVELS[value]
+
+
+def parse_category_map(text, convert):
+    """'messages=WARNING,receipts=0.1' -> {"messages": convert("WARNING"), ...}"""
+    result = {}
+    for item in (text or "").split(","):
+        if not item.strip():
+            continue
+        category, _, value = item.partition("=")
+        result[category.strip()] = convert(value.strip())
+    return result
+
+
+class EventLog:
+    """
+    Logs del servidor con una etiqueta por evento ("[SEND_MESSAGE] ...").
+
+    log() solo decide si el evento pasa (nivel de su categoría y muestreo) y
+    lo agrega a una cola acotada (un deque: append sin locks); un hilo nativo
+    da formato (texto o JSON) y escribe en lotes, y solo se le despierta
+    cuando estaba ocioso. Si la cola se llena el evento se descarta y se
+    cuenta en `dropped`: un log nunca frena el envío de mensajes.
+
+    El muestreo conserva 1 de cada N eventos de la categoría (tasa 0.1 = 1 de
+    cada 10) y nunca se aplica a WARNING ni ERROR.
+    """
+
+    def __init__(self, stream=None, json_output=False, level=INFO, levels=None, sample=None, max_queue=10000):
+        self.stream = stream
+        self.max_queue = max_queue
+        self._pending = deque()
+        self._wake = _threading.Event()
+        self._idle = False
+        self._closing = False
+        self._thread = None
+        self._start_lock = _threading.Lock()
+        self._counters = {}
+        self._tag_levels = {}
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.configure(json_output, level, levels, sample)
+
+    def configure(self, json_output=False, level=INFO, levels=None, sample=None):
+        self.json_output = json_output
+        self.level = parse_level(level) if isinstance(level, str) else level
+        self.levels = {category: parse_level(value) if isinstance(value, str) else value for category, value in (levels or {}).items()}
+        self.sample_every = {}
+        for category, rate in (sample or {}).items():
+            rate = float(rate)
+            if rate <= 0 or rate > 1:
+                raise ValueError(f"Tasa de muestreo inválida para {category}: {rate}")
+            if rate < 1:
+                self.sample_every[category] = max(1, round(1 / rate))
+
+    def enabled(self, tag, level=None):
+        category = TAG_CATEGORIES.get(tag, "server")
+        if level is None:
+            level = self._level_of(tag)
+        return level >= self.levels.get(category, self.level)
+
+    def _level_of(self, tag):
+        level = self._tag_levels.get(tag)
+        if level is None:
+            level = self._tag_levels[tag] = tag_level(tag)
+        return level
+
+    def log(self, tag, message="", level=None, **fields):
+        category = TAG_CATEGORIES.get(tag, "server")
+        if level is None:
+            level = self._level_of(tag)
+        if level < self.levels.get(category, self.level):
+            return
+
+        every = self.sample_every.get(category)
+        if every is not None and level < WARNING:
+            count = self._counters.get(category, 0) + 1
+            self._counters[category] = count
+            if count % every:
+                self.sampled_out += 1
+                return
+
+        if self._thread is None:
+            self.start()
+        if len(self._pending) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._pending.append((time.time(), level, category, tag, message, fields))
+        self.queued += 1
+        if self._idle:
+            self._idle = False
+            self._wake.set()
+
+    def format(self, record):
+        timestamp, level, category, tag, message, fields = record
+        if self.json_output:
+            data = {
+                "ts": datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="milliseconds"),
+                "level": LEVEL_NAMES.get(level, str(level)),
+                "category": category,
+                "tag": tag,
+            }
+            if message:
+                data["msg"] = str(message)
+            data.update(fields)
+            return json.dumps(data, ensure_ascii=False, default=str)
+
+        parts = [str(message)] if message else []
+        parts.extend(f"{name}={value}" for name, value in fields.items())
+        return f"[{tag}] " + " | ".join(parts)
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._closing = False
+                self._thread = _threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        return self
+
+    def _run(self):
+        pending = self._pending
+        while True:
+            if not pending:
+                if self._closing:
+                    return
+                self._idle = True
+                # Revisar de nuevo: pudo llegar un evento antes de marcarse ocioso
+                if not pending:
+                    self._wake.wait(0.2)
+                self._wake.clear()
+                self._idle = False
+                continue
+
+            lines = []
+            while pending and len(lines) < 512:
+                record = pending.popleft()
+                try:
+                    lines.append(self.format(record))
+                except Exception as e:
+                    lines.append(f"[LOG-ERROR] {record[3]}: {e}")
+
+            stream = self.stream or sys.stdout
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                self.dropped += len(lines)
+                continue
+            self.written += len(lines)
+
+    def close(self, timeout=2.0):
+        """Escribe lo pendiente y detiene el hilo escritor"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._closing = True
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        return {
+            "format": "json" if self.json_output else "text",
+            "pending": len(self._pending),
+            "queued": self.queued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+        }
+
+
+# Instancia del proceso; app.py la configura con los LOG_* de .env
+event_log = EventLog()
+log = event_log.log
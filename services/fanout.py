@@ -0,0 +1,20 @@
+def unique_rooms(rooms):
+    """Nombres de room sin vacíos ni repetidos, en el orden recibido"""
+    return list(dict.fromkeys(str(room) for room in rooms if room))
+
+
+def emit_to_rooms(socketio, event, data, rooms, skip_sid=None):
+    """
+    Emite `event` una sola vez a la unión de `rooms`.
+
+    python-socketio codifica el paquete una vez por emit y lo reenvía a cada
+    sid de la unión de las rooms de la lista, así que un socket que está en
+    varias de ellas (la sala y su room personal) recibe una sola copia. Con
+    cola de mensajes también se publica un único mensaje para todos los
+    workers. Retorna cuántas rooms se incluyeron.
+    """
+    targets = unique_rooms(rooms)
+    if not targets:
+        return 0
+    socketio.emit(event, data, to=targets[0] if len(targets) == 1 else targets, skip_sid=skip_sid)
+    return len(targets)
@@ -0,0 +1,223 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+
+def message_key(entry):
+    """
+    Orden de los mensajes: (enviado_en, id), la misma clave de la paginación
+    por keyset de la BD. Con write-behind enviado_en se fija al encolar, así
+    que un id mayor puede tener un enviado_en menor.
+    """
+    try:
+        sent_at = datetime.fromisoformat(str(entry["enviado_en"]))
+    except ValueError:
+        sent_at = datetime.min
+    return sent_at, int(entry["id"])
+
+
+class _RoomHistory:
+    __slots__ = ("messages", "exhaustive", "size", "primed_at")
+
+    def __init__(self, messages, exhaustive, size):
+        self.messages = messages
+        self.exhaustive = exhaustive
+        self.size = size
+        self.primed_at = time.monotonic()
+
+
+class RecentMessagesBuffer:
+    """
+    Buffer en memoria con los últimos `per_room` mensajes de cada sala, ya con la
+    forma que recibe el cliente en message_history_loaded.
+
+    Una sala entra al buffer cuando se carga su historial más reciente desde la
+    BD (`prime`); a partir de ahí el camino de envío agrega cada mensaje nuevo
+    (`append`). `exhaustive` indica que el buffer contiene la sala completa.
+
+    El total está acotado a `max_bytes` (tamaño aproximado de los textos): al
+    superarlo se descartan las salas usadas hace más tiempo. Las ediciones y
+    borrados (hechos por el backend) llegan con `invalidate_room`; además cada
+    sala vence a los `ttl` segundos de cargada.
+
+    Los mensajes se ordenan y paginan por (enviado_en, id), igual que
+    build_history_query, para que un cursor dé la misma página con o sin buffer.
+    """
+
+    def __init__(self, per_room=50, max_bytes=32 * 1024 * 1024, ttl=300, max_versions=100000):
+        if per_room < 1:
+            raise ValueError("per_room debe ser mayor o igual a 1")
+        self.per_room = per_room
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_versions = max_versions
+
+        self._rooms = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _entry_size(entry):
+        return 64 + sum(len(value) for value in entry.values() if isinstance(value, str))
+
+    def _bump_version(self, sala_uuid):
+        if len(self._versions) >= self.max_versions:
+            self._versions.clear()
+        self._versions[sala_uuid] = self._versions.get(sala_uuid, 0) + 1
+
+    def _drop(self, sala_uuid):
+        room = self._rooms.pop(sala_uuid, None)
+        if room is not None:
+            self._bytes -= room.size
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._rooms:
+            _, room = self._rooms.popitem(last=False)
+            self._bytes -= room.size
+            self.evictions += 1
+
+    def _get_room(self, sala_uuid):
+        room = self._rooms.get(sala_uuid)
+        if room is None:
+            return None
+        if self.ttl and time.monotonic() - room.primed_at > self.ttl:
+            self._drop(sala_uuid)
+            return None
+        self._rooms.move_to_end(sala_uuid)
+        return room
+
+    def version(self, sala_uuid):
+        """Marca a tomar antes de leer la BD; `prime` la usa para no cargar datos viejos"""
+        with self._lock:
+            return self._versions.get(str(sala_uuid), 0)
+
+    def prime(self, sala_uuid, entries, exhaustive, version=None):
+        """
+        Carga los mensajes más recientes de una sala (de antiguo a nuevo).
+        Si hubo envíos a la sala desde que se tomó `version`, no se carga nada.
+        """
+        sala_uuid = str(sala_uuid)
+        entries = list(entries)
+        if len(entries) > self.per_room:
+            entries = entries[-self.per_room:]
+            exhaustive = False
+
+        with self._lock:
+            if version is not None and self._versions.get(sala_uuid, 0) != version:
+                return False
+            self._drop(sala_uuid)
+            size = sum(self._entry_size(entry) for entry in entries)
+            self._rooms[sala_uuid] = _RoomHistory(entries, exhaustive, size)
+            self._bytes += size
+            self._evict()
+            return True
+
+    def append(self, sala_uuid, entry):
+        """Agrega un mensaje recién guardado; solo tiene efecto si la sala ya está cargada"""
+        sala_uuid = str(sala_uuid)
+        with self._lock:
+            self._bump_version(sala_uuid)
+            room = self._get_room(sala_uuid)
+            if room is None:
+                return False
+
+            # Mantener el orden (enviado_en, id) aunque dos envíos terminen desordenados
+            messages = room.messages
+            key = message_key(entry)
+            position = len(messages)
+            while position > 0 and message_key(messages[position - 1]) > key:
+                position -= 1
+            messages.insert(position, entry)
+            added = self._entry_size(entry)
+            room.size += added
+            self._bytes += added
+
+            while len(messages) > self.per_room:
+                room.size -= self._entry_size(messages[0])
+                self._bytes -= self._entry_size(messages[0])
+                del messages[0]
+                room.exhaustive = False
+
+            self._evict()
+            return True
+
+    def get_page(self, sala_uuid, limit, before_id=None, after_id=None):
+        """
+        Retorna {"messages", "has_more", "next_cursor", "direction"} con la misma
+        semántica que la paginación por cursor de la BD, o None si la página no
+        está completa en el buffer.
+        """
+        sala_uuid = str(sala_uuid)
+        with self._lock:
+            room = self._get_room(sala_uuid)
+            if room is None:
+                self.misses += 1
+                return None
+
+            messages = room.messages
+            cursor_id = after_id if after_id is not None else before_id
+            cursor = None
+            if cursor_id is not None:
+                # La posición del cursor depende de su enviado_en: si no está en
+                # el buffer, solo la BD sabe dónde cae
+                cursor = next((i for i, m in enumerate(messages) if int(m["id"]) == cursor_id), None)
+                if cursor is None:
+                    self.misses += 1
+                    return None
+
+            if after_id is not None:
+                start = cursor + 1
+                page = messages[start:start + limit]
+                has_more = start + limit < len(messages)
+                next_cursor = page[-1]["id"] if has_more and page else None
+                direction = "after"
+            else:
+                end = len(messages) if cursor is None else cursor
+                start = end - limit
+                if start < 0:
+                    if not room.exhaustive:
+                        self.misses += 1
+                        return None
+                    start = 0
+                page = messages[start:end]
+                has_more = start > 0 or not room.exhaustive
+                next_cursor = page[0]["id"] if has_more and page else None
+                direction = "before"
+
+            self.hits += 1
+            return {
+                "messages": list(page),
+                "has_more": has_more,
+                "next_cursor": next_cursor,
+                "direction": direction,
+            }
+
+    def invalidate_room(self, sala_uuid):
+        with self._lock:
+            self._bump_version(str(sala_uuid))
+            self._drop(str(sala_uuid))
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "rooms": len(self._rooms),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "per_room": self.per_room,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
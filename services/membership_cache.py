@@ -0,0 +1,54 @@
+from .cache import TTLCache
+
+
+class GroupMembershipIndex:
+    """
+    Índice en memoria grupo_id -> frozenset(usuario_id) de miembros activos.
+
+    Cada grupo se carga completo la primera vez que se consulta (`loader`
+    retorna sus usuario_id) y vence a los `ttl` segundos. Como una respuesta
+    negativa puede venir de un índice viejo (alguien que se unió hace poco),
+    quien consulta puede confirmarla contra la BD y registrar al miembro con
+    `add_member`.
+    """
+
+    def __init__(self, maxsize=5000, ttl=120):
+        self._groups = TTLCache(maxsize, ttl)
+        self.negative_rechecks = 0
+
+    def members(self, group_id, loader):
+        """Miembros del grupo; usa `loader(group_id)` si no está en memoria"""
+        group_id = int(group_id)
+        members = self._groups.get(group_id)
+        if members is None:
+            members = frozenset(int(user_id) for user_id in loader(group_id))
+            self._groups.set(group_id, members)
+        return members
+
+    def cached_members(self, group_id):
+        """Miembros si el grupo ya está en memoria, o None sin cargarlo"""
+        return self._groups.peek(int(group_id))
+
+    # Altas y bajas conocidas se aplican al conjunto en memoria sin renovar su
+    # TTL: el grupo se sigue recargando completo desde la BD al vencer
+
+    def add_member(self, group_id, user_id):
+        members = self._groups.peek(int(group_id))
+        if members is not None:
+            self._groups.replace(int(group_id), members | {int(user_id)})
+
+    def remove_member(self, group_id, user_id):
+        members = self._groups.peek(int(group_id))
+        if members is not None:
+            self._groups.replace(int(group_id), members - {int(user_id)})
+
+    def invalidate(self, group_id):
+        self._groups.pop(int(group_id))
+
+    def clear(self):
+        self._groups.clear()
+
+    def stats(self):
+        stats = self._groups.stats()
+        stats["negative_rechecks"] = self.negative_rechecks
+        return stats
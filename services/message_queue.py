@@ -0,0 +1,223 @@
+import json
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+from .event_log import log
+
+
+def _parse_local_url(url):
+    parsed = urlparse(url)
+    return parsed.hostname or "127.0.0.1", parsed.port or 6390
+
+
+class LocalBroker:
+    """
+    Broker pub/sub mínimo sobre TCP para correr varios workers sin Redis.
+
+    Protocolo de líneas JSON: el cliente envía {"sub": canal} o
+    {"pub": canal, "data": texto} y recibe esa misma línea de publicación por
+    cada mensaje de los canales a los que se suscribió. No guarda
+    mensajes: quien no está conectado al publicar, no los recibe.
+    """
+
+    def __init__(self, host="127.0.0.1", port=6390):
+        self.host = host
+        self.port = port
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._ready = threading.Event()
+        self.published = 0
+
+    def serve_forever(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(128)
+        self.port = self._server.getsockname()[1]
+        self._ready.set()
+        log("BROKER", f"Escuchando en local://{self.host}:{self.port}")
+
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve_client, args=(conn,), daemon=True).start()
+
+    def start(self):
+        """Inicia el broker en segundo plano y espera a que acepte conexiones"""
+        thread = threading.Thread(target=self.serve_forever, name="local-broker", daemon=True)
+        thread.start()
+        self._ready.wait(5)
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    def _serve_client(self, conn):
+        send_lock = threading.Lock()
+        channels = set()
+        try:
+            for line in conn.makefile("rb"):
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if "sub" in message:
+                    channels.add(message["sub"])
+                    with self._lock:
+                        self._subscribers.setdefault(message["sub"], {})[conn] = send_lock
+                elif "pub" in message:
+                    self._publish(message["pub"], line)
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                for channel in channels:
+                    self._subscribers.get(channel, {}).pop(conn, None)
+            conn.close()
+
+    def _publish(self, channel, line):
+        # Se reenvía la línea tal cual: el cliente ya la recibe con "data"
+        with self._lock:
+            targets = list(self._subscribers.get(channel, {}).items())
+        self.published += 1
+        for conn, send_lock in targets:
+            try:
+                with send_lock:
+                    conn.sendall(line)
+            except OSError:
+                pass
+
+
+class LocalBrokerClient:
+    """Cliente del LocalBroker con la misma interfaz que RedisBus"""
+
+    def __init__(self, url):
+        self.address = _parse_local_url(url)
+        self._pub_conn = None
+        self._pub_lock = threading.Lock()
+
+    def _connect(self):
+        conn = socket.create_connection(self.address, timeout=5)
+        conn.settimeout(None)
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def publish(self, channel, data):
+        line = (json.dumps({"pub": channel, "data": data}) + "\n").encode()
+        with self._pub_lock:
+            for attempt in range(2):
+                try:
+                    if self._pub_conn is None:
+                        self._pub_conn = self._connect()
+                    self._pub_conn.sendall(line)
+                    return
+                except OSError:
+                    if self._pub_conn is not None:
+                        self._pub_conn.close()
+                    self._pub_conn = None
+                    if attempt:
+                        raise
+
+    def listen(self, channel):
+        """Generador con los mensajes del canal; se reconecta si se cae el broker"""
+        retry = 0.1
+        while True:
+            try:
+                conn = self._connect()
+                conn.sendall((json.dumps({"sub": channel}) + "\n").encode())
+                retry = 0.1
+                for line in conn.makefile("rb"):
+                    yield json.loads(line)["data"]
+            except (OSError, ValueError) as e:
+                log("BROKER-ERROR", f"Conexión perdida con {self.address}: {e}")
+            time.sleep(retry)
+            retry = min(retry * 2, 5)
+
+
+class RedisBus:
+    """Pub/sub sobre Redis (requiere el paquete `redis`)"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("Instala 'redis' para usar SOCKETIO_MESSAGE_QUEUE=redis://...")
+        self.url = url
+        self._redis = redis.Redis.from_url(url)
+
+    def publish(self, channel, data):
+        self._redis.publish(channel, data)
+
+    def listen(self, channel):
+        retry = 0.1
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(channel)
+                retry = 0.1
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        data = message["data"]
+                        yield data.decode() if isinstance(data, bytes) else data
+            except Exception as e:
+                log("BROKER-ERROR", f"Conexión perdida con Redis: {e}")
+            time.sleep(retry)
+            retry = min(retry * 2, 5)
+
+
+def create_bus(url):
+    """Cliente pub/sub según el esquema: redis://, rediss:// o local://host:puerto"""
+    scheme = urlparse(url).scheme
+    if scheme in ("redis", "rediss"):
+        return RedisBus(url)
+    if scheme == "local":
+        return LocalBrokerClient(url)
+    raise ValueError(f"Cola de mensajes no soportada: {url}")
+
+
+class LocalBrokerManager(socketio.PubSubManager):
+    """Client manager de python-socketio que comparte emits por el LocalBroker"""
+
+    name = "localbroker"
+
+    def __init__(self, url="local://127.0.0.1:6390", channel="socketio", write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.bus = LocalBrokerClient(url)
+
+    def _publish(self, data):
+        self.bus.publish(self.channel, json.dumps(data))
+
+    def _listen(self):
+        yield from self.bus.listen(self.channel)
+
+
+def create_client_manager(url, channel="socketio"):
+    """
+    Client manager para SocketIO(client_manager=...). Redis usa el RedisManager
+    de python-socketio; local:// usa el LocalBroker.
+    """
+    scheme = urlparse(url).scheme
+    if scheme in ("redis", "rediss"):
+        return socketio.RedisManager(url, channel=channel)
+    if scheme == "local":
+        return LocalBrokerManager(url, channel=channel)
+    raise ValueError(f"Cola de mensajes no soportada: {url}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Broker pub/sub local para workers de WebSocket REDUP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args()
+    LocalBroker(args.host, args.port).serve_forever()
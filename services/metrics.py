@@ -0,0 +1,137 @@
+import threading
+from bisect import bisect_left
+
+
+class Histogram:
+    """
+    Histograma con buckets fijos, acumulable al estilo Prometheus
+    (cada bucket cuenta las observaciones <= a su límite).
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._lock = threading.Lock()
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self.sum, self.count
+
+        # Claves de texto como las etiquetas `le` de Prometheus: JSON-serializables y ordenables
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            running += bucket_count
+            cumulative[format(bound, "g")] = running
+        cumulative["+Inf"] = count
+        return {"buckets": cumulative, "sum": round(total, 6), "count": count}
+
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        return format(value, ".10g")
+    return str(value)
+
+
+class MetricsRegistry:
+    """
+    Métricas en formato de texto de Prometheus.
+
+    Cada métrica tiene a lo sumo una etiqueta (event, handler, cache...), así
+    incrementar es sumar en un dict por (nombre, valor de etiqueta) sin armar
+    tuplas de etiquetas. Los gauges son funciones que se evalúan al exportar
+    y pueden retornar un número o {valor de etiqueta: número}.
+    """
+
+    def __init__(self, prefix="upred"):
+        self.prefix = prefix
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text, label=None):
+        self._meta[name] = ("counter", help_text, label, None)
+
+    def histogram(self, name, help_text, label=None, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ("histogram", help_text, label, tuple(buckets))
+
+    def gauge(self, name, help_text, func, label=None, kind="gauge"):
+        """`kind="counter"` exporta como counter un total que ya lleva otro objeto"""
+        self._meta[name] = (kind, help_text, label, None)
+        self._gauges[name] = func
+
+    def inc(self, name, label_value=None, value=1):
+        key = (name, label_value)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, label_value=None):
+        key = (name, label_value)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self._meta[name][3]))
+        histogram.observe(value)
+
+    def value(self, name, label_value=None):
+        return self._counters.get((name, label_value), 0)
+
+    def render(self):
+        counters = dict(self._counters)
+        histograms = dict(self._histograms)
+        lines = []
+        for name, (kind, help_text, label, _) in self._meta.items():
+            full_name = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+
+            if name in self._gauges:
+                try:
+                    values = self._gauges[name]()
+                except Exception:
+                    continue
+                items = values.items() if isinstance(values, dict) else [(None, values)]
+            elif kind == "counter":
+                items = [(key[1], value) for key, value in counters.items() if key[0] == name]
+            else:
+                items = None
+
+            if items is not None:
+                for label_value, value in items:
+                    if value is None:
+                        continue
+                    labels = f'{{{label}="{_escape(label_value)}"}}' if label and label_value is not None else ""
+                    lines.append(f"{full_name}{labels} {_number(value)}")
+                continue
+
+            for (metric, label_value), histogram in histograms.items():
+                if metric != name:
+                    continue
+                snapshot = histogram.snapshot()
+                base = f'{label}="{_escape(label_value)}",' if label and label_value is not None else ""
+                for bound, count in snapshot["buckets"].items():
+                    lines.append(f'{full_name}_bucket{{{base}le="{bound}"}} {count}')
+                suffix = f"{{{base[:-1]}}}" if base else ""
+                lines.append(f"{full_name}_sum{suffix} {_number(snapshot['sum'])}")
+                lines.append(f"{full_name}_count{suffix} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,354 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from eventlet.patcher import original
+
+from .event_log import log
+from .metrics import Histogram
+
+# fsync bloquea el proceso entero: se hace en un hilo nativo, fuera del hub
+_threading = original("threading")
+_time = original("time")
+
+PREFIX = "spool-"
+SUFFIX = ".jsonl"
+CHECKPOINT = ".done"
+QUARANTINE = "quarantine.jsonl"
+
+REPLAY_BATCH_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class OfflineSpool:
+    """
+    Diario local de solo anexado para los mensajes enviados en modo offline
+    (MySQL caído), con un replayer que los inserta cuando la BD vuelve.
+
+    append() solo encola el registro; un hilo nativo lo escribe como una
+    línea JSON en el segmento activo y hace fsync por lotes (a lo sumo uno
+    cada `fsync_interval` segundos), así que ante una caída del proceso se
+    pierde como mucho lo encolado en ese intervalo.
+
+    Cada proceso escribe su propio segmento (spool-<ns>-<pid>.jsonl) con un
+    flock exclusivo. Un segmento sin lock está cerrado (rotado, o su proceso
+    terminó) y cualquier worker puede reproducirlo: lo bloquea, entrega los
+    registros en orden a `handler` en lotes de `batch_size` y guarda el
+    avance en <segmento>.done tras cada lote; al terminar borra ambos. Si
+    `handler` lanza excepción (BD aún caída) el avance queda donde estaba y
+    se reintenta en `replay_interval` segundos. Un lote puede repetirse si el
+    proceso cae entre el commit y el checkpoint: `handler` debe ser
+    idempotente.
+
+    `handler(records)` retorna (insertados, rechazados): cuántos registros
+    entraron realmente a la BD y la lista de los que la BD rechazó. Los
+    rechazados se anexan a quarantine.jsonl en el mismo directorio (no se
+    reproducen) para revisarlos a mano; el resto cuenta como duplicado.
+    """
+
+    def __init__(self, directory, handler, fsync_interval=0.05, replay_interval=5.0, batch_size=200,
+                 segment_bytes=16 * 1024 * 1024, max_queue=100000):
+        self.directory = directory
+        self.handler = handler
+        self.fsync_interval = fsync_interval
+        self.replay_interval = replay_interval
+        self.batch_size = batch_size
+        self.segment_bytes = segment_bytes
+        self.max_queue = max_queue
+
+        self._pending = deque()
+        self._wake = _threading.Event()
+        self._idle = False
+        self._closing = False
+        self._rotate = False
+        self._file = None
+        self._path = None
+        self._writer = None
+        self._replayer = None
+        self._stop = threading.Event()
+        self._line_counts = {}
+
+        self.appended = 0
+        self.written = 0
+        self.dropped = 0
+        self.fsyncs = 0
+        self.replayed = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.replay_errors = 0
+        self.replay_latency = Histogram(REPLAY_BATCH_BUCKETS)
+
+    # --- escritura --------------------------------------------------------------
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self._writer is None:
+            self._writer = _threading.Thread(target=self._write_loop, name="offline-spool", daemon=True)
+            self._writer.start()
+        if self._replayer is None:
+            # Hilo normal (greenthread con eventlet): el handler usa el pool de MySQL
+            self._replayer = threading.Thread(target=self._replay_loop, name="offline-spool-replay", daemon=True)
+            self._replayer.start()
+        return self
+
+    def append(self, record):
+        if len(self._pending) >= self.max_queue:
+            self.dropped += 1
+            log("SPOOL-ERROR", "Cola del spool llena, mensaje offline sin guardar")
+            return False
+        self._pending.append(record)
+        self.appended += 1
+        if self._idle:
+            self._idle = False
+            self._wake.set()
+        return True
+
+    def rotate(self):
+        """Pide cerrar el segmento activo para que se pueda reproducir"""
+        if self._file is not None:
+            self._rotate = True
+            self._wake.set()
+
+    def _open_segment(self):
+        name = f"{PREFIX}{time.time_ns()}-{os.getpid()}{SUFFIX}"
+        temp = os.path.join(self.directory, "." + name)
+        # Se bloquea antes de darle su nombre final: un replayer nunca ve el segmento sin lock
+        handle = open(temp, "ab")
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        self._path = os.path.join(self.directory, name)
+        os.rename(temp, self._path)
+        self._file = handle
+
+    def _close_segment(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._path = None
+        self._rotate = False
+
+    def _write_loop(self):
+        pending = self._pending
+        last_fsync = 0.0
+        while True:
+            if self._rotate and not pending:
+                self._close_segment()
+            if not pending:
+                if self._closing:
+                    self._close_segment()
+                    return
+                self._idle = True
+                if not pending and not self._rotate:
+                    self._wake.wait(1.0)
+                self._wake.clear()
+                self._idle = False
+                continue
+
+            # Agrupar lo que llegue hasta el próximo fsync permitido
+            wait = last_fsync + self.fsync_interval - time.monotonic()
+            if wait > 0 and not self._closing:
+                _time.sleep(wait)
+
+            records = []
+            while pending:
+                records.append(pending.popleft())
+            data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records).encode("utf-8")
+            try:
+                if self._file is None:
+                    self._open_segment()
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError as e:
+                self.dropped += len(records)
+                log("SPOOL-ERROR", f"No se pudo escribir el spool: {e}")
+                self._close_segment()
+                continue
+            last_fsync = time.monotonic()
+            self.fsyncs += 1
+            self.written += len(records)
+            if self._file.tell() >= self.segment_bytes:
+                self._close_segment()
+
+    # --- replay -----------------------------------------------------------------
+
+    def segments(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(os.path.join(self.directory, name) for name in names if name.startswith(PREFIX) and name.endswith(SUFFIX))
+
+    def _replay_loop(self):
+        while not self._stop.wait(self.replay_interval):
+            self.replay()
+
+    def replay(self):
+        """Reproduce los segmentos cerrados; retorna cuántos registros se insertaron"""
+        total = self._replay_closed()
+        # El segmento activo se cierra solo cuando lo anterior ya entró a la BD:
+        # mientras siga caída se sigue escribiendo en el mismo archivo
+        if total is not None and self._file is not None:
+            self.rotate()
+            deadline = time.monotonic() + 1.0
+            while self._file is not None and time.monotonic() < deadline:
+                time.sleep(0.01)
+            more = self._replay_closed()
+            total = total + more if more is not None else total
+        if total:
+            log("SPOOL", f"{total} mensajes offline guardados en BD", depth=self.depth())
+        return total or 0
+
+    def _replay_closed(self):
+        """Reproduce los segmentos sin lock; None si la BD falló"""
+        total = 0
+        for path in self.segments():
+            if path == self._path:
+                continue
+            try:
+                replayed = self._replay_segment(path)
+            except Exception as e:
+                self.replay_errors += 1
+                log("SPOOL-ERROR", f"Replay pendiente ({os.path.basename(path)}): {e}")
+                return None
+            total += replayed or 0
+        return total
+
+    def _replay_segment(self, path):
+        try:
+            handle = open(path, "rb")
+        except FileNotFoundError:
+            return None
+        with handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # Segmento activo de otro proceso o en replay en otro worker
+                return None
+            if not os.path.exists(path):
+                # Otro worker lo terminó mientras se abría
+                return None
+
+            offset, lines = self._read_checkpoint(path)
+            handle.seek(offset)
+            replayed = 0
+            while True:
+                batch, size = [], 0
+                while len(batch) < self.batch_size:
+                    raw = handle.readline()
+                    if not raw:
+                        break
+                    size += len(raw)
+                    batch.append(raw)
+                if not batch:
+                    break
+
+                records, quarantined = [], []
+                for raw in batch:
+                    try:
+                        records.append(json.loads(raw))
+                    except ValueError:
+                        # Línea cortada por una caída a mitad de la escritura
+                        quarantined.append({"linea": raw.decode("utf-8", "replace"), "motivo": "línea dañada"})
+                inserted, rejected = 0, []
+                if records:
+                    started = time.perf_counter()
+                    inserted, rejected = self.handler(records)
+                    self.replay_latency.observe(time.perf_counter() - started)
+                quarantined.extend(rejected)
+                if quarantined:
+                    self._quarantine(quarantined)
+                self.rejected += len(quarantined)
+                self.duplicates += len(records) - inserted - len(rejected)
+                self.replayed += inserted
+                replayed += inserted
+
+                offset += size
+                lines += len(batch)
+                self._write_checkpoint(path, offset, lines)
+
+            os.remove(path)
+            try:
+                os.remove(path + CHECKPOINT)
+            except FileNotFoundError:
+                pass
+            self._line_counts.pop(path, None)
+            return replayed
+
+    def _quarantine(self, records):
+        """Anexa los registros rechazados a quarantine.jsonl antes de avanzar el checkpoint"""
+        data = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records).encode("utf-8")
+        with open(os.path.join(self.directory, QUARANTINE), "ab") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        log("SPOOL-ERROR", f"{len(records)} mensajes offline en cuarentena", path=os.path.join(self.directory, QUARANTINE))
+
+    @staticmethod
+    def _read_checkpoint(path):
+        try:
+            with open(path + CHECKPOINT, encoding="ascii") as f:
+                offset, lines = f.read().split()
+                return int(offset), int(lines)
+        except (FileNotFoundError, ValueError):
+            return 0, 0
+
+    @staticmethod
+    def _write_checkpoint(path, offset, lines):
+        temp = path + CHECKPOINT + ".tmp"
+        with open(temp, "w", encoding="ascii") as f:
+            f.write(f"{offset} {lines}")
+        os.replace(temp, path + CHECKPOINT)
+
+    # --- estado -----------------------------------------------------------------
+
+    def depth(self):
+        """Mensajes en el spool sin reproducir (en disco y en cola)"""
+        total = len(self._pending)
+        seen = set()
+        for path in self.segments():
+            seen.add(path)
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            # Conteo de líneas incremental: solo se lee lo agregado desde la última vez
+            counted_size, counted = self._line_counts.get(path, (0, 0))
+            if size > counted_size:
+                try:
+                    with open(path, "rb") as f:
+                        f.seek(counted_size)
+                        counted += f.read(size - counted_size).count(b"\n")
+                except FileNotFoundError:
+                    continue
+                self._line_counts[path] = (size, counted)
+            total += max(0, counted - self._read_checkpoint(path)[1])
+        for path in set(self._line_counts) - seen:
+            del self._line_counts[path]
+        return total
+
+    def stop(self, timeout=5.0):
+        """Escribe lo encolado y detiene el escritor y el replayer"""
+        self._stop.set()
+        self._closing = True
+        self._wake.set()
+        if self._writer is not None:
+            self._writer.join(timeout)
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "depth": self.depth(),
+            "queue_depth": len(self._pending),
+            "segments": len(self.segments()),
+            "appended": self.appended,
+            "written": self.written,
+            "dropped": self.dropped,
+            "fsyncs": self.fsyncs,
+            "replayed": self.replayed,
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "replay_errors": self.replay_errors,
+            "replay_batch_seconds": self.replay_latency.snapshot(),
+        }
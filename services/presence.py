@@ -0,0 +1,109 @@
+import sys
+import threading
+
+
+class Session:
+    """Una conexión Socket.IO: su usuario y las rooms a las que se unió"""
+
+    __slots__ = ("sid", "user_id", "rooms")
+
+    def __init__(self, sid, user_id):
+        self.sid = sid
+        self.user_id = user_id
+        self.rooms = set()
+
+
+class PresenceRegistry:
+    """
+    Conexiones activas de este proceso indexadas por sid y por usuario.
+
+    Un usuario puede tener varias conexiones a la vez (varios dispositivos);
+    cada una es una Session. Conectar, desconectar y consultar son O(1).
+
+    Para ahorrar memoria con decenas de miles de conexiones, el índice por
+    usuario guarda el sid suelto mientras haya uno solo (el caso común) y los
+    nombres de room se internan para que todas las sesiones compartan el mismo
+    string.
+    """
+
+    def __init__(self):
+        self._by_sid = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def connect(self, sid, user_id):
+        """Registra la conexión; retorna True si es la primera del usuario"""
+        session = Session(sid, user_id)
+        with self._lock:
+            previous = self._by_sid.get(sid)
+            if previous is not None:
+                self._remove(previous)
+            self._by_sid[sid] = session
+
+            current = self._by_user.get(user_id)
+            if current is None:
+                self._by_user[user_id] = sid
+                return True
+            if isinstance(current, set):
+                current.add(sid)
+            else:
+                self._by_user[user_id] = {current, sid}
+            return False
+
+    def disconnect(self, sid):
+        """Retorna (session, última) o (None, False) si el sid no estaba registrado"""
+        with self._lock:
+            session = self._by_sid.get(sid)
+            if session is None:
+                return None, False
+            return session, self._remove(session)
+
+    def _remove(self, session):
+        del self._by_sid[session.sid]
+        current = self._by_user.get(session.user_id)
+        if current is None:
+            return False
+        if isinstance(current, set):
+            current.discard(session.sid)
+            if len(current) == 1:
+                self._by_user[session.user_id] = next(iter(current))
+            return False
+        if current != session.sid:
+            return False
+        del self._by_user[session.user_id]
+        return True
+
+    def join(self, sid, room):
+        session = self._by_sid.get(sid)
+        if session is not None:
+            session.rooms.add(sys.intern(room))
+
+    def leave(self, sid, room):
+        session = self._by_sid.get(sid)
+        if session is not None:
+            session.rooms.discard(room)
+
+    def get(self, sid):
+        return self._by_sid.get(sid)
+
+    def user_sids(self, user_id):
+        with self._lock:
+            current = self._by_user.get(user_id)
+        if current is None:
+            return set()
+        return set(current) if isinstance(current, set) else {current}
+
+    def is_online(self, user_id):
+        return user_id in self._by_user
+
+    def user_count(self):
+        return len(self._by_user)
+
+    def __len__(self):
+        return len(self._by_sid)
+
+    def stats(self):
+        return {
+            "connections": len(self._by_sid),
+            "users": len(self._by_user),
+        }
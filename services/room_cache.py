@@ -0,0 +1,75 @@
+from .cache import TTLCache
+
+
+class RoomRegistry:
+    """
+    Registro en memoria de la metadata de `salas_chat`.
+
+    Indexa cada sala por `sala_uuid`, por par de usuarios (salas directas) y
+    por `grupo_id` (salas grupales). Las salas casi nunca cambian, así que el
+    camino de envío puede resolverlas sin consultar la BD.
+
+    Aparte guarda las salas de fallback (id=0, uuid determinístico) creadas
+    con la BD caída, para saber a qué par de usuarios o grupo corresponde
+    cada una al guardar después sus mensajes offline.
+    """
+
+    def __init__(self, maxsize=10000, ttl=600):
+        self._by_uuid = TTLCache(maxsize, ttl)
+        self._by_pair = TTLCache(maxsize, ttl)
+        self._by_group = TTLCache(maxsize, ttl)
+        # El uuid de fallback sale de los IDs: la entrada nunca queda vieja
+        self._fallback = TTLCache(maxsize, 0)
+
+    @staticmethod
+    def _pair_key(user_a_id, user_b_id):
+        a, b = int(user_a_id), int(user_b_id)
+        return (a, b) if a <= b else (b, a)
+
+    def get_by_uuid(self, sala_uuid):
+        return self._by_uuid.get(str(sala_uuid))
+
+    def get_direct(self, user_a_id, user_b_id):
+        return self._by_pair.get(self._pair_key(user_a_id, user_b_id))
+
+    def get_group(self, group_id):
+        return self._by_group.get(int(group_id))
+
+    def add(self, sala):
+        """Registra una sala con id, sala_uuid, tipo_sala, usuario_a_id, usuario_b_id y grupo_id"""
+        if not sala or not sala.get("id"):
+            # Las salas de fallback (id=0) no existen en BD: no se cachean
+            return
+
+        self._by_uuid.set(str(sala["sala_uuid"]), sala)
+        if sala.get("tipo_sala") == "directo" and sala.get("usuario_a_id") and sala.get("usuario_b_id"):
+            self._by_pair.set(self._pair_key(sala["usuario_a_id"], sala["usuario_b_id"]), sala)
+        elif sala.get("tipo_sala") == "grupal" and sala.get("grupo_id"):
+            self._by_group.set(int(sala["grupo_id"]), sala)
+
+    def add_fallback(self, sala):
+        self._fallback.set(str(sala["sala_uuid"]), sala)
+
+    def get_fallback(self, sala_uuid):
+        return self._fallback.peek(str(sala_uuid))
+
+    def invalidate(self, sala_uuid):
+        sala = self._by_uuid.pop(str(sala_uuid))
+        if not sala:
+            return
+        if sala.get("usuario_a_id") and sala.get("usuario_b_id"):
+            self._by_pair.pop(self._pair_key(sala["usuario_a_id"], sala["usuario_b_id"]))
+        if sala.get("grupo_id"):
+            self._by_group.pop(int(sala["grupo_id"]))
+
+    def clear(self):
+        self._by_uuid.clear()
+        self._by_pair.clear()
+        self._by_group.clear()
+
+    def stats(self):
+        return {
+            "by_uuid": self._by_uuid.stats(),
+            "by_pair": self._by_pair.stats(),
+            "by_group": self._by_group.stats(),
+        }
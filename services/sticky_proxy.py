@@ -0,0 +1,140 @@
+import socket
+import threading
+import zlib
+from urllib.parse import parse_qs, urlsplit
+
+from .event_log import log
+
+# Tope de la cabecera HTTP que se lee antes de elegir worker
+MAX_HEAD_BYTES = 16 * 1024
+
+
+def affinity_key(head, client_ip):
+    """
+    Clave de afinidad de una petición: user_id de la query (la repiten todas
+    las peticiones de un cliente Socket.IO, incluido el handshake), si no el
+    sid de Engine.IO y, en último caso, la IP del cliente.
+    """
+    request_line = head.split(b"\r\n", 1)[0].decode("latin-1")
+    parts = request_line.split(" ")
+    if len(parts) >= 2:
+        query = parse_qs(urlsplit(parts[1]).query)
+        for name in ("user_id", "sid"):
+            if query.get(name):
+                return f"{name}:{query[name][0]}"
+    return f"ip:{client_ip}"
+
+
+class StickyProxy:
+    """
+    Proxy TCP con afinidad para repartir clientes entre workers.
+
+    Lee la primera cabecera HTTP de cada conexión, elige el worker con
+    crc32(clave) % N y desde ahí copia bytes en ambos sentidos, así que sirve
+    igual para long-polling y para WebSocket. Con la misma clave, todas las
+    peticiones de un cliente llegan al mismo worker. Se asume una conexión TCP
+    por cliente: un proxy delante que reutilice conexiones entre usuarios
+    rompería la afinidad.
+    """
+
+    def __init__(self, host, port, backends):
+        if not backends:
+            raise ValueError("Se requiere al menos un worker")
+        self.host = host
+        self.port = port
+        self.backends = list(backends)
+        self._server = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self.active = 0
+        self.routed = [0] * len(self.backends)
+        self.errors = 0
+
+    def pick(self, key):
+        return zlib.crc32(key.encode()) % len(self.backends)
+
+    def serve_forever(self):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((self.host, self.port))
+        self._server.listen(1024)
+        self.port = self._server.getsockname()[1]
+        self._ready.set()
+
+        while True:
+            try:
+                client, address = self._server.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle, args=(client, address[0]), daemon=True).start()
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="sticky-proxy", daemon=True)
+        thread.start()
+        self._ready.wait(5)
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+
+    def _handle(self, client, client_ip):
+        upstream = None
+        try:
+            head = b""
+            while b"\r\n\r\n" not in head and len(head) < MAX_HEAD_BYTES:
+                chunk = client.recv(4096)
+                if not chunk:
+                    return
+                head += chunk
+
+            index = self.pick(affinity_key(head, client_ip))
+            upstream = socket.create_connection(self.backends[index], timeout=5)
+            upstream.settimeout(None)
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            upstream.sendall(head)
+
+            with self._lock:
+                self.active += 1
+                self.routed[index] += 1
+            try:
+                reverse = threading.Thread(target=self._pipe, args=(upstream, client), daemon=True)
+                reverse.start()
+                self._pipe(client, upstream)
+                reverse.join()
+            finally:
+                with self._lock:
+                    self.active -= 1
+        except OSError as e:
+            self.errors += 1
+            log("PROXY-ERROR", f"{client_ip}: {e}")
+        finally:
+            client.close()
+            if upstream is not None:
+                upstream.close()
+
+    @staticmethod
+    def _pipe(source, target):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                target.sendall(data)
+        except OSError:
+            pass
+        finally:
+            # Propagar el cierre para que el otro sentido también termine
+            try:
+                target.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            "backends": [f"{host}:{port}" for host, port in self.backends],
+            "active": self.active,
+            "routed": list(self.routed),
+            "errors": self.errors,
+        }
@@ -0,0 +1,231 @@
+import atexit
+import gzip
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from eventlet.patcher import original
+
+# Hilo nativo: comprimir y escribir el archivo no debe ocupar el hub de eventlet
+_threading = original("threading")
+
+FORMAT = "upred-traffic"
+VERSION = 1
+
+# Campos con identificadores: se reemplazan por tokens secuenciales por tipo
+# (u = usuario, g = grupo, r = sala, m = mensaje); "to" depende de "type"
+ID_KINDS = {
+    "user_id": "u",
+    "sender_id": "u",
+    "other_user_id": "u",
+    "other_user_ids": "u",
+    "recipient_id": "u",
+    "group_id": "g",
+    "group_ids": "g",
+    "sala_uuid": "r",
+    "mensaje_id": "m",
+    "mensaje_ids": "m",
+    "before_id": "m",
+    "after_id": "m",
+}
+
+# Campos sin datos personales que se guardan tal cual (tipos y límites)
+PASSTHROUGH_KEYS = {"type", "message_type", "chat_type", "limit", "chunk_size", "stream", "rejoin"}
+
+# Tokens recordados por tipo; al pasar el límite se olvidan los más viejos
+MAX_TOKENS = 100000
+
+
+def id_kind(key, payload):
+    if key == "to":
+        return "g" if payload.get("type") == "grupal" else "u"
+    return ID_KINDS.get(key)
+
+
+class TrafficRecorder:
+    """
+    Graba los eventos Socket.IO entrantes en un archivo JSON Lines de solo
+    anexado (comprimido si termina en .gz) para reproducirlos después con
+    benchmarks.replay_traffic.
+
+    Cada línea guarda el instante relativo al inicio de la grabación ("t"),
+    un token por conexión ("c"), el evento ("e"), la forma del payload ("p")
+    y la duración del handler en ms ("d"). De los payloads solo queda la
+    forma: los identificadores se cambian por tokens (u1, g1, r1, m1) y los
+    textos por su longitud ({"s": 42}); los valores reales nunca se escriben.
+    Las respuestas que crean identificadores (sala de un join, mensaje_id del
+    ack) se anotan con note() como líneas "o" para que el replay pueda
+    traducir los tokens a los valores del entorno donde se reproduce.
+
+    record() y note() solo agregan a una cola acotada; un hilo nativo asigna
+    los tokens, serializa y escribe en lotes. Con la cola llena el evento se
+    descarta y se cuenta en `dropped`.
+    """
+
+    def __init__(self, path, max_queue=100000):
+        self.path = path
+        self.max_queue = max_queue
+        self.origin = time.perf_counter()
+        self._pending = deque()
+        self._wake = _threading.Event()
+        self._idle = False
+        self._closing = False
+        self._tokens = {kind: OrderedDict() for kind in ("u", "g", "r", "m", "c")}
+        self._counts = {kind: 0 for kind in self._tokens}
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self._file = None
+        self._thread = _threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, event, sid, payload, started, duration):
+        """Evento recibido por `sid`; started es time.perf_counter() al iniciar el handler"""
+        if isinstance(payload, dict):
+            payload = dict(payload)
+        self._enqueue(("e", event, sid, payload, started, duration))
+
+    def note(self, sid, event, **fields):
+        """Respuesta enviada a `sid` con identificadores nuevos (p. ej. sala_uuid, mensaje_id)"""
+        self._enqueue(("o", event, sid, fields, time.perf_counter(), None))
+
+    def _enqueue(self, item):
+        if len(self._pending) >= self.max_queue:
+            self.dropped += 1
+            return
+        self._pending.append(item)
+        self.recorded += 1
+        if self._idle:
+            self._idle = False
+            self._wake.set()
+
+    def token(self, kind, value):
+        if value is None or value == "":
+            return None
+        tokens = self._tokens[kind]
+        key = str(value)
+        token = tokens.get(key)
+        if token is None:
+            self._counts[kind] += 1
+            token = tokens[key] = f"{kind}{self._counts[kind]}"
+            if len(tokens) > MAX_TOKENS:
+                tokens.popitem(last=False)
+        return token
+
+    def shape(self, value, key=None, parent=None):
+        """Forma anónima de un valor del payload"""
+        kind = id_kind(key, parent) if key is not None else None
+        if kind is not None:
+            if isinstance(value, list):
+                return [self.token(kind, item) for item in value]
+            return self.token(kind, value)
+        if key in PASSTHROUGH_KEYS and isinstance(value, (str, int, float, bool)) and len(str(value)) <= 20:
+            return value
+        if isinstance(value, dict):
+            return {name: self.shape(item, name, value) for name, item in value.items()}
+        if isinstance(value, list):
+            return [self.shape(item) for item in value]
+        if isinstance(value, str):
+            return {"s": len(value)}
+        if isinstance(value, bool) or value is None:
+            return value
+        return {"n": 0}
+
+    def _line(self, item):
+        kind, event, sid, payload, started, duration = item
+        data = {"t": round(started - self.origin, 4), "c": self.token("c", sid), kind: event}
+        if payload not in (None, {}):
+            data["p"] = self.shape(payload)
+        if duration is not None:
+            data["d"] = round(duration * 1000, 3)
+        if kind == "e" and event == "disconnect":
+            # El sid no se reutiliza: liberar su token
+            self._tokens["c"].pop(str(sid), None)
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        opener = gzip.open if self.path.endswith(".gz") else open
+        self._file = opener(self.path, "at", encoding="utf-8")
+        # Un encabezado por sesión: los "t" siguientes son relativos a esta
+        header = {"format": FORMAT, "v": VERSION, "started": datetime.now(timezone.utc).isoformat(timespec="seconds"), "pid": os.getpid()}
+        self._file.write(json.dumps(header, separators=(",", ":")) + "\n")
+
+    def _run(self):
+        pending = self._pending
+        while True:
+            if not pending:
+                if self._closing:
+                    if self._file is not None:
+                        self._file.close()
+                    return
+                self._idle = True
+                if not pending:
+                    self._wake.wait(1.0)
+                self._wake.clear()
+                self._idle = False
+                continue
+
+            lines = []
+            while pending and len(lines) < 1024:
+                lines.append(self._line(pending.popleft()))
+            try:
+                if self._file is None:
+                    self._open()
+                self._file.write("\n".join(lines) + "\n")
+                self._file.flush()
+            except (OSError, ValueError):
+                self.dropped += len(lines)
+                continue
+            self.written += len(lines)
+
+    def close(self, timeout=5.0):
+        """Escribe lo pendiente y cierra el archivo"""
+        self._closing = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+def read_recording(path):
+    """
+    Itera las líneas de una grabación (texto o .gz). Los "t" de cada sesión
+    se desplazan para continuar después de la sesión anterior.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    offset = 0.0
+    last = 0.0
+    with opener(path, "rt", encoding="utf-8") as f:
+        while True:
+            try:
+                line = f.readline()
+            except EOFError:
+                # Proceso terminado sin cerrar el .gz: cada lote se escribió con
+                # flush, así que lo leído hasta aquí está completo
+                return
+            if not line:
+                return
+            try:
+                data = json.loads(line)
+            except ValueError:
+                # Línea vacía o cortada si el proceso terminó a mitad de una escritura
+                continue
+            if data.get("format") == FORMAT:
+                offset = last
+                continue
+            data["t"] = data.get("t", 0.0) + offset
+            last = max(last, data["t"])
+            yield data